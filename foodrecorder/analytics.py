@@ -0,0 +1,267 @@
+#analytics.py
+import argparse
+import itertools
+import time
+from datetime import date, timedelta
+from typing import Dict, NamedTuple, Optional
+import numpy as np
+from sqlalchemy import Integer, cast, func, select
+import models
+from charts import IDEAL_PFC_RATIO
+
+# 日付は1970-01-01からの日数（int32）で持つ
+EPOCH = date(1970, 1, 1)
+
+# たんぱく質・脂質・炭水化物1gあたりのエネルギー(kcal)
+ENERGY_PER_GRAM = np.array([4.0, 9.0, 4.0])
+
+IDEAL_RATIOS = np.array(IDEAL_PFC_RATIO)
+
+# (ユーザー数 × 日数) がこの倍数 × 記録数以下なら、並べ替えずに配列の添字で日ごとにまとめる
+DENSE_GROUP_FACTOR = 2
+
+
+# 食事記録を列ごとのNumPy配列で持つ（1件あたり24バイト。ORMのオブジェクトを作らない）
+class FoodRecordColumns(NamedTuple):
+    user_id: np.ndarray       # int32
+    day: np.ndarray           # int32（1970-01-01からの日数）
+    energy: np.ndarray        # float32（栄養素がない記録は0）
+    protein: np.ndarray
+    fat: np.ndarray
+    carbohydrate: np.ndarray
+
+    @property
+    def size(self) -> int:
+        return len(self.user_id)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(column.nbytes for column in self)
+
+
+# ユーザーごと・日付ごとの合計とPFC比率（ユーザー、日付の順に並ぶ）
+# 比率は栄養素のエネルギーが0の日はnan。balance_gapは理想のPFC比率との差（エネルギーのうち、理想と比べて
+# 多すぎる栄養素の分の割合。0なら理想どおり、最大1）
+class DailyAnalytics(NamedTuple):
+    user_id: np.ndarray
+    day: np.ndarray
+    record_count: np.ndarray
+    energy: np.ndarray
+    protein: np.ndarray
+    fat: np.ndarray
+    carbohydrate: np.ndarray
+    protein_ratio: np.ndarray
+    fat_ratio: np.ndarray
+    carbohydrate_ratio: np.ndarray
+    balance_gap: np.ndarray
+
+    def dates(self) -> np.ndarray:
+        return np.datetime64(EPOCH, "D") + self.day
+
+
+# ユーザーごとの集計と順位（balance_gapの日ごとの平均が小さい順に1から。栄養素のある日がなければ0）
+class UserRanking(NamedTuple):
+    user_id: np.ndarray
+    days: np.ndarray              # 記録のある日数
+    balanced_days: np.ndarray     # そのうち栄養素のある日数
+    mean_energy: np.ndarray       # 記録のある日の1日あたりのエネルギー
+    protein_ratio: np.ndarray     # 期間全体のPFC比率
+    fat_ratio: np.ndarray
+    carbohydrate_ratio: np.ndarray
+    mean_balance_gap: np.ndarray
+    rank: np.ndarray
+
+
+# 日付を1970-01-01からの日数にするSQL式
+def epoch_day_expression(column, dialect_name: str):
+    if dialect_name == "postgresql":
+        return cast(func.extract("epoch", column) / 86400, Integer)
+    return cast(func.julianday(column) - 2440587.5, Integer)
+
+
+def to_epoch_day(day: date) -> int:
+    return (day - EPOCH).days
+
+
+def from_epoch_day(day) -> date:
+    return EPOCH + timedelta(days=int(day))
+
+
+# 期間内（省略時はすべて）の食事記録を、chunk_size行ずつ読んで列ごとの配列にする
+def load_food_record_columns(connection, start: date = None, end: date = None,
+                             chunk_size: int = 100_000) -> FoodRecordColumns:
+    record = models.FoodRecord
+    statement = select(
+        record.user_id,
+        epoch_day_expression(record.date, connection.dialect.name),
+        *(func.coalesce(getattr(record, column), 0) for column in models.NUTRIENT_COLUMNS),
+    )
+    if start is not None:
+        statement = statement.where(record.date >= start)
+    if end is not None:
+        statement = statement.where(record.date <= end)
+
+    chunks = []
+    result = connection.execution_options(yield_per=chunk_size).execute(statement)
+    for partition in result.partitions():
+        # Rowから直接np.arrayを作るより、値を1列に並べてfromiterで読む方が速い
+        chunks.append(np.fromiter(itertools.chain.from_iterable(partition), np.float64, len(partition) * 6).reshape(-1, 6))
+    table = np.concatenate(chunks) if chunks else np.empty((0, 6))
+    return FoodRecordColumns(
+        table[:, 0].astype(np.int32), table[:, 1].astype(np.int32),
+        *(np.ascontiguousarray(table[:, index], dtype=np.float32) for index in range(2, 6)),
+    )
+
+
+# 記録ごとの (ユーザー, 日付) のまとまりの番号と、まとまりごとのユーザー・日付を返す
+def _group_records(user_id: np.ndarray, day: np.ndarray):
+    user_min, day_min = int(user_id.min()), int(day.min())
+    span = int(day.max()) - day_min + 1
+    keys = (user_id - user_min).astype(np.int64) * span + (day - day_min)
+    cells = (int(user_id.max()) - user_min + 1) * span
+    if cells <= DENSE_GROUP_FACTOR * len(keys):
+        # ユーザーと日付の組み合わせが少なければ、並べ替えずに数える
+        present = np.bincount(keys, minlength=cells) > 0
+        cell_keys = np.flatnonzero(present)
+        groups = (np.cumsum(present) - 1)[keys]
+    else:
+        cell_keys, groups = np.unique(keys, return_inverse=True)
+    return groups, (cell_keys // span + user_min).astype(np.int32), (cell_keys % span + day_min).astype(np.int32)
+
+
+# P・F・Cの量(g)の配列から、エネルギー比の配列（3行）を求める（エネルギーが0の列はnan）
+def pfc_ratio_arrays(protein, fat, carbohydrate) -> np.ndarray:
+    energies = np.stack([np.asarray(protein, dtype=np.float64), np.asarray(fat, dtype=np.float64),
+                         np.asarray(carbohydrate, dtype=np.float64)]) * ENERGY_PER_GRAM[:, None]
+    totals = energies.sum(axis=0)
+    ratios = np.full(energies.shape, np.nan)
+    np.divide(energies, totals, out=ratios, where=totals > 0)
+    return ratios
+
+
+# 理想のPFC比率との差（比率の差の絶対値の合計の半分。nanの列はnan）
+def balance_gaps(ratios: np.ndarray) -> np.ndarray:
+    return np.abs(ratios - IDEAL_RATIOS[:, None]).sum(axis=0) / 2
+
+
+# すべてのユーザー・日付の合計、PFC比率、理想との差をまとめて求める
+def daily_analytics(columns: FoodRecordColumns) -> DailyAnalytics:
+    if columns.size == 0:
+        empty_ints, empty_floats = np.empty(0, np.int32), np.empty(0)
+        return DailyAnalytics(empty_ints, empty_ints, np.empty(0, np.int64), *([empty_floats] * 8))
+
+    groups, user_ids, days = _group_records(columns.user_id, columns.day)
+    group_count = len(user_ids)
+    record_count = np.bincount(groups, minlength=group_count)
+    energy, protein, fat, carbohydrate = (
+        np.bincount(groups, weights=getattr(columns, column), minlength=group_count)
+        for column in models.NUTRIENT_COLUMNS
+    )
+    ratios = pfc_ratio_arrays(protein, fat, carbohydrate)
+    return DailyAnalytics(user_ids, days, record_count, energy, protein, fat, carbohydrate, *ratios,
+                          balance_gaps(ratios))
+
+
+# ユーザーごとに期間全体のPFC比率と、理想との差の日ごとの平均を求め、差の小さい順に順位を付ける
+def rank_users(daily: DailyAnalytics) -> UserRanking:
+    user_ids, index = np.unique(daily.user_id, return_inverse=True)
+    count = len(user_ids)
+    days = np.bincount(index, minlength=count)
+    balanced = ~np.isnan(daily.balance_gap)
+    balanced_days = np.bincount(index[balanced], minlength=count)
+    gap_sums = np.bincount(index[balanced], weights=daily.balance_gap[balanced], minlength=count)
+    mean_gap = np.full(count, np.nan)
+    np.divide(gap_sums, balanced_days, out=mean_gap, where=balanced_days > 0)
+    mean_energy = np.bincount(index, weights=daily.energy, minlength=count) / np.maximum(days, 1)
+    ratios = pfc_ratio_arrays(*(np.bincount(index, weights=getattr(daily, column), minlength=count)
+                                for column in ("protein", "fat", "carbohydrate")))
+
+    # nanは並べ替えると最後になるので、先頭からbalanced_daysのあるユーザーの数だけ順位を付ける
+    order = np.lexsort((user_ids, mean_gap))
+    rank = np.zeros(count, dtype=np.int64)
+    ranked = order[:int(np.count_nonzero(balanced_days))]
+    rank[ranked] = np.arange(1, len(ranked) + 1)
+    return UserRanking(user_ids, days, balanced_days, mean_energy, *ratios, mean_gap, rank)
+
+
+def _float(value) -> Optional[float]:
+    return None if np.isnan(value) else round(float(value), 4)
+
+
+def _ranking_rows(ranking: UserRanking, positions, usernames: Dict[int, str]):
+    return [
+        {
+            "rank": int(ranking.rank[position]),
+            "user_id": int(ranking.user_id[position]),
+            "username": usernames.get(int(ranking.user_id[position])),
+            "days": int(ranking.days[position]),
+            "mean_energy": round(float(ranking.mean_energy[position]), 1),
+            "protein_ratio": _float(ranking.protein_ratio[position]),
+            "fat_ratio": _float(ranking.fat_ratio[position]),
+            "carbohydrate_ratio": _float(ranking.carbohydrate_ratio[position]),
+            "mean_balance_gap": _float(ranking.mean_balance_gap[position]),
+        }
+        for position in positions
+    ]
+
+
+# 毎晩のレポート：dayまでのdays日間の食事記録を集計し、全体のPFC比率と、理想に近い・遠いユーザーtop人ずつを返す
+def nightly_report(connection, day: date = None, days: int = 7, top: int = 10) -> dict:
+    day = day or date.today() - timedelta(days=1)
+    start = day - timedelta(days=days - 1)
+
+    started = time.perf_counter()
+    columns = load_food_record_columns(connection, start, day)
+    loaded = time.perf_counter()
+    daily = daily_analytics(columns)
+    ranking = rank_users(daily)
+    analyzed = time.perf_counter()
+
+    by_rank = np.argsort(np.where(ranking.rank > 0, ranking.rank, len(ranking.rank) + 1))
+    ranked = by_rank[:int(np.count_nonzero(ranking.rank))]
+    best, worst = ranked[:top], ranked[::-1][:top]
+    shown = {int(ranking.user_id[position]) for position in np.concatenate([best, worst])}
+    usernames = dict(connection.execute(
+        select(models.User.id, models.User.username).where(models.User.id.in_(shown))
+    ).all()) if shown else {}
+
+    overall = pfc_ratio_arrays([daily.protein.sum()], [daily.fat.sum()], [daily.carbohydrate.sum()])[:, 0]
+    balanced = ~np.isnan(daily.balance_gap)
+    return {
+        "start": start.isoformat(),
+        "end": day.isoformat(),
+        "food_records": columns.size,
+        "users": len(ranking.user_id),
+        "user_days": len(daily.user_id),
+        "user_days_without_nutrients": int(np.count_nonzero(~balanced)),
+        "mean_energy_per_user_day": round(float(daily.energy.mean()), 1) if len(daily.energy) else None,
+        "pfc_ratio": dict(zip(("protein", "fat", "carbohydrate"), map(_float, overall))),
+        "ideal_pfc_ratio": dict(zip(("protein", "fat", "carbohydrate"), IDEAL_PFC_RATIO)),
+        "mean_balance_gap": _float(daily.balance_gap[balanced].mean()) if balanced.any() else None,
+        "most_balanced": _ranking_rows(ranking, best, usernames),
+        "least_balanced": _ranking_rows(ranking, worst, usernames),
+        "seconds": {"load": loaded - started, "analyze": analyzed - loaded},
+    }
+
+
+# python analytics.py --date 2023-06-08 --days 7 --output report.json のように実行する
+# （cronなどで毎晩実行すると、前日までの1週間のレポートが作られる）
+if __name__ == "__main__":
+    import json
+    import migrations
+    from database import engine
+
+    parser = argparse.ArgumentParser(description="FoodRecorderの食事記録の集計レポート")
+    parser.add_argument("--date", type=date.fromisoformat, default=None, help="集計する最後の日（省略時は昨日）")
+    parser.add_argument("--days", type=int, default=7, help="集計する日数")
+    parser.add_argument("--top", type=int, default=10, help="表示するユーザーの数")
+    parser.add_argument("--output", help="レポートを保存するJSONファイル")
+    args = parser.parse_args()
+
+    migrations.init_db(engine)
+    with engine.connect() as connection:
+        report = nightly_report(connection, args.date, args.days, args.top)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
@@ -1,22 +1,27 @@
 #app.py
 from datetime import datetime, date
-import re
 import streamlit as st
-from sqlalchemy.orm import sessionmaker
-import main, models, scraping
-from database import engine, session
+import charts, config, crud, migrations, models, ui
+from cache_generations import USERS, cache_generations
+from database import session_scope
+from enrichment import enrichment_queue
 
-Session = sessionmaker(bind=engine)
+# テーブルと列を最新の状態にし、取得中のまま残っている記録を再開する（プロセスごとに1回）
+@st.cache_resource
+def init_app():
+    migrations.init_db()
+    charts.warm()
+    enrichment_queue.resume_pending()
 
-# ユーザー一覧を取得
+init_app()
+
+# ユーザー一覧を取得（変更があるまではキャッシュから返す）
 def get_users():
-    with Session() as session:
-        users = session.query(models.User).all()
-        return [user.username for user in users]
+    return ui.get_usernames()
 
 # ユーザーの登録
 def register_user(username):
-    with Session() as session:
+    with session_scope() as session:
         # 既存のユーザー名の重複をチェック
         existing_user = session.query(models.User).filter(models.User.username == username).first()
         if existing_user:
@@ -26,11 +31,12 @@ def register_user(username):
         user = models.User(username=username)
         session.add(user)
         session.commit()
+        cache_generations.bump(USERS)
         return True  # 登録成功
 
 # ユーザーの変更
 def update_user(old_username, new_username):
-    with Session() as session:
+    with session_scope() as session:
         # 変更前のユーザーを取得
         user = session.query(models.User).filter(models.User.username == old_username).first()
         if user:
@@ -41,20 +47,24 @@ def update_user(old_username, new_username):
 
             # ユーザー名を更新
             user.username = new_username
+            user_id = user.id
             session.commit()
+            cache_generations.bump(USERS, user_id)
             return True  
 
         return False  
 
 # ユーザーの削除
 def delete_user(username):
-    with Session() as session:
+    with session_scope() as session:
         # ユーザーを取得
         user = session.query(models.User).filter(models.User.username == username).first()
         if user:
             # ユーザーを削除
+            user_id = user.id
             session.delete(user)
             session.commit()
+            cache_generations.bump(USERS, user_id)
             return True  # 削除成功
 
         return False  # 削除失敗
@@ -132,55 +142,31 @@ elif page == "食事を記録する":
 
         if add_button:
             if recipe_name and servings and date:
-                # 料理名と人数に基づいて栄養素値を取得・保存
-                nutrient_values = scraping.get_nutrient_values(recipe_name, servings)
-
-                # 栄養素値をデータベースに保存
-                energy_value = float(re.findall(r"\d+", nutrient_values['エネルギー'])[0])
-                protein_value = float(re.findall(r"\d+", nutrient_values['たんぱく質'])[0])
-                fat_value = float(re.findall(r"\d+", nutrient_values['脂質'])[0])
-                carbohydrate_value = float(re.findall(r"\d+", nutrient_values['炭水化物'])[0])
-
-                # 食べた分の栄養素量を計算
-                energy_value *= servings
-                protein_value *= servings
-                fat_value *= servings
-                carbohydrate_value *= servings
-
-                # 指定されたユーザー名が存在するかどうかを確認
-                user = session.query(models.User).filter(models.User.username == selected_user).first()
-                if not user:
-                    st.error("指定されたユーザーが見つかりません。ユーザーを選択し直してください。")
-
-                # FoodRecordオブジェクトを作成して保存
-                food_record = models.FoodRecord(
-                    recipe_name=recipe_name,
-                    servings=servings,
-                    date=date,
-                    energy=energy_value,
-                    protein=protein_value,
-                    fat=fat_value,
-                    carbohydrate=carbohydrate_value,
-                    user_id=user.id 
-                )
-
-                session.add(food_record)  # 新しいレコードをセッションに追加
-                session.commit()  # セッションをコミット
-
-                st.success("食事を記録しました。")
-
-                # 保存した栄養素値の合計を取得
-                nutrient_summary = main.get_nutrient_summary(date.strftime("%Y-%m-%d"))
+                with session_scope() as session:
+                    # 指定されたユーザー名が存在するかどうかを確認
+                    user = session.query(models.User).filter(models.User.username == selected_user).first()
+                    if not user:
+                        st.error("指定されたユーザーが見つかりません。ユーザーを選択し直してください。")
+                        st.stop()
+
+                    # 栄養素を空にしてFoodRecordをすぐに保存し、栄養素はバックグラウンドで取得する
+                    food_record = crud.create_food_record_in_db(
+                        session, user, models.FoodRecordCreate(recipe_name=recipe_name, servings=servings), date
+                    )
+                    cache_generations.bump(user.id)
+                    enrichment_queue.submit(food_record.id)
+
+                st.success("食事を記録しました。栄養素は取得でき次第反映されます。")
 
                 # 本日の総カロリー量とPFC比のグラフを表示
-                main.display_summary(selected_user, date)
+                ui.display_summary(selected_user, date)
 
     elif page == '今日食べたもの':
         st.title("今日食べたもの")
 
         if selected_user:
             today = datetime.now().date()
-            main.display_daily_summary(selected_user, today)  # 選択されたユーザーの本日の食事記録を表示
+            ui.display_daily_summary(selected_user, today)  # 選択されたユーザーの本日の食事記録を表示
 
         else:
             st.info("今日の食事記録はありません。")
@@ -188,7 +174,7 @@ elif page == "食事を記録する":
     elif page == '栄養素の摂取目安':
         st.title("摂取量の目安")
         st.write("理想のPFC比")
-        main.display_ideal_pfc_ratio()
+        ui.display_ideal_pfc_ratio()
 
     elif page == '過去の記録':
         st.title("過去の記録")
@@ -199,4 +185,7 @@ elif page == "食事を記録する":
 
             # 選択された日付の食事記録を表示
             if selected_date:
-                main.display_daily_summary(selected_user, selected_date)
\ No newline at end of file
+                ui.display_daily_summary(selected_user, selected_date)
+
+if config.DEBUG_PANEL:
+    ui.display_debug_panel()
@@ -0,0 +1,108 @@
+#async_crud.py
+from datetime import date
+from typing import List
+from fastapi import HTTPException
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+import crud, models
+from metrics import metrics
+
+#Read
+# 一覧で返す列（ORMのオブジェクトを作らず、行のタプルのまま返す）
+USER_COLUMNS = (models.User.id, models.User.username)
+FOOD_RECORD_COLUMNS = (
+    models.FoodRecord.id, models.FoodRecord.date, models.FoodRecord.recipe_name, models.FoodRecord.servings,
+    models.FoodRecord.energy, models.FoodRecord.protein, models.FoodRecord.fat, models.FoodRecord.carbohydrate,
+    models.FoodRecord.status,
+)
+
+# idがafter_idより大きいユーザーをid順にlimit+1件取得（1件多く取って次のページの有無を調べる）
+@metrics.timed("crud_get_users_page")
+async def get_users_page(db: AsyncSession, after_id: int, limit: int):
+    result = await db.execute(
+        select(*USER_COLUMNS).where(models.User.id > after_id).order_by(models.User.id).limit(limit + 1)
+    )
+    return result.all()
+
+#Create
+async def check_existing_user(username: str, db: AsyncSession):
+    db_user = await db.scalar(select(models.User).where(models.User.username == username))
+    if db_user:
+        raise HTTPException(status_code=400, detail="Username already exists")
+
+# ユーザーを作成して保存
+@metrics.timed("crud_create_user")
+async def create_and_save_user(user: models.UserCreate, db: AsyncSession) -> models.User:
+    db_user = models.User(username=user.username)
+    db.add(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+    return db_user
+
+async def get_user_by_username(username: str, db: AsyncSession) -> models.User:
+    db_user = await db.scalar(select(models.User).where(models.User.username == username))
+    if not db_user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return db_user
+
+#Update
+@metrics.timed("crud_update_user")
+async def update_user_in_db(db_user: models.User, username: str, db: AsyncSession) -> models.User:
+    db_user.username = username
+    await db.commit()
+    await db.refresh(db_user)
+    return db_user
+
+#Delete
+@metrics.timed("crud_delete_user")
+async def delete_user_from_db(db: AsyncSession, user: models.User):
+    await db.delete(user)
+    await db.commit()
+
+#foodrecord_get
+# ユーザーのその日の食事記録をid順にlimit+1件取得
+@metrics.timed("crud_get_food_records_page")
+async def get_food_records_page(db: AsyncSession, user: models.User, date: date, after_id: int, limit: int):
+    statement = select(*FOOD_RECORD_COLUMNS).where(
+        models.FoodRecord.user_id == user.id, models.FoodRecord.date == date, models.FoodRecord.id > after_id
+    )
+    result = await db.execute(statement.order_by(models.FoodRecord.id).limit(limit + 1))
+    return result.all()
+
+#foodrecord_create
+@metrics.timed("crud_create_food_record")
+async def create_food_record_in_db(db: AsyncSession, user: models.User, food_record: models.FoodRecordCreate, today: date) -> models.FoodRecord:
+    db_food_record = models.FoodRecord(
+        user_id=user.id,
+        date=today,
+        recipe_name=food_record.recipe_name,
+        servings=food_record.servings,
+        energy=food_record.energy,
+        protein=food_record.protein,
+        fat=food_record.fat,
+        carbohydrate=food_record.carbohydrate,
+        # 栄養素が指定されていなければ、後からバックグラウンドで取得する
+        status=models.STATUS_COMPLETE if food_record.energy is not None else models.STATUS_PENDING
+    )
+    db.add(db_food_record)
+    await db.commit()
+    await db.refresh(db_food_record)
+    return db_food_record
+
+#foodrecord_bulk_create
+# executemanyでまとめて挿入し、チャンクごとにコミットして採番されたidを返す
+@metrics.timed("crud_bulk_create_food_records")
+async def bulk_create_food_records_in_db(db: AsyncSession, user: models.User, food_records: List[models.FoodRecordCreate], today: date, chunk_size: int = crud.BULK_CHUNK_SIZE) -> List[int]:
+    rows = crud.create_food_record_rows(user, food_records, today)
+    ids = []
+    statement = insert(models.FoodRecord).returning(models.FoodRecord.id, sort_by_parameter_order=True)
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        ids.extend((await db.scalars(statement, chunk)).all())
+        # まとめて挿入した分はORMのイベントが呼ばれないので、日ごとの合計をここで更新する
+        deltas = {}
+        for row in chunk:
+            models.merge_delta(deltas, (row["user_id"], row["date"]), models.food_record_delta(row))
+        await db.run_sync(lambda sync_db: models.add_to_daily_totals(sync_db.connection(), deltas, sync_db))
+        await db.commit()
+    return ids
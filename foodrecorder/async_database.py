@@ -0,0 +1,23 @@
+#async_database.py
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+import config
+from pool_monitor import pool_monitor
+from sqlite_profile import apply_sqlite_profile
+
+async_engine = apply_sqlite_profile(create_async_engine(
+    config.ASYNC_DATABASE_URL,
+    pool_size=config.DB_POOL_SIZE,
+    max_overflow=config.DB_MAX_OVERFLOW,
+    pool_timeout=config.DB_POOL_TIMEOUT,
+    pool_pre_ping=True,
+))
+pool_monitor.attach(async_engine, "async")
+
+# コミット後も属性を読めるように、expire_on_commitは無効にする
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+
+# FastAPIの依存関係として使う非同期セッション
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,66 @@
+#batch_lookup.py
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterator, List
+import config, models, scraping
+from nutrient_cache import nutrient_cache, normalize_recipe_name
+
+
+# 1人分の値と人数から、1件分の結果を作成
+def _build_result(index: int, item: models.NutrientLookupItem, data, cached: bool = False,
+                  error: str = None) -> models.NutrientLookupResult:
+    result = models.NutrientLookupResult(
+        index=index, recipe_name=item.recipe_name, servings=item.servings, found=False, cached=cached, error=error
+    )
+    if data is None:
+        return result
+    try:
+        amounts = scraping.parse_nutrient_amounts(data)
+    except ValueError as parse_error:
+        result.error = str(parse_error)
+        return result
+
+    result.found = True
+    for field, amount in amounts.items():
+        setattr(result, field, amount * item.servings)
+    return result
+
+
+# 複数の料理の栄養素をまとめて調べ、終わったものから順に返す
+def lookup_many(items: List[models.NutrientLookupItem],
+                max_parallel: int = config.BATCH_LOOKUP_MAX_PARALLEL) -> Iterator[models.NutrientLookupResult]:
+    # 同じ料理名は1回だけ調べる
+    indexes_by_key: Dict[str, List[int]] = {}
+    names_by_key: Dict[str, str] = {}
+    for index, item in enumerate(items):
+        key = normalize_recipe_name(item.recipe_name)
+        indexes_by_key.setdefault(key, []).append(index)
+        names_by_key.setdefault(key, item.recipe_name)
+
+    # キャッシュにあるものはすぐに返す
+    remaining = []
+    for key, indexes in indexes_by_key.items():
+        data = nutrient_cache.get(names_by_key[key])
+        if data is None:
+            remaining.append(key)
+            continue
+        for index in indexes:
+            yield _build_result(index, items[index], data, cached=True)
+
+    if not remaining:
+        return
+
+    # 残りは同時実行数の上限を守りながら並列に調べる（キャッシュはもう見たので、もう一度は見ない）
+    with ThreadPoolExecutor(max_workers=max(1, min(max_parallel, len(remaining)))) as executor:
+        futures = {
+            executor.submit(scraping.lookup_uncached_nutrients, names_by_key[key]): key
+            for key in remaining
+        }
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                lookup = future.result()
+                data, error = (lookup.data, None) if lookup.found else (None, lookup.message)
+            except Exception as lookup_error:
+                data, error = None, str(lookup_error)
+            for index in indexes_by_key[key]:
+                yield _build_result(index, items[index], data, error=error)
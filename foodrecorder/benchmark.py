@@ -0,0 +1,1040 @@
+#benchmark.py
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import date, datetime, timedelta
+from typing import List
+from sqlalchemy import bindparam, create_engine, func, select, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.exc import OperationalError
+import config, crud, migrations, models, synthetic_data, trends
+from database import Base
+from sqlite_profile import apply_sqlite_profile, current_pragmas
+
+
+# 一時ファイルのSQLiteにテーブルを作成し、セッションを返す
+@contextmanager
+def temporary_session():
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'benchmark.db')}")
+        Base.metadata.create_all(bind=engine)
+        db = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+        try:
+            yield db
+        finally:
+            db.close()
+            engine.dispose()
+
+
+def _create_user(db, username="benchmark"):
+    return crud.create_and_save_user(models.UserCreate(username=username), db)
+
+
+def _sample_food_records(count):
+    return [
+        models.FoodRecordCreate(
+            recipe_name=f"料理{i % 50}", servings=1.0,
+            energy=500.0, protein=20.0, fat=15.0, carbohydrate=70.0,
+        )
+        for i in range(count)
+    ]
+
+
+# 一時ファイルのSQLiteに、users人 × days日 × 1日meals回程度の食事記録を作ったセッションと、作った件数を返す
+@contextmanager
+def synthetic_session(users, days, meals, seed=0):
+    with temporary_session() as db:
+        data = synthetic_data.populate(db.connection(), users, days, meals, seed)
+        db.commit()
+        yield db, data
+
+
+# 1回ごとの時間（ミリ秒）から、平均・p50・p99を求める
+def _latency_summary(milliseconds):
+    percentiles = statistics.quantiles(milliseconds, n=100)
+    return {
+        "calls": len(milliseconds),
+        "mean_milliseconds": statistics.fmean(milliseconds),
+        "p50_milliseconds": percentiles[49],
+        "p99_milliseconds": percentiles[98],
+    }
+
+
+# 引数の組ごとに関数を1回ずつ呼び、1回あたりの時間をまとめる
+def _time_calls(function, arguments):
+    milliseconds = []
+    for argument in arguments:
+        start = time.perf_counter()
+        function(*argument)
+        milliseconds.append((time.perf_counter() - start) * 1000)
+    return _latency_summary(milliseconds)
+
+
+# 作ったデータから、ランダムなユーザーと日付の組をsamples個選ぶ
+def _sample_user_days(data, samples, seed=0):
+    rng = random.Random(seed)
+    start_date = date.fromisoformat(data["start_date"])
+    return [
+        (data["first_user_id"] + rng.randrange(data["users"]), start_date + timedelta(days=rng.randrange(data["days"])))
+        for _ in range(samples)
+    ]
+
+
+# 1件ずつのコミットと、まとめて挿入した場合の1秒あたりの件数を比較
+def benchmark_bulk_insert(rows=2000):
+    food_records = _sample_food_records(rows)
+    today = date.today()
+    results = {}
+
+    with temporary_session() as db:
+        user = _create_user(db)
+        start = time.perf_counter()
+        for food_record in food_records:
+            crud.create_food_record_in_db(db, user, food_record, today)
+        elapsed = time.perf_counter() - start
+        results["per_row"] = {"seconds": elapsed, "rows_per_second": rows / elapsed}
+
+    with temporary_session() as db:
+        user = _create_user(db)
+        start = time.perf_counter()
+        crud.bulk_create_food_records_in_db(db, user, food_records, today)
+        elapsed = time.perf_counter() - start
+        results["bulk"] = {"seconds": elapsed, "rows_per_second": rows / elapsed}
+
+    results["speedup"] = results["per_row"]["seconds"] / results["bulk"]["seconds"]
+    return {"rows": rows, **results}
+
+
+# ユーザーと日付で絞り込む検索の実行計画と速度を、インデックスの有無で比較
+def benchmark_food_record_index(rows=1_000_000, users=1000, queries=200):
+    start_date = date(2020, 1, 1)
+    random.seed(0)
+    with temporary_session() as db:
+        connection = db.connection()
+        connection.execute(text("DROP INDEX ix_food_records_user_id_date"))
+        connection.execute(
+            models.User.__table__.insert(),
+            [{"id": user_id, "username": f"user{user_id}"} for user_id in range(1, users + 1)],
+        )
+        for chunk_start in range(0, rows, 50_000):
+            connection.execute(models.FoodRecord.__table__.insert(), [
+                {
+                    "user_id": random.randint(1, users),
+                    "date": start_date + timedelta(days=random.randint(0, 3 * 365)),
+                    "recipe_name": "料理", "servings": 1.0,
+                    "energy": 500.0, "protein": 20.0, "fat": 15.0, "carbohydrate": 70.0,
+                }
+                for _ in range(min(50_000, rows - chunk_start))
+            ])
+        db.commit()
+
+        query = text("SELECT * FROM food_records WHERE user_id = :user_id AND date = :date")
+        parameters = [
+            {"user_id": random.randint(1, users), "date": start_date + timedelta(days=random.randint(0, 3 * 365))}
+            for _ in range(queries)
+        ]
+
+        def measure():
+            connection = db.connection()
+            plan = connection.execute(text("EXPLAIN QUERY PLAN " + query.text), parameters[0]).fetchall()
+            start = time.perf_counter()
+            for parameter in parameters:
+                connection.execute(query, parameter).fetchall()
+            elapsed = time.perf_counter() - start
+            return {"plan": [row[-1] for row in plan], "milliseconds_per_query": elapsed / queries * 1000}
+
+        results = {"rows": rows, "without_index": measure()}
+        db.commit()
+        # マイグレーションでインデックスを追加してから測り直す
+        migrations.upgrade(db.get_bind())
+        results["with_index"] = measure()
+    results["speedup"] = results["without_index"]["milliseconds_per_query"] / results["with_index"]["milliseconds_per_query"]
+    return results
+
+
+# 1年分の日ごとの合計を持つ多数のユーザーについて、期間ごとの推移を集計する速さを測る
+def benchmark_trends(rows=None, users=2000, days=365, samples=200):
+    start_date = date(2023, 1, 1)
+    end_date = start_date + timedelta(days=days - 1)
+    random.seed(0)
+    with temporary_session() as db:
+        connection = db.connection()
+        connection.execute(
+            models.User.__table__.insert(),
+            [{"id": user_id, "username": f"user{user_id}"} for user_id in range(1, users + 1)],
+        )
+        for user_id in range(1, users + 1):
+            connection.execute(models.DailyNutrientTotal.__table__.insert(), [
+                {
+                    "user_id": user_id, "date": start_date + timedelta(days=offset), "record_count": 3,
+                    "energy": random.uniform(1200, 2800), "protein": random.uniform(40, 120),
+                    "fat": random.uniform(30, 100), "carbohydrate": random.uniform(150, 400),
+                }
+                for offset in range(days)
+            ])
+        db.commit()
+
+        sample_users = [db.get(models.User, random.randint(1, users)) for _ in range(samples)]
+        results = {"users": users, "days": days, "numpy": trends._numpy() is not None}
+        for period in trends.PERIODS:
+            start = time.perf_counter()
+            for user in sample_users:
+                trends.get_nutrient_trend(db, user, start_date, end_date, period, rolling_window=7)
+            elapsed = time.perf_counter() - start
+            results[period] = {"milliseconds_per_request": elapsed / samples * 1000}
+    return results
+
+
+# 作ったデータに対して、crud.pyの関数1回あたりの時間を測る
+def benchmark_crud(rows=None, users=200, days=30, meals=3, samples=300):
+    with synthetic_session(users, days, meals) as (db, data):
+        user_days = _sample_user_days(data, samples)
+        usernames = [(f"user{user_id}",) for user_id, _ in user_days]
+        db_users = [crud.get_user_by_username(username, db) for username, in usernames]
+        user_dates = [(db_user, day) for db_user, (_, day) in zip(db_users, user_days)]
+        food_records = [(crud.get_food_records_from_db(db, db_user, day),) for db_user, day in user_dates]
+        today = date.today()
+        results = {
+            "data": data,
+            "get_user_by_username": _time_calls(lambda username: crud.get_user_by_username(username, db), usernames),
+            "get_food_records_from_db": _time_calls(
+                lambda db_user, day: crud.get_food_records_from_db(db, db_user, day), user_dates
+            ),
+            "create_food_record_responses": _time_calls(crud.create_food_record_responses, food_records),
+            "create_food_record_in_db": _time_calls(
+                lambda db_user, food_record: crud.create_food_record_in_db(db, db_user, food_record, today),
+                zip(db_users, _sample_food_records(samples)),
+            ),
+        }
+    return results
+
+
+# その日の栄養素の合計を、食事記録を毎回合計する場合（以前のget_nutrient_summary）、日ごとの合計の行を読む場合、
+# メモリ上の合計（Streamlitの画面で使うsummary_accumulator）を使う場合で比較
+def benchmark_summary(rows=None, users=200, days=30, meals=3, samples=1000):
+    from summary_accumulator import DailySummaryAccumulator
+
+    record = models.FoodRecord
+    sum_statement = select(*(func.sum(getattr(record, column)) for column in models.NUTRIENT_COLUMNS)).where(
+        record.user_id == bindparam("user_id"), record.date == bindparam("day")
+    )
+    total = models.DailyNutrientTotal
+    rollup_statement = select(*(getattr(total, column) for column in models.NUTRIENT_COLUMNS)).where(total.user_id == bindparam("user_id"), total.date == bindparam("day"))
+    with synthetic_session(users, days, meals) as (db, data):
+        user_days = _sample_user_days(data, samples)
+        accumulator = DailySummaryAccumulator(session_factory=lambda: nullcontext(db))
+        try:
+            results = {
+                "data": data,
+                "sum_food_records": _time_calls(
+                    lambda user_id, day: db.execute(sum_statement, {"user_id": user_id, "day": day}).one(), user_days
+                ),
+                "daily_total_row": _time_calls(
+                    lambda user_id, day: db.execute(rollup_statement, {"user_id": user_id, "day": day}).first(),
+                    user_days,
+                ),
+                "accumulator_first_read": _time_calls(accumulator.summary, user_days),
+                "accumulator": _time_calls(accumulator.summary, user_days),
+            }
+        finally:
+            accumulator.close()
+    return results
+
+
+# 栄養素の量からPFC比率を求める関数（グラフ用の丸めた%と、推移のAPIの比率）1回あたりの時間（マイクロ秒）
+def benchmark_pfc(rows=100_000):
+    import charts
+
+    rng = random.Random(0)
+    totals = [(rng.uniform(0, 120), rng.uniform(0, 100), rng.uniform(0, 400)) for _ in range(rows)]
+    results = {"calls": rows}
+    for name, function in (("rounded_pfc_percentages", charts.rounded_pfc_percentages), ("pfc_ratios", trends.pfc_ratios)):
+        start = time.perf_counter()
+        for protein, fat, carbohydrate in totals:
+            function(protein, fat, carbohydrate)
+        results[name] = {"microseconds_per_call": (time.perf_counter() - start) / rows * 1_000_000}
+    return results
+
+
+# 手元の食品成分表の検索1回あたりの時間（rows件の表。完全一致・読みがな・前方一致・表記の揺れ・表にない料理・短い名前）
+def benchmark_food_table(rows=2500, samples=2000):
+    from food_table import FoodEntry, FoodTable
+
+    rng = random.Random(0)
+    menu = [entry for entries in synthetic_data.MENU.values() for entry in entries]
+    variants = (("", ""), ("大盛り", "おおもり"), ("ミニ", "みに"), ("冷凍", "れいとう"), ("特製", "とくせい"),
+                ("和風", "わふう"), ("手作り", "てづくり"), ("コンビニの", "こんびにの"), ("減塩", "げんえん"), ("辛口", "からくち"))
+    entries = []
+    for index in range(rows):
+        entry = menu[index % len(menu)]
+        variant, variant_reading = variants[index // len(menu) % len(variants)]
+        number = index // (len(menu) * len(variants)) or ""
+        entries.append(entry._replace(name=f"{variant}{entry.name}{number}", reading=f"{variant_reading}{entry.reading}{number}"))
+    start = time.perf_counter()
+    table = FoodTable(entries)
+    build_seconds = time.perf_counter() - start
+
+    names = [entry.name for entry in entries]
+    queries = {
+        "exact": [(rng.choice(names),) for _ in range(samples)],
+        "reading": [(entry.reading,) for entry in rng.choices(entries, k=samples)],
+        "prefix": [(name[:max(3, len(name) - 1)],) for name in rng.choices(names, k=samples)],
+        "fuzzy": [(name[:2] + name[3:],) for name in rng.choices(names, k=samples)],
+        "miss": [(f"存在しない料理{index}",) for index in range(samples)],
+        "short": [(rng.choice(("パン", "カ", "そば", "丼")),) for _ in range(samples)],
+    }
+    results = {"rows": rows, "build_milliseconds": build_seconds * 1000}
+    for name, arguments in queries.items():
+        matched = sum(table.best_match(*argument) is not None for argument in arguments)
+        results[name] = {**_time_calls(table.best_match, arguments), "match_rate": matched / samples}
+    return results
+
+
+# 同時リクエストを送り、1秒あたりに処理できたリクエスト数を測る
+async def _measure_requests_per_second(app, url, requests, concurrency):
+    import httpx
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def get():
+            async with semaphore:
+                response = await client.get(url)
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(get() for _ in range(requests)))
+        elapsed = time.perf_counter() - start
+    return {"seconds": elapsed, "requests_per_second": requests / elapsed}
+
+
+# 一時ファイルのSQLiteに1日分の食事記録を作り、変更前と同じ作りのエンドポイント（def関数・同期セッション・
+# ORMのオブジェクトからレスポンスを作成）のアプリと、main.appを返す
+@contextmanager
+def temporary_api_apps(records_per_day):
+    from fastapi import Depends, FastAPI
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    import main
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "benchmark.db")
+        engine = create_engine(f"sqlite:///{path}")
+        Base.metadata.create_all(bind=engine)
+        SyncSession = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        with SyncSession() as db:
+            user = _create_user(db)
+            crud.bulk_create_food_records_in_db(db, user, _sample_food_records(records_per_day), date.today())
+
+        def get_db():
+            db = SyncSession()
+            try:
+                yield db
+            finally:
+                db.close()
+
+        baseline_app = FastAPI()
+
+        @baseline_app.get("/users/{username}/food_records/", response_model=List[models.FoodRecordResponse])
+        def get_food_records(username: str, date: date, limit: int = 0, db=Depends(get_db)):
+            db_user = crud.get_user_by_username(username, db)
+            return crud.create_food_record_responses(crud.get_food_records_from_db(db, db_user, date))
+
+        async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        AsyncSession = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+        async def get_async_db():
+            async with AsyncSession() as db:
+                yield db
+
+        main.app.dependency_overrides[main.get_async_db] = get_async_db
+        try:
+            yield baseline_app, main.app
+        finally:
+            main.app.dependency_overrides.pop(main.get_async_db, None)
+            asyncio.run(async_engine.dispose())
+            engine.dispose()
+
+
+# 同期セッションのエンドポイントと、非同期セッションのエンドポイントで処理できるリクエスト数を比較
+def benchmark_api_load(rows=None, requests=2000, concurrency=50, records_per_day=5):
+    url = f"/users/benchmark/food_records/?date={date.today().isoformat()}"
+    with temporary_api_apps(records_per_day) as (baseline_app, app):
+        results = {
+            "requests": requests,
+            "concurrency": concurrency,
+            "sync": asyncio.run(_measure_requests_per_second(baseline_app, url, requests, concurrency)),
+            "async": asyncio.run(_measure_requests_per_second(app, url, requests, concurrency)),
+        }
+    results["speedup"] = results["async"]["requests_per_second"] / results["sync"]["requests_per_second"]
+    return results
+
+
+# 一時ファイルのSQLiteに作ったデータを、main.appの同期・非同期の両方のセッションから使わせる
+@contextmanager
+def temporary_main_app(users, days, meals):
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    import main
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "benchmark.db")
+        engine = create_engine(f"sqlite:///{path}")
+        Base.metadata.create_all(bind=engine)
+        with engine.begin() as connection:
+            data = synthetic_data.populate(connection, users, days, meals)
+            # グラフを要求する、記録のあるユーザーと日付（よく見られる少数のもの）
+            total = models.DailyNutrientTotal
+            data["chart_days"] = [
+                (user_id, day.isoformat())
+                for user_id, day in connection.execute(select(total.user_id, total.date).order_by(total.date.desc()).limit(5))
+            ]
+        SyncSession = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        AsyncSession = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+        def get_db():
+            db = SyncSession()
+            try:
+                yield db
+            finally:
+                db.close()
+
+        async def get_async_db():
+            async with AsyncSession() as db:
+                yield db
+
+        main.app.dependency_overrides[main.get_db] = get_db
+        main.app.dependency_overrides[main.get_async_db] = get_async_db
+        try:
+            yield main.app, data
+        finally:
+            main.app.dependency_overrides.pop(main.get_db, None)
+            main.app.dependency_overrides.pop(main.get_async_db, None)
+            asyncio.run(async_engine.dispose())
+            engine.dispose()
+
+
+# 負荷試験で送るリクエストの種類と割合（画面を開いたときの一覧、今日の記録、記録の追加、推移、グラフ）
+HTTP_SCENARIO = (
+    ("list_users", 0.1),
+    ("daily_records", 0.4),
+    ("create_record", 0.15),
+    ("nutrient_range", 0.2),
+    ("pfc_chart", 0.15),
+)
+
+
+# シナリオの割合でリクエスト（名前、メソッド、URL、JSON）を作る
+# グラフは描画済みのものを使い回す前提なので、よく見られる少数のユーザーと日付の分だけを要求する
+def _scenario_requests(data, requests, seed=0):
+    rng = random.Random(seed)
+    names, weights = zip(*HTTP_SCENARIO)
+    start_date = date.fromisoformat(data["start_date"])
+    food_record = _sample_food_records(1)[0].model_dump()
+    planned = []
+    for name in rng.choices(names, weights=weights, k=requests):
+        username = f"user{data['first_user_id'] + rng.randrange(data['users'])}"
+        day = start_date + timedelta(days=rng.randrange(data["days"]))
+        if name == "list_users":
+            planned.append((name, "GET", "/users/?limit=50", None))
+        elif name == "daily_records":
+            planned.append((name, "GET", f"/users/{username}/food_records/?date={day.isoformat()}", None))
+        elif name == "create_record":
+            planned.append((name, "POST", f"/users/{username}/food_records/", food_record))
+        elif name == "nutrient_range":
+            start = max(start_date, day - timedelta(days=27))
+            planned.append((name, "GET", f"/users/{username}/nutrients/range?start={start}&end={day}&period=week", None))
+        else:
+            user_id, day = rng.choice(data["chart_days"])
+            planned.append((name, "GET", f"/users/user{user_id}/charts/pfc.png?date={day}", None))
+    return planned
+
+
+# シナリオのリクエストをconcurrency件ずつ同時に送り、種類ごとの応答時間とステータスコード、全体の処理数を返す
+async def _run_scenario(app, planned, concurrency):
+    import httpx
+
+    transport = httpx.ASGITransport(app=app)
+    latencies = {name: [] for name, _ in HTTP_SCENARIO}
+    statuses = {name: {} for name, _ in HTTP_SCENARIO}
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def send(name, method, url, body):
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.request(method, url, json=body)
+                latencies[name].append((time.perf_counter() - start) * 1000)
+                statuses[name][response.status_code] = statuses[name].get(response.status_code, 0) + 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(send(*request) for request in planned))
+        elapsed = time.perf_counter() - start
+    endpoints = {
+        name: {**_latency_summary(latencies[name]), "statuses": statuses[name]}
+        for name in latencies if len(latencies[name]) >= 2
+    }
+    return {"seconds": elapsed, "requests_per_second": len(planned) / elapsed, "endpoints": endpoints}
+
+
+# 作ったデータに対してmain.appにシナリオどおりのリクエストを送る負荷試験
+def benchmark_http(rows=None, users=100, days=30, meals=3, requests=1000, concurrency=20):
+    with temporary_main_app(users, days, meals) as (app, data):
+        planned = _scenario_requests(data, requests)
+        results = asyncio.run(_run_scenario(app, planned, concurrency))
+    server_errors = sum(
+        count for endpoint in results["endpoints"].values() for status, count in endpoint["statuses"].items()
+        if status >= 500
+    )
+    return {"data": data, "requests": requests, "concurrency": concurrency, "server_errors": server_errors, **results}
+
+
+# 1件ずつ順番にリクエストを送り、応答時間のp50・p99（ミリ秒）を測る
+async def _measure_latency(app, url, requests):
+    import httpx
+
+    transport = httpx.ASGITransport(app=app)
+    latencies = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        for _ in range(requests):
+            start = time.perf_counter()
+            response = await client.get(url)
+            latencies.append((time.perf_counter() - start) * 1000)
+            response.raise_for_status()
+    percentiles = statistics.quantiles(latencies, n=100)
+    return {"p50_milliseconds": percentiles[49], "p99_milliseconds": percentiles[98], "bytes": len(response.content)}
+
+
+# 1万件の食事記録を返すレスポンスについて、ORMのオブジェクトとPydanticの検証を通す作り方と、
+# 列だけを取得して辞書のままJSONにする作り方の応答時間を比較
+def benchmark_serialization(rows=10_000, requests=50):
+    url = f"/users/benchmark/food_records/?date={date.today().isoformat()}&limit={rows}"
+    with temporary_api_apps(rows) as (baseline_app, app):
+        results = {
+            "records": rows,
+            "requests": requests,
+            "baseline": asyncio.run(_measure_latency(baseline_app, url, requests)),
+            "fast_path": asyncio.run(_measure_latency(app, url, requests)),
+        }
+    results["p50_speedup"] = results["baseline"]["p50_milliseconds"] / results["fast_path"]["p50_milliseconds"]
+    return results
+
+
+# 別プロセスから同じファイルに読み書きし続け、成功した回数とロックで失敗した回数を返す
+def _mixed_workload_process(path, profile, role, seconds, results):
+    engine = apply_sqlite_profile(create_engine(f"sqlite:///{path}"), profile)
+    db = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    user = db.get(models.User, 1)
+    food_record = _sample_food_records(1)[0]
+    today = date.today()
+    operations, locked = 0, 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        try:
+            if role == "app":
+                # Streamlitアプリ：1件追加するごとにコミット
+                crud.create_food_record_in_db(db, user, food_record, today)
+            else:
+                # API：その日の食事記録を取得
+                crud.get_food_records_from_db(db, user, today)
+                db.rollback()
+            operations += 1
+        except OperationalError:
+            db.rollback()
+            locked += 1
+    db.close()
+    engine.dispose()
+    results.put((role, operations, locked))
+
+
+# アプリ（書き込み）とAPI（読み込み）のプロセスが同じファイルを使う場合の処理数を、SQLiteの設定ごとに比較
+def benchmark_sqlite_profile(rows=None, seconds=5.0, readers=3, writers=1):
+    results = {}
+    for profile in ("default", "tuned"):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "benchmark.db")
+            engine = apply_sqlite_profile(create_engine(f"sqlite:///{path}"), profile)
+            Base.metadata.create_all(bind=engine)
+            with sessionmaker(bind=engine)() as db:
+                user = _create_user(db)
+                crud.bulk_create_food_records_in_db(db, user, _sample_food_records(20), date.today())
+            with engine.connect() as connection:
+                pragmas = current_pragmas(connection)
+            engine.dispose()
+
+            queue = multiprocessing.Queue()
+            roles = ["app"] * writers + ["api"] * readers
+            processes = [
+                multiprocessing.Process(target=_mixed_workload_process, args=(path, profile, role, seconds, queue))
+                for role in roles
+            ]
+            for process in processes:
+                process.start()
+            counts = [queue.get() for _ in processes]
+            for process in processes:
+                process.join()
+
+        summary = {"pragmas": pragmas}
+        for role in ("app", "api"):
+            operations = sum(count for name, count, _ in counts if name == role)
+            summary[role] = {
+                "operations_per_second": operations / seconds,
+                "locked_errors": sum(locked for name, _, locked in counts if name == role),
+            }
+        results[profile] = summary
+    return {"seconds": seconds, "writers": writers, "readers": readers, **results}
+
+
+# PFC比率のグラフを毎回描画した場合と、キャッシュしたPNGを使い回した場合の時間を比較
+def benchmark_charts(rows=None, renders=50):
+    import charts
+
+    random.seed(0)
+    totals = [(random.uniform(40, 120), random.uniform(30, 100), random.uniform(150, 400)) for _ in range(renders)]
+    charts._daily_pfc_png.cache_clear()
+    start = time.perf_counter()
+    for protein, fat, carbohydrate in totals:
+        charts.daily_pfc_png(date(2023, 1, 1), protein, fat, carbohydrate)
+    uncached = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for protein, fat, carbohydrate in totals:
+        charts.daily_pfc_png(date(2023, 1, 1), protein, fat, carbohydrate)
+    cached = time.perf_counter() - start
+    return {
+        "renders": renders,
+        "uncached": {"milliseconds_per_chart": uncached / renders * 1000},
+        "cached": {"milliseconds_per_chart": cached / renders * 1000},
+        "cache": charts.cache_info()["daily"],
+    }
+
+
+# 1件ずつ辞書に足していく場合の日ごとの合計とPFC比率（以前のPythonでの集計と同じやり方）
+def _python_daily_analytics(user_ids, days, energies, proteins, fats, carbohydrates):
+    totals = {}
+    for key, energy, protein, fat, carbohydrate in zip(zip(user_ids, days), energies, proteins, fats, carbohydrates):
+        current = totals.get(key)
+        if current is None:
+            totals[key] = [1, energy, protein, fat, carbohydrate]
+        else:
+            current[0] += 1
+            current[1] += energy
+            current[2] += protein
+            current[3] += fat
+            current[4] += carbohydrate
+    return {key: trends.pfc_ratios(*values[2:]) for key, values in totals.items()}
+
+
+# analytics.pyの集計（すべてのユーザー・日付の合計、PFC比率、理想との差、順位）を、NumPyで作ったrows件の記録で測り、
+# 1件ずつ辞書に足す場合（python_rows件）と1秒あたりの件数を比べる。SQLiteからの読み込みはsynthetic_dataのデータで測る
+def benchmark_analytics(rows=10_000_000, users=None, days=365, meals=3, python_rows=1_000_000):
+    import numpy as np
+    import analytics
+
+    users = users or max(1, rows // (days * meals))
+    rng = np.random.default_rng(0)
+    entries = [entry for meal in synthetic_data.MENU.values() for entry in meal]
+    menu = np.array([[entry.energy, entry.protein, entry.fat, entry.carbohydrate] for entry in entries], dtype=np.float32)
+    picks = rng.integers(0, len(entries), rows)
+    scale = rng.lognormal(0, 0.2, rows).astype(np.float32)
+    # 2%は栄養素の取得待ち（0）の記録にする
+    scale[rng.random(rows) < 0.02] = 0
+    columns = analytics.FoodRecordColumns(
+        rng.integers(1, users + 1, rows, dtype=np.int32),
+        (analytics.to_epoch_day(date(2023, 1, 1)) + rng.integers(0, days, rows)).astype(np.int32),
+        *(np.ascontiguousarray(menu[picks, index] * scale) for index in range(4)),
+    )
+    del picks, scale
+
+    started = time.perf_counter()
+    daily = analytics.daily_analytics(columns)
+    aggregated = time.perf_counter()
+    ranking = analytics.rank_users(daily)
+    ranked = time.perf_counter()
+    vectorized_seconds = ranked - started
+
+    python_rows = min(python_rows, rows)
+    python_columns = [column[:python_rows].tolist() for column in columns]
+    start = time.perf_counter()
+    _python_daily_analytics(*python_columns)
+    python_seconds = time.perf_counter() - start
+
+    with synthetic_session(200, 90, meals) as (db, data):
+        connection = db.connection()
+        start = time.perf_counter()
+        loaded = analytics.load_food_record_columns(connection)
+        load_seconds = time.perf_counter() - start
+        loaded_daily = analytics.daily_analytics(loaded)
+        expected = {
+            (row.user_id, analytics.to_epoch_day(row.date)): row.energy
+            for row in connection.execute(select(models.DailyNutrientTotal))
+        }
+        max_difference = max(
+            abs(expected[(user_id, day)] - energy)
+            for user_id, day, energy in zip(loaded_daily.user_id.tolist(), loaded_daily.day.tolist(),
+                                            loaded_daily.energy.tolist())
+        )
+    return {
+        "rows": rows,
+        "users": users,
+        "days": days,
+        "user_days": len(daily.user_id),
+        "bytes_per_record": columns.nbytes / rows,
+        "vectorized": {
+            "aggregate_seconds": aggregated - started,
+            "rank_seconds": ranked - aggregated,
+            "records_per_second": rows / vectorized_seconds,
+        },
+        "python": {"rows": python_rows, "seconds": python_seconds, "records_per_second": python_rows / python_seconds},
+        "speedup": (rows / vectorized_seconds) / (python_rows / python_seconds),
+        "ranked_users": int(np.count_nonzero(ranking.rank)),
+        "sqlite_load": {
+            "rows": loaded.size,
+            "seconds": load_seconds,
+            "records_per_second": loaded.size / load_seconds,
+            "max_energy_difference_from_daily_totals": max_difference,
+        },
+    }
+
+
+# functionを呼んで返った値を保持している間に増えたメモリ（tracemallocで数えたバイト数）と、返った値
+def _retained_bytes(function):
+    import gc
+    import tracemalloc
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        value = function()
+        gc.collect()
+        return tracemalloc.get_traced_memory()[0] - before, value
+    finally:
+        tracemalloc.stop()
+
+
+# 画面に食事記録を表示するためにメモリに持つ大きさを、ORMのオブジェクト（セッションに保持したまま）、
+# 以前の画面のキャッシュと同じFoodRecordResponseのリスト、record_storeの配列で比べ、1日分を読む時間も比べる
+def benchmark_record_store(rows=None, users=20, days=365, meals=3, samples=500):
+    from cache_generations import CacheGenerations
+    from record_store import RecordStore
+
+    with synthetic_session(users, days, meals) as (db, data):
+        user_ids = list(range(data["first_user_id"], data["first_user_id"] + users))
+        records = data["food_records"]
+
+        def load_orm():
+            session = sessionmaker(bind=db.get_bind())()
+            return session, session.query(models.FoodRecord).filter(models.FoodRecord.user_id.in_(user_ids)).all()
+
+        orm_bytes, (session, food_records) = _retained_bytes(load_orm)
+        response_bytes, responses = _retained_bytes(lambda: crud.create_food_record_responses(food_records))
+        session.close()
+        del food_records, responses
+
+        def load_store():
+            store = RecordStore(session_factory=lambda: nullcontext(db), generations=CacheGenerations())
+            for user_id in user_ids:
+                store.history(user_id)
+            return store
+
+        store_bytes, store = _retained_bytes(load_store)
+        user_days = _sample_user_days(data, samples)
+        orm_reads = _time_calls(
+            lambda user_id, day: crud.create_food_record_responses(
+                crud.get_food_records_from_db(db, db.get(models.User, user_id), day)
+            ),
+            user_days,
+        )
+        store_reads = _time_calls(store.records, user_days)
+
+        # 1件追加して世代番号を進めたときに、読み足すのにかかる時間
+        user_id, day = user_days[0]
+        crud.create_food_record_in_db(db, db.get(models.User, user_id), _sample_food_records(1)[0], day)
+        store.generations.bump(user_id)
+        start = time.perf_counter()
+        store.history(user_id)
+        refresh_seconds = time.perf_counter() - start
+        stats = store.stats()
+    return {
+        "data": data,
+        "bytes_per_record": {
+            "orm": orm_bytes / records,
+            "responses": response_bytes / records,
+            "record_store": store_bytes / records,
+            "record_store_arrays": stats["array_bytes"] / stats["records"],
+        },
+        "daily_read": {"orm": orm_reads, "record_store": store_reads},
+        "incremental_refresh_milliseconds": refresh_seconds * 1000,
+    }
+
+
+# 以前の結果と比べて、この割合を超えて遅くなったら回帰とみなす（時間のばらつきがあるため大きめ）
+REGRESSION_TOLERANCE = 0.25
+
+# 遅くなった時間がこれ（秒）より短ければ、割合が大きくても回帰とみなさない（1ミリ秒に満たない差はばらつきの方が大きい）
+REGRESSION_FLOOR_SECONDS = 0.001
+
+# 1回の中の外れ値で大きく変わる値（平均・p99）は比べて表示するだけで、回帰とはみなさない
+UNGATED_PREFIXES = ("mean_", "p99_")
+
+# 測る前に捨てる回数と、測る回数（値は測った回数分の中央値を使う）
+BENCHMARK_WARMUP = 1
+BENCHMARK_REPEAT = 3
+
+
+# 保存済みのページに対して、1回の検索にかかる時間を測る
+# ブラウザ（ページの表示を確認しながら進む）、HTTP、遅い応答が混ざる場合のHTTP（並行して試すヘッジの有無）を比較
+def benchmark_scraping(rows=None, lookups=40, page_seconds=0.1, slow_rate=0.1, slow_seconds=3.0):
+    from deadline import Deadline
+    from driver_pool import DriverPool
+    from http_scraping import HttpScraper
+    from scraping import NutrientScraper
+    from fixture_site import FixtureDriver, FixtureSession, FixtureSite
+
+    recipe_names = ("カレーライス", "親子丼", "カレーうどん", "存在しない料理")
+
+    def measure(backend, slow_rate, hedge_after_seconds):
+        site = FixtureSite(page_seconds, slow_rate, slow_seconds)
+        drivers = DriverPool(factory=lambda: FixtureDriver(site), max_size=4)
+        scraper = NutrientScraper(HttpScraper(session=FixtureSession(site)), drivers, backend=backend,
+                                  max_attempts=2, hedge_after_seconds=hedge_after_seconds)
+        milliseconds, outcomes = [], {}
+        for index in range(lookups):
+            result = scraper.scrape(recipe_names[index % len(recipe_names)], Deadline(config.SCRAPING_BUDGET_SECONDS))
+            milliseconds.append(result.seconds * 1000)
+            outcome = "found" if result.found else result.error
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        scraper.shutdown()
+        drivers.close()
+        return {**_latency_summary(milliseconds), "outcomes": outcomes}
+
+    return {
+        "lookups": lookups,
+        "page_milliseconds": page_seconds * 1000,
+        "slow_rate": slow_rate,
+        "slow_page_milliseconds": slow_seconds * 1000,
+        "selenium": measure("selenium", 0.0, 0),
+        "http": measure("http", 0.0, 0),
+        "http_slow_pages": measure("http", slow_rate, 0),
+        "http_slow_pages_hedged": measure("http", slow_rate, page_seconds * 4),
+    }
+
+
+# APIで使わない重いライブラリ（読み込まれていたら、どこかで遅延させ忘れている）
+HEAVY_MODULES = ("streamlit", "matplotlib", "selenium", "bs4", "lxml", "numpy")
+
+
+# python -X importtime -c "import main" を別プロセスで実行し、main全体の読み込み時間（ミリ秒）を返す
+def _import_milliseconds(module):
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True,
+    )
+    for line in reversed(process.stderr.splitlines()):
+        match = re.match(rf"import time:\s+\d+ \|\s+(\d+) \| {module}$", line)
+        if match:
+            return int(match.group(1)) / 1000
+    raise RuntimeError(f"{module}の読み込み時間が見つかりませんでした。")
+
+
+# uvicorn main:app の読み込み時間を測り、予算を超えていないか・重いライブラリを読み込んでいないかを確認する
+def benchmark_import_time(rows=None, repeat=5, budget_milliseconds=config.IMPORT_TIME_BUDGET_MS):
+    milliseconds = [_import_milliseconds("main") for _ in range(repeat)]
+    check = subprocess.run(
+        [sys.executable, "-c", f"import sys, main; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True,
+    )
+    heavy_modules = [name for name in check.stdout.strip().split(",") if name]
+    median = statistics.median(milliseconds)
+    return {
+        "module": "main",
+        "median_milliseconds": median,
+        "runs_milliseconds": milliseconds,
+        "budget_milliseconds": budget_milliseconds,
+        "heavy_modules_loaded": heavy_modules,
+        "within_budget": median <= budget_milliseconds and not heavy_modules,
+    }
+
+
+# コミットごとに比べるためのひとまとまり（数分で終わるもの）
+SUITE = ("crud", "summary", "pfc", "charts", "http", "import_time")
+
+
+def benchmark_suite(rows=None, **options):
+    results = {name: BENCHMARKS[name](**_accepted_options(BENCHMARKS[name], options)) for name in SUITE}
+    results["within_budget"] = all(result.get("within_budget", True) for result in results.values())
+    return results
+
+
+BENCHMARKS = {
+    "analytics": benchmark_analytics,
+    "api_load": benchmark_api_load,
+    "charts": benchmark_charts,
+    "bulk_insert": benchmark_bulk_insert,
+    "crud": benchmark_crud,
+    "food_record_index": benchmark_food_record_index,
+    "food_table": benchmark_food_table,
+    "http": benchmark_http,
+    "import_time": benchmark_import_time,
+    "pfc": benchmark_pfc,
+    "record_store": benchmark_record_store,
+    "scraping": benchmark_scraping,
+    "serialization": benchmark_serialization,
+    "sqlite_profile": benchmark_sqlite_profile,
+    "suite": benchmark_suite,
+    "summary": benchmark_summary,
+    "trends": benchmark_trends,
+}
+
+
+# ベンチマークの関数が受け取る引数だけを渡す（--usersなどはデータを作るベンチマークだけが使う）
+def _accepted_options(function, options):
+    import inspect
+
+    parameters = inspect.signature(function).parameters
+    if any(parameter.kind == parameter.VAR_KEYWORD for parameter in parameters.values()):
+        return options
+    return {name: value for name, value in options.items() if name in parameters}
+
+
+# 結果を比べられるように、どのコミット・環境で測ったかを記録する
+def _environment():
+    process = subprocess.run(
+        ["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True, text=True,
+    )
+    return {
+        "commit": process.stdout.strip() or None,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+    }
+
+
+# 何回か測った結果を1つにまとめる（数値は中央値、それ以外は1回目の値）
+def _median_result(runs):
+    result = {}
+    for key, value in runs[0].items():
+        values = [run.get(key) for run in runs]
+        if isinstance(value, dict) and all(isinstance(item, dict) for item in values):
+            result[key] = _median_result(values)
+        elif isinstance(value, bool) or (isinstance(value, int) and all(isinstance(item, int) for item in values)):
+            # 予算を守れたかどうかは、半分を超える回で守れた場合だけTrue
+            result[key] = statistics.median_low(values)
+        elif isinstance(value, (int, float)) and all(isinstance(item, (int, float)) for item in values):
+            result[key] = statistics.median(values)
+        else:
+            result[key] = value
+    return result
+
+
+# warmup回実行して捨て、repeat回測った結果の中央値を返す
+def run_benchmark(function, options, warmup=BENCHMARK_WARMUP, repeat=BENCHMARK_REPEAT):
+    for _ in range(warmup):
+        function(**options)
+    runs = [function(**options) for _ in range(max(repeat, 1))]
+    return {"warmup": warmup, "repeat": len(runs), **_median_result(runs)}
+
+
+# 時間の値の単位（秒）
+def _seconds_scale(key):
+    if "microseconds" in key:
+        return 1e-6
+    if "milliseconds" in key:
+        return 1e-3
+    return 1.0
+
+
+# 時間（小さいほど良い）と1秒あたりの件数（大きいほど良い）の値を「a.b.c」の形の名前で取り出す
+def _comparable_values(result, prefix=""):
+    values = {}
+    for key, value in result.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            values.update(_comparable_values(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            if "per_second" in key:
+                values[name] = (value, True)
+            elif "seconds" in key:
+                values[name] = (value, False)
+    return values
+
+
+# 以前のコミットで保存した結果と比べ、tolerance（割合）を超えて悪くなった値を回帰として返す
+# 時間はfloor_seconds秒以上遅くなった場合だけ、平均・p99は表示だけ（gated: False）
+def compare_results(baseline, result, tolerance=REGRESSION_TOLERANCE, floor_seconds=REGRESSION_FLOOR_SECONDS):
+    baseline_values = _comparable_values(baseline)
+    changes, regressions = {}, []
+    for name, (value, higher_is_better) in _comparable_values(result).items():
+        if name not in baseline_values or not baseline_values[name][0]:
+            continue
+        baseline_value = baseline_values[name][0]
+        ratio = value / baseline_value
+        key = name.rsplit(".", 1)[-1]
+        gated = not key.startswith(UNGATED_PREFIXES)
+        changes[name] = {"baseline": baseline_value, "current": value, "ratio": ratio, "gated": gated}
+        if higher_is_better:
+            worse = ratio < 1 - tolerance
+        else:
+            worse = ratio > 1 + tolerance and (value - baseline_value) * _seconds_scale(key) >= floor_seconds
+        if worse and gated:
+            regressions.append(name)
+    return {
+        "baseline_commit": baseline.get("environment", {}).get("commit"),
+        "tolerance": tolerance,
+        "floor_seconds": floor_seconds,
+        "regressions": regressions,
+        "changes": changes,
+    }
+
+
+# python benchmark.py bulk_insert --rows 5000 のように実行し、結果をJSONで出力する
+# python benchmark.py suite --output before.json で保存しておき、変更後に --baseline before.json を付けると比べられる
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="FoodRecorderのベンチマーク")
+    parser.add_argument("name", choices=sorted(BENCHMARKS))
+    parser.add_argument("--rows", type=int, default=None)
+    parser.add_argument("--users", type=int, default=None, help="作るデータのユーザー数")
+    parser.add_argument("--days", type=int, default=None, help="作るデータの日数")
+    parser.add_argument("--meals", type=int, default=None, help="作るデータの1日の食事の回数")
+    parser.add_argument("--output", help="結果を保存するJSONファイル")
+    parser.add_argument("--baseline", help="比べる以前の結果のJSONファイル")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE, help="回帰とみなす悪化の割合")
+    parser.add_argument("--floor", type=float, default=REGRESSION_FLOOR_SECONDS, help="回帰とみなす悪化の最小の時間（秒）")
+    parser.add_argument("--warmup", type=int, default=BENCHMARK_WARMUP, help="測る前に実行して捨てる回数")
+    parser.add_argument("--repeat", type=int, default=BENCHMARK_REPEAT, help="測る回数（結果は中央値）")
+    args = parser.parse_args()
+    options = {name: getattr(args, name) for name in ("rows", "users", "days", "meals") if getattr(args, name)}
+    function = BENCHMARKS[args.name]
+    result = {
+        "benchmark": args.name, "environment": _environment(),
+        **run_benchmark(function, _accepted_options(function, options), args.warmup, args.repeat),
+    }
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+        # suiteの結果から、その中の1つのベンチマークとも比べられる
+        if baseline.get("benchmark") != args.name and args.name in baseline:
+            baseline = {**baseline[args.name], "environment": baseline.get("environment", {})}
+        result["comparison"] = compare_results(baseline, result, args.tolerance, args.floor)
+        if result["comparison"]["regressions"]:
+            result["within_budget"] = False
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(result, file, ensure_ascii=False, indent=2)
+    # 予算のあるベンチマークは、超えた場合に終了コード1で終わる（CIで確認できるように）
+    if result.get("within_budget") is False:
+        raise SystemExit(1)
@@ -0,0 +1,26 @@
+#cache_generations.py
+import threading
+from collections import defaultdict
+from typing import Hashable
+
+# ユーザー一覧の世代番号のキー（ユーザーごとの世代番号はuser_idをキーにする）
+USERS = "users"
+
+
+# データが変更されるたびに番号を1つ進める（画面のキャッシュは世代番号をキーに含めるので、進めると読み直される）
+class CacheGenerations:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._generations = defaultdict(int)
+
+    def get(self, key: Hashable) -> int:
+        with self._lock:
+            return self._generations[key]
+
+    def bump(self, *keys: Hashable):
+        with self._lock:
+            for key in keys:
+                self._generations[key] += 1
+
+
+cache_generations = CacheGenerations()
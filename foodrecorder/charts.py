@@ -0,0 +1,176 @@
+#charts.py
+import io
+import threading
+from collections import OrderedDict, namedtuple
+from functools import lru_cache, wraps
+import config
+from metrics import metrics
+
+# 理想のPFC比率（エネルギー比）
+IDEAL_PFC_RATIO = (0.15, 0.25, 0.6)
+
+# PFC比率をこの桁数（%）で丸めてキャッシュのキーにする（グラフの表示と同じ小数第1位）
+RATIO_DECIMALS = 1
+
+# 描画したPNGを保存しておく数
+CHART_CACHE_SIZE = 256
+
+# matplotlibの描画はスレッドセーフではないため、APIのスレッドからの描画は1つずつ行う
+_render_lock = threading.Lock()
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
+
+# 描画したPNGをlru_cacheと同じように保存する（cache_info・cache_clearも同じ）
+# 描画は_render_lockの中で行い、ロックを取った後にもう一度キャッシュを見るので、
+# 同じグラフを同時に求められても描画は1回だけになる
+def _render_cache(maxsize):
+    def decorator(render):
+        cache = OrderedDict()
+        lock = threading.Lock()
+        counts = {"hits": 0, "misses": 0}
+
+        def lookup(key):
+            with lock:
+                png = cache.get(key)
+                if png is not None:
+                    cache.move_to_end(key)
+                    counts["hits"] += 1
+                return png
+
+        @wraps(render)
+        def cached(*args):
+            png = lookup(args)
+            if png is not None:
+                return png
+            with _render_lock:
+                png = lookup(args)
+                if png is not None:
+                    return png
+                png = render(*args)
+                with lock:
+                    counts["misses"] += 1
+                    cache[args] = png
+                    while len(cache) > maxsize:
+                        cache.popitem(last=False)
+            return png
+
+        def cache_info():
+            with lock:
+                return CacheInfo(counts["hits"], counts["misses"], maxsize, len(cache))
+
+        def cache_clear():
+            with lock:
+                cache.clear()
+                counts.update(hits=0, misses=0)
+
+        cached.cache_info = cache_info
+        cached.cache_clear = cache_clear
+        return cached
+    return decorator
+
+
+# タンパク質・脂質・炭水化物の量(g)から、丸めたPFC比率（%）を求める（エネルギーが0のときはNone）
+def rounded_pfc_percentages(protein: float, fat: float, carbohydrate: float):
+    energies = (protein * 4, fat * 9, carbohydrate * 4)
+    total = sum(energies)
+    if total <= 0:
+        return None
+    return tuple(round(energy / total * 100, RATIO_DECIMALS) for energy in energies)
+
+
+# 日本語のフォントを1回だけ探して設定し、使うフォント名を返す（見つからなければNone）
+# findfontは見つからないとフォントの一覧を作り直すため、登録済みのフォント名から探す
+@lru_cache(maxsize=1)
+def configure_fonts():
+    import matplotlib
+    from matplotlib import font_manager
+
+    available = {font.name for font in font_manager.fontManager.ttflist}
+    family = next((name for name in config.CHART_FONT_FAMILIES if name in available), None)
+    if family is not None:
+        matplotlib.rcParams["font.family"] = family
+        matplotlib.rcParams["font.sans-serif"] = [family]
+    matplotlib.rcParams["pdf.fonttype"] = 42  # PDF出力時にフォントを埋め込むための設定
+    return family
+
+
+# matplotlibはグラフを描画するときに初めて読み込む
+def _new_figure(**options):
+    configure_fonts()
+    from matplotlib.figure import Figure
+    return Figure(**options)
+
+
+# 図をPNGに変換する（pyplotを使わないFigureなので、参照がなくなればすぐに解放される）
+def _to_png(figure) -> bytes:
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format="png", bbox_inches="tight")
+    figure.clear()
+    return buffer.getvalue()
+
+
+def _draw_pie(ax, percentages, labels, title=None, **options):
+    ax.pie(percentages, labels=labels, autopct="%1.1f%%", startangle=90, **options)
+    ax.axis("equal")  # アスペクト比を保持して円形に表示
+    if title:
+        ax.set_title(title, fontsize=20)
+
+
+# 栄養素の合計の円グラフ（英語ラベル）
+@_render_cache(maxsize=CHART_CACHE_SIZE)
+def _summary_pie_png(percentages) -> bytes:
+    metrics.inc("foodrecorder_chart_renders_total", chart="summary")
+    with metrics.timer("chart_render_summary"):
+        figure = _new_figure()
+        _draw_pie(figure.subplots(), percentages, ["Protein", "Fat", "Carbohydrate"], explode=(0.03, 0.03, 0.03))
+        return _to_png(figure)
+
+
+# 選択された日のPFC比率と理想のPFC比率を並べた円グラフ
+@_render_cache(maxsize=CHART_CACHE_SIZE)
+def _daily_pfc_png(title: str, percentages) -> bytes:
+    labels = ["タンパク質", "脂質", "炭水化物"]
+    options = {"labeldistance": 1.1, "textprops": {"fontsize": 15}}
+    metrics.inc("foodrecorder_chart_renders_total", chart="daily")
+    with metrics.timer("chart_render_daily"):
+        figure = _new_figure(figsize=(12, 6))
+        ax1, ax2 = figure.subplots(1, 2)
+        _draw_pie(ax1, percentages, labels, title, **options)
+        _draw_pie(ax2, [ratio * 100 for ratio in IDEAL_PFC_RATIO], labels, "理想のPFC比率", **options)
+        return _to_png(figure)
+
+
+# 理想のPFC比率の円グラフ（変わらないので1回だけ描画する）
+@_render_cache(maxsize=1)
+def ideal_pfc_png() -> bytes:
+    metrics.inc("foodrecorder_chart_renders_total", chart="ideal")
+    with metrics.timer("chart_render_ideal"):
+        figure = _new_figure()
+        _draw_pie(figure.subplots(), [ratio * 100 for ratio in IDEAL_PFC_RATIO], ["たんぱく質", "脂質", "炭水化物"],
+                  explode=(0.03, 0.03, 0.03))
+        return _to_png(figure)
+
+
+# 栄養素の合計からPFC比率の円グラフを返す（栄養素がない場合はNone）
+def summary_pie_png(protein: float, fat: float, carbohydrate: float):
+    percentages = rounded_pfc_percentages(protein, fat, carbohydrate)
+    return _summary_pie_png(percentages) if percentages else None
+
+
+def daily_pfc_png(date, protein: float, fat: float, carbohydrate: float):
+    percentages = rounded_pfc_percentages(protein, fat, carbohydrate)
+    return _daily_pfc_png(f"{date}のPFC比率", percentages) if percentages else None
+
+
+# 起動時に変わらないグラフを描画しておく
+def warm():
+    ideal_pfc_png()
+
+
+def cache_info():
+    return {
+        "summary": _summary_pie_png.cache_info()._asdict(),
+        "daily": _daily_pfc_png.cache_info()._asdict(),
+        "ideal": ideal_pfc_png.cache_info()._asdict(),
+    }
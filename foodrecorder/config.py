@@ -0,0 +1,101 @@
+#config.py
+import os
+
+# 栄養素キャッシュの有効期限（秒）
+NUTRIENT_CACHE_TTL_SECONDS = int(os.environ.get("FOODRECORDER_CACHE_TTL_SECONDS", 60 * 60 * 24 * 30))
+
+# 栄養素キャッシュに保存する最大件数（超えた分は古い順に削除）
+NUTRIENT_CACHE_MAX_ENTRIES = int(os.environ.get("FOODRECORDER_CACHE_MAX_ENTRIES", 10000))
+
+# Chromeドライバーのパス
+CHROMEDRIVER_PATH = os.environ.get("FOODRECORDER_CHROMEDRIVER_PATH", "chromedriver.exe")
+
+# 使い回すヘッドレスブラウザの最大数
+DRIVER_POOL_SIZE = int(os.environ.get("FOODRECORDER_DRIVER_POOL_SIZE", 2))
+
+# 1つのブラウザを使い回す回数（超えたら作り直す）
+DRIVER_MAX_USES = int(os.environ.get("FOODRECORDER_DRIVER_MAX_USES", 50))
+
+# 空きブラウザを待つ最大時間（秒）
+DRIVER_CHECKOUT_TIMEOUT = float(os.environ.get("FOODRECORDER_DRIVER_CHECKOUT_TIMEOUT", 30))
+
+# スクレイピングの方法（"http"：ブラウザを使わない、"selenium"：Chromeを使う、"auto"：httpで取れなければChrome）
+SCRAPING_BACKEND = os.environ.get("FOODRECORDER_SCRAPING_BACKEND", "auto")
+
+# 1回の栄養素の検索（HTTP・ブラウザ・再試行をすべて含む）にかけてよい時間（秒）
+SCRAPING_BUDGET_SECONDS = float(os.environ.get("FOODRECORDER_SCRAPING_BUDGET_SECONDS", 20))
+
+# 1回の検索で試す回数（"auto"ではHTTPとブラウザに加えて、ブラウザをこの回数-1回まで試す）
+SCRAPING_MAX_ATTEMPTS = int(os.environ.get("FOODRECORDER_SCRAPING_MAX_ATTEMPTS", 2))
+
+# 検索がこの秒数で終わらなければ、次の方法を並行して始める（0で並行しない）
+SCRAPING_HEDGE_AFTER_SECONDS = float(os.environ.get("FOODRECORDER_SCRAPING_HEDGE_AFTER_SECONDS", 3))
+
+# 並行して検索するスレッドの数と、ブラウザでページが表示されたかを確認する間隔（秒）
+SCRAPING_MAX_PARALLEL = int(os.environ.get("FOODRECORDER_SCRAPING_MAX_PARALLEL", 8))
+SCRAPING_POLL_SECONDS = float(os.environ.get("FOODRECORDER_SCRAPING_POLL_SECONDS", 0.05))
+
+# HTTPでページを取得する際のタイムアウト（秒）と接続プールの大きさ
+HTTP_TIMEOUT = float(os.environ.get("FOODRECORDER_HTTP_TIMEOUT", 10))
+HTTP_POOL_SIZE = int(os.environ.get("FOODRECORDER_HTTP_POOL_SIZE", 10))
+
+# 栄養素をバックグラウンドで取得するスレッド数・再試行回数・再試行までの待ち時間（秒、回数ごとに倍になる）
+ENRICHMENT_WORKERS = int(os.environ.get("FOODRECORDER_ENRICHMENT_WORKERS", 2))
+ENRICHMENT_MAX_ATTEMPTS = int(os.environ.get("FOODRECORDER_ENRICHMENT_MAX_ATTEMPTS", 3))
+ENRICHMENT_BACKOFF_SECONDS = float(os.environ.get("FOODRECORDER_ENRICHMENT_BACKOFF_SECONDS", 2))
+
+# まとめて栄養素を調べる際に同時に実行する数の上限
+BATCH_LOOKUP_MAX_PARALLEL = int(os.environ.get("FOODRECORDER_BATCH_LOOKUP_MAX_PARALLEL", 4))
+
+# 手元の食品成分表（CSVまたはJSON）のパスと、一致とみなす類似度の下限
+FOOD_TABLE_PATH = os.environ.get("FOODRECORDER_FOOD_TABLE_PATH", "food_table.csv")
+FOOD_TABLE_MIN_SCORE = float(os.environ.get("FOODRECORDER_FOOD_TABLE_MIN_SCORE", 0.6))
+# これより短い料理名は食品成分表の完全一致だけを使う（「パン」で「パンケーキ」や「食パン」を返さないように）
+FOOD_TABLE_MIN_QUERY_LENGTH = int(os.environ.get("FOODRECORDER_FOOD_TABLE_MIN_QUERY_LENGTH", 3))
+
+# 非同期API用のデータベースURL（PostgreSQLの場合は postgresql+asyncpg://ユーザー:パスワード@ホスト/データベース名）
+ASYNC_DATABASE_URL = os.environ.get("FOODRECORDER_ASYNC_DATABASE_URL", "sqlite+aiosqlite:///./food_record.db")
+
+# 接続プールの大きさ・上限を超えて作る接続数・空き接続を待つ時間（秒）
+DB_POOL_SIZE = int(os.environ.get("FOODRECORDER_DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.environ.get("FOODRECORDER_DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.environ.get("FOODRECORDER_DB_POOL_TIMEOUT", 30))
+
+# SQLiteの設定（"tuned"：WALなどで読み書きを同時にできるようにする、"default"：SQLiteの初期設定のまま）
+SQLITE_PROFILE = os.environ.get("FOODRECORDER_SQLITE_PROFILE", "tuned")
+
+# ロックが解けるのを待つ時間（ミリ秒）・ページキャッシュ（KiB）・メモリマップの大きさ（バイト）
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("FOODRECORDER_SQLITE_BUSY_TIMEOUT_MS", 5000))
+SQLITE_CACHE_SIZE_KB = int(os.environ.get("FOODRECORDER_SQLITE_CACHE_SIZE_KB", 64 * 1024))
+SQLITE_MMAP_SIZE = int(os.environ.get("FOODRECORDER_SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+
+# この秒数を超えてプールに返されていない接続を、返し忘れ（リーク）の疑いとして報告する
+DB_LEAK_THRESHOLD_SECONDS = float(os.environ.get("FOODRECORDER_DB_LEAK_THRESHOLD_SECONDS", 30))
+
+# 接続を借りた場所（スタックトレース）も記録する（調査用。記録する分だけ遅くなる）
+DB_TRACK_CHECKOUT_STACKS = os.environ.get("FOODRECORDER_DB_TRACK_CHECKOUT_STACKS", "0") == "1"
+
+# グラフの日本語表示に使うフォント（見つかった最初のものを使う。カンマ区切り）
+CHART_FONT_FAMILIES = os.environ.get(
+    "FOODRECORDER_CHART_FONT_FAMILIES", "Yu Gothic,Hiragino Sans,Noto Sans CJK JP,IPAexGothic,TakaoGothic"
+).split(",")
+
+# uvicorn main:app の読み込みにかけてよい時間（ミリ秒、python benchmark.py import_timeで確認）
+IMPORT_TIME_BUDGET_MS = float(os.environ.get("FOODRECORDER_IMPORT_TIME_BUDGET_MS", 1500))
+
+# Streamlitの画面のキャッシュを保持する最大時間（秒）。同じプロセス内の変更はすぐに反映され、APIなど別プロセスからの変更はこの時間内に反映される
+UI_CACHE_TTL_SECONDS = int(os.environ.get("FOODRECORDER_UI_CACHE_TTL_SECONDS", 60))
+
+# メモリ上の日ごとの合計を保持する時間（秒）と最大件数。別プロセスからの変更は、この時間内にデータベースから読み直される
+SUMMARY_CACHE_TTL_SECONDS = int(os.environ.get("FOODRECORDER_SUMMARY_CACHE_TTL_SECONDS", 60))
+SUMMARY_CACHE_MAX_ENTRIES = int(os.environ.get("FOODRECORDER_SUMMARY_CACHE_MAX_ENTRIES", 10000))
+
+# 画面に表示するために食事記録をメモリ上に持っておくユーザーの最大数（超えたら最も前に使ったユーザーから捨てる）
+RECORD_STORE_MAX_USERS = int(os.environ.get("FOODRECORDER_RECORD_STORE_MAX_USERS", 1000))
+
+# 一覧APIの1ページの件数（limitを指定しない場合）と、指定できる上限
+PAGE_SIZE_DEFAULT = int(os.environ.get("FOODRECORDER_PAGE_SIZE_DEFAULT", 100))
+PAGE_SIZE_MAX = int(os.environ.get("FOODRECORDER_PAGE_SIZE_MAX", 10000))
+
+# Streamlitのサイドバーに処理時間などのデバッグ情報を表示する
+DEBUG_PANEL = os.environ.get("FOODRECORDER_DEBUG_PANEL", "0") == "1"
@@ -1,21 +1,15 @@
 from datetime import date
 from typing import List
 from fastapi import HTTPException
-from database import Session
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
 import models
+from metrics import metrics
 
 #Read
-# 全てのユーザーを取得
-def get_all_users(db: Session):
-    return db.query(models.User).all()
-
-# ユーザーのレスポンスモデルのリストを作成
-def create_user_responses(users: List[models.User]):
-    user_responses = []
-    for user in users:
-        user_response = models.UserResponse(id=user.id, username=user.username)
-        user_responses.append(user_response)
-    return user_responses
+# 列だけを取得した行のタプルから、Pydanticの検証を通さずにレスポンスの辞書を作成
+def create_user_responses_from_rows(rows) -> List[dict]:
+    return [row._asdict() for row in rows]
 
 #Create
 def check_existing_user(username: str, db: Session):
@@ -24,6 +18,7 @@ def check_existing_user(username: str, db: Session):
         raise HTTPException(status_code=400, detail="Username already exists")
 
 # ユーザーを作成して保存
+@metrics.timed("crud_create_user")
 def create_and_save_user(user: models.UserCreate, db: Session):
     db_user = models.User(username=user.username)
     db.add(db_user)
@@ -36,12 +31,13 @@ def create_user_response(user: models.User):
     return models.UserResponse(id=user.id, username=user.username)
 
 #Update
-def get_user_by_username(username: str, db: Session):
+def get_user_by_username(username: str, db: Session) -> models.User:
     db_user = db.query(models.User).filter(models.User.username == username).first()
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
     return db_user
 
+@metrics.timed("crud_update_user")
 def update_user_in_db(db_user: models.User, username: str, db: Session):
     db_user.username = username
     db.commit()
@@ -49,24 +45,13 @@ def update_user_in_db(db_user: models.User, username: str, db: Session):
     return db_user
 
 #Delete
-def get_user_by_username(username: str, db: Session) -> models.User:
-    db_user = db.query(models.User).filter(models.User.username == username).first()
-    if not db_user:
-        raise HTTPException(status_code=404, detail="User not found")
-    return db_user
-
+@metrics.timed("crud_delete_user")
 def delete_user_from_db(db: Session, user: models.User):
     db.delete(user)
     db.commit()
 
 #foodrecord_get
-def get_user_by_username(username: str, db: Session) -> models.User:
-    db_user = db.query(models.User).filter(models.User.username == username).first()
-    if not db_user:
-        raise HTTPException(status_code=404, detail="User not found")
-    return db_user
-
-
+@metrics.timed("crud_get_food_records")
 def get_food_records_from_db(db: Session, user: models.User, date: date) -> List[models.FoodRecord]:
     db_food_records = db.query(models.FoodRecord).filter(
         models.FoodRecord.user_id == user.id,
@@ -86,19 +71,18 @@ def create_food_record_responses(db_food_records: List[models.FoodRecord]) -> Li
             energy=db_food_record.energy,
             protein=db_food_record.protein,
             fat=db_food_record.fat,
-            carbohydrate=db_food_record.carbohydrate
+            carbohydrate=db_food_record.carbohydrate,
+            status=db_food_record.status
         )
         food_records.append(food_record)
     return food_records
 
-#foodrecord_create
-def get_user_by_username(username: str, db: Session) -> models.User:
-    db_user = db.query(models.User).filter(models.User.username == username).first()
-    if not db_user:
-        raise HTTPException(status_code=404, detail="User not found")
-    return db_user
-
+# 列だけを取得した行のタプルから、Pydanticの検証を通さずにレスポンスの辞書を作成
+def create_food_record_responses_from_rows(rows) -> List[dict]:
+    return [row._asdict() for row in rows]
 
+#foodrecord_create
+@metrics.timed("crud_create_food_record")
 def create_food_record_in_db(db: Session, user: models.User, food_record: models.FoodRecordCreate, today: date) -> models.FoodRecord:
     db_food_record = models.FoodRecord(
         user_id=user.id,
@@ -108,7 +92,9 @@ def create_food_record_in_db(db: Session, user: models.User, food_record: models
         energy=food_record.energy,
         protein=food_record.protein,
         fat=food_record.fat,
-        carbohydrate=food_record.carbohydrate
+        carbohydrate=food_record.carbohydrate,
+        # 栄養素が指定されていなければ、後からバックグラウンドで取得する
+        status=models.STATUS_COMPLETE if food_record.energy is not None else models.STATUS_PENDING
     )
     db.add(db_food_record)
     db.commit()
@@ -125,5 +111,46 @@ def create_food_record_response(db_food_record: models.FoodRecord) -> models.Foo
         energy=db_food_record.energy,
         protein=db_food_record.protein,
         fat=db_food_record.fat,
-        carbohydrate=db_food_record.carbohydrate
+        carbohydrate=db_food_record.carbohydrate,
+        status=db_food_record.status
     )
+
+
+
+#foodrecord_bulk_create
+# 1トランザクションにまとめて保存する件数
+BULK_CHUNK_SIZE = 1000
+
+def create_food_record_rows(user: models.User, food_records: List[models.FoodRecordCreate], today: date) -> List[dict]:
+    return [
+        {
+            "user_id": user.id,
+            "date": food_record.date or today,
+            "recipe_name": food_record.recipe_name,
+            "servings": food_record.servings,
+            "energy": food_record.energy,
+            "protein": food_record.protein,
+            "fat": food_record.fat,
+            "carbohydrate": food_record.carbohydrate,
+            "status": models.STATUS_COMPLETE if food_record.energy is not None else models.STATUS_PENDING,
+        }
+        for food_record in food_records
+    ]
+
+
+# executemanyでまとめて挿入し、チャンクごとにコミットして採番されたidを返す
+@metrics.timed("crud_bulk_create_food_records")
+def bulk_create_food_records_in_db(db: Session, user: models.User, food_records: List[models.FoodRecordCreate], today: date, chunk_size: int = BULK_CHUNK_SIZE) -> List[int]:
+    rows = create_food_record_rows(user, food_records, today)
+    ids = []
+    statement = insert(models.FoodRecord).returning(models.FoodRecord.id, sort_by_parameter_order=True)
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        ids.extend(db.scalars(statement, chunk).all())
+        # まとめて挿入した分はORMのイベントが呼ばれないので、日ごとの合計をここで更新する
+        deltas = {}
+        for row in chunk:
+            models.merge_delta(deltas, (row["user_id"], row["date"]), models.food_record_delta(row))
+        models.add_to_daily_totals(db.connection(), deltas, db)
+        db.commit()
+    return ids
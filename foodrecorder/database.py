@@ -1,13 +1,42 @@
+from contextlib import contextmanager
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy.orm import sessionmaker
+import config
+from pool_monitor import pool_monitor
+from sqlite_profile import apply_sqlite_profile
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./food_record.db" 
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+engine = apply_sqlite_profile(create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    pool_size=config.DB_POOL_SIZE,
+    max_overflow=config.DB_MAX_OVERFLOW,
+    pool_timeout=config.DB_POOL_TIMEOUT,
+))
+pool_monitor.attach(engine, "sync")
+
+# セッションはすべてここから作る
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
-Session = sessionmaker(bind=engine)
-session = scoped_session(Session)
\ No newline at end of file
+
+# 1回のリクエスト（APIの呼び出し・Streamlitの再実行）の間だけ使うセッション
+# 保存はcrudの関数がコミットし、例外のときはロールバックして、最後に必ず接続をプールに返す
+@contextmanager
+def session_scope():
+    db = SessionLocal()
+    try:
+        yield db
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+# FastAPIの依存関係として使うセッション
+def get_db():
+    with session_scope() as db:
+        yield db
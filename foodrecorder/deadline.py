@@ -0,0 +1,27 @@
+#deadline.py
+import time
+
+
+# 時間内に終わらなかった場合の例外（ページの表示待ち、HTTPのタイムアウト、ブラウザの空き待ち）
+class LookupTimeout(Exception):
+    pass
+
+
+# 1回の検索に使ってよい残り時間（途中の待ち時間やタイムアウトはすべてこの残り時間以内にする）
+class Deadline:
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    # 残り時間とlimitの短い方（残り時間がなければLookupTimeout）
+    def timeout(self, limit: float = None) -> float:
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise LookupTimeout(f"{self.seconds}秒以内に終わりませんでした。")
+        return remaining if limit is None else min(limit, remaining)
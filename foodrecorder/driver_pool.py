@@ -0,0 +1,177 @@
+#driver_pool.py
+import atexit
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict
+import config
+
+
+# 空きブラウザが時間内に見つからなかった場合の例外
+class PoolExhausted(Exception):
+    pass
+
+
+# ヘッドレスChromeを起動する
+def create_chrome_driver():
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service
+
+    options = webdriver.ChromeOptions()
+    options.add_argument("--headless=new")
+    options.add_argument("--disable-gpu")
+    options.add_argument("--no-sandbox")
+    service = Service(config.CHROMEDRIVER_PATH)
+    return webdriver.Chrome(service=service, options=options)
+
+
+# プールで管理するブラウザ1つ分
+class DriverWorker:
+    def __init__(self, driver):
+        self.driver = driver
+        self.uses = 0
+        self.created_at = time.monotonic()
+
+    # ブラウザがまだ応答するかを確認
+    def is_healthy(self) -> bool:
+        try:
+            self.driver.execute_script("return 1")
+            return True
+        except Exception:
+            return False
+
+    def quit(self):
+        try:
+            self.driver.quit()
+        except Exception:
+            pass
+
+
+# 起動済みのブラウザを使い回すプール
+class DriverPool:
+    def __init__(self, factory: Callable = create_chrome_driver,
+                 max_size: int = config.DRIVER_POOL_SIZE,
+                 max_uses: int = config.DRIVER_MAX_USES,
+                 checkout_timeout: float = config.DRIVER_CHECKOUT_TIMEOUT):
+        self.factory = factory
+        self.max_size = max_size
+        self.max_uses = max_uses
+        self.checkout_timeout = checkout_timeout
+        self._idle = []
+        self._size = 0
+        self._waiting = 0
+        self._condition = threading.Condition()
+        self._counters = {
+            "created": 0,
+            "recycled": 0,
+            "unhealthy": 0,
+            "checkouts": 0,
+            "timeouts": 0,
+            "max_waiting": 0,
+        }
+
+    # 空いているブラウザを借りる（なければ起動、上限なら空くまで待つ）
+    def checkout(self, timeout: float = None) -> DriverWorker:
+        timeout = self.checkout_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._condition:
+                if not self._idle and self._size >= self.max_size:
+                    self._wait_for_worker(deadline, timeout)
+
+                if self._idle:
+                    worker = self._idle.pop()
+                else:
+                    worker = None
+                    self._size += 1
+
+            if worker is None:
+                try:
+                    worker = DriverWorker(self.factory())
+                except Exception:
+                    self._discard(None)
+                    raise
+                with self._condition:
+                    self._counters["created"] += 1
+            elif not worker.is_healthy():
+                with self._condition:
+                    self._counters["unhealthy"] += 1
+                self._discard(worker)
+                continue
+
+            with self._condition:
+                self._counters["checkouts"] += 1
+            return worker
+
+    # 空きが出るまで待つ（呼び出し元で_conditionを取得済み）
+    def _wait_for_worker(self, deadline: float, timeout: float):
+        self._waiting += 1
+        self._counters["max_waiting"] = max(self._counters["max_waiting"], self._waiting)
+        try:
+            while not self._idle and self._size >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._counters["timeouts"] += 1
+                    raise PoolExhausted(f"{timeout}秒以内に空きブラウザがありませんでした。")
+                self._condition.wait(remaining)
+        finally:
+            self._waiting -= 1
+
+    # 借りたブラウザを返す（使用回数の上限に達したか、壊れていれば作り直す）
+    def checkin(self, worker: DriverWorker, healthy: bool = True):
+        worker.uses += 1
+        if not healthy:
+            with self._condition:
+                self._counters["unhealthy"] += 1
+            self._discard(worker)
+        elif worker.uses >= self.max_uses:
+            with self._condition:
+                self._counters["recycled"] += 1
+            self._discard(worker)
+        else:
+            with self._condition:
+                self._idle.append(worker)
+                self._condition.notify()
+
+    def _discard(self, worker):
+        if worker is not None:
+            worker.quit()
+        with self._condition:
+            self._size -= 1
+            self._condition.notify()
+
+    # with文でブラウザを借りて、終わったら返す
+    @contextmanager
+    def driver(self, timeout: float = None):
+        worker = self.checkout(timeout)
+        healthy = True
+        try:
+            yield worker.driver
+        except Exception:
+            healthy = worker.is_healthy()
+            raise
+        finally:
+            self.checkin(worker, healthy)
+
+    # プールの状態（待ち行列の長さなど）
+    def metrics(self) -> Dict[str, int]:
+        with self._condition:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "waiting": self._waiting,
+                **self._counters,
+            }
+
+    # 待機中のブラウザをすべて終了
+    def close(self):
+        with self._condition:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+        for worker in idle:
+            worker.quit()
+
+
+driver_pool = DriverPool()
+atexit.register(driver_pool.close)
@@ -0,0 +1,241 @@
+#enrichment.py
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+import config, models, scraping
+from cache_generations import cache_generations
+from database import session_scope
+from metrics import metrics
+
+
+# 登録済みの食事記録に、バックグラウンドで栄養素の値を書き込む
+class EnrichmentQueue:
+    def __init__(self, lookup: Callable = scraping.lookup_nutrients,
+                 max_workers: int = config.ENRICHMENT_WORKERS,
+                 max_attempts: int = config.ENRICHMENT_MAX_ATTEMPTS,
+                 backoff_seconds: float = config.ENRICHMENT_BACKOFF_SECONDS):
+        self.lookup = lookup
+        self.max_workers = max_workers
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self._executor = None
+        self._lock = threading.Lock()
+        self._timers = set()
+        # 再試行しても取得できなかった記録（id: 最後のエラー）
+        self.dead_letters: Dict[int, str] = {}
+        self.counters = {"submitted": 0, "completed": 0, "retried": 0, "failed": 0}
+        # 登録されてから、保存・failed・取得不要のどれかになるまでの記録の数（再試行を待っている記録も含む）
+        self._outstanding = 0
+        # このキューが取得中にした記録のid（終了時に取得待ちに戻す）
+        self._claimed = set()
+        self._idle = threading.Condition(self._lock)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="enrichment")
+            return self._executor
+
+    # 栄養素を取得する記録を登録する
+    def submit(self, record_id: int, attempt: int = 1):
+        with self._lock:
+            if attempt == 1:
+                self.counters["submitted"] += 1
+                self._outstanding += 1
+        return self._get_executor().submit(self._enrich, record_id, attempt)
+
+    def _enrich(self, record_id: int, attempt: int):
+        try:
+            self._enrich_record(record_id, attempt)
+        except Exception:
+            # データベースのエラーなどで途中で終わった記録も、待っている数からは外す（取得中のまま残る）
+            self._finished()
+            raise
+
+    def _enrich_record(self, record_id: int, attempt: int):
+        with session_scope() as db:
+            # 最初の試行で取得待ちの記録を取得中にする（別のプロセス・スレッドが先に取得中にした記録や、取得不要の記録は何もしない）
+            if attempt == 1 and not self._claim(db, record_id):
+                self._finished()
+                return
+            record = db.get(models.FoodRecord, record_id)
+            if record is None or record.status != models.STATUS_ENRICHING:
+                self._release(record_id)
+                self._finished()
+                return
+            recipe_name, servings = record.recipe_name, record.servings
+
+        try:
+            with metrics.timer("enrichment_lookup"):
+                result = self.lookup(recipe_name)
+        except Exception as error:
+            self._retry_or_fail(record_id, attempt, str(error))
+            return
+        if not result.found:
+            # 料理が見つからない場合などは、再試行しても変わらないのですぐにfailedにする
+            self._retry_or_fail(record_id, attempt, result.message, retryable=result.retryable)
+            return
+        amounts = result.amounts
+
+        with session_scope() as db:
+            # まだ取得中のままの場合だけ保存する（削除された・別のプロセスが書き込んだ記録は上書きしない）
+            if not self._set_status(db, record_id, models.STATUS_COMPLETE):
+                self._release(record_id)
+                self._finished()
+                return
+            record = db.get(models.FoodRecord, record_id)
+            # 食べた分の栄養素量を計算して保存
+            for field, amount in amounts.items():
+                setattr(record, field, amount * servings)
+            db.commit()
+            # このユーザーの画面のキャッシュを読み直させる
+            cache_generations.bump(record.user_id)
+
+        with self._lock:
+            self.counters["completed"] += 1
+            self.dead_letters.pop(record_id, None)
+            self._claimed.discard(record_id)
+        self._finished()
+
+    # 取得待ちの記録を取得中にする（UPDATEの条件で確認するので、同時に呼ばれても取得中にできるのは1回だけ）
+    def _claim(self, db, record_id: int) -> bool:
+        claimed = db.query(models.FoodRecord).filter(
+            models.FoodRecord.id == record_id, models.FoodRecord.status == models.STATUS_PENDING
+        ).update({models.FoodRecord.status: models.STATUS_ENRICHING}, synchronize_session=False)
+        db.commit()
+        if claimed:
+            with self._lock:
+                self._claimed.add(record_id)
+        return bool(claimed)
+
+    # 取得中の記録の状態を変える（取得中でなくなっていればFalse。コミットは呼び出し元で行う）
+    def _set_status(self, db, record_id: int, status: str) -> bool:
+        return bool(db.query(models.FoodRecord).filter(
+            models.FoodRecord.id == record_id, models.FoodRecord.status == models.STATUS_ENRICHING
+        ).update({models.FoodRecord.status: status}, synchronize_session=False))
+
+    def _release(self, record_id: int):
+        with self._lock:
+            self._claimed.discard(record_id)
+
+    # 待ち時間を倍にしながら再試行し、上限を超えたらfailedにする
+    def _retry_or_fail(self, record_id: int, attempt: int, error: str, retryable: bool = True):
+        if retryable and attempt < self.max_attempts:
+            delay = self.backoff_seconds * (2 ** (attempt - 1))
+            timer = threading.Timer(delay, self._resubmit, args=(record_id, attempt + 1))
+            timer.daemon = True
+            with self._lock:
+                self.counters["retried"] += 1
+                self._timers.add(timer)
+            timer.start()
+            return
+
+        with session_scope() as db:
+            # 取得中のままの場合だけfailedにする（その間に別のプロセスが保存した値は残す）
+            failed = self._set_status(db, record_id, models.STATUS_FAILED)
+            if failed:
+                user_id = db.query(models.FoodRecord.user_id).filter(models.FoodRecord.id == record_id).scalar()
+                db.commit()
+                cache_generations.bump(user_id)
+
+        with self._lock:
+            if failed:
+                self.counters["failed"] += 1
+                self.dead_letters[record_id] = error
+            self._claimed.discard(record_id)
+        self._finished()
+
+    def _finished(self):
+        with self._idle:
+            self._outstanding -= 1
+            if self._outstanding <= 0:
+                self._idle.notify_all()
+
+    # 登録した記録がすべて終わるまで待つ（再試行の待ち時間も含む。timeout秒で終わらなければFalse）
+    def wait(self, timeout: float = None) -> bool:
+        with self._idle:
+            return self._idle.wait_for(lambda: self._outstanding <= 0, timeout)
+
+    def _resubmit(self, record_id: int, attempt: int):
+        with self._lock:
+            self._timers = {timer for timer in self._timers if timer.is_alive() and timer is not threading.current_thread()}
+        self.submit(record_id, attempt)
+
+    # 指定した状態の記録をまとめて登録し直す（取得待ち以外の記録は取得待ちに戻してから登録する）
+    def _submit_by_status(self, *statuses: str) -> List[int]:
+        with session_scope() as db:
+            rows = db.query(models.FoodRecord.id, models.FoodRecord.user_id, models.FoodRecord.status).filter(
+                models.FoodRecord.status.in_(statuses)
+            ).all()
+            record_ids = [record_id for record_id, _, _ in rows]
+            reset = [(record_id, user_id) for record_id, user_id, status in rows if status != models.STATUS_PENDING]
+            if reset:
+                db.query(models.FoodRecord).filter(models.FoodRecord.id.in_([record_id for record_id, _ in reset])).update(
+                    {models.FoodRecord.status: models.STATUS_PENDING}, synchronize_session=False
+                )
+                db.commit()
+                cache_generations.bump(*{user_id for _, user_id in reset})
+
+        for record_id in record_ids:
+            self.submit(record_id)
+        return record_ids
+
+    # 起動時に、取得待ちのまま残っている記録を再開する
+    # （APIと画面のプロセスが両方呼んでも、それぞれの記録を取得するのはどちらか一方だけ）
+    # include_enriching=Trueの場合は、取得中のままプロセスが止まった記録も取得待ちに戻して再開する
+    # （動いているプロセスが取得中の記録も対象になるので、サーバーを止めてから使う）
+    def resume_pending(self, include_enriching: bool = False) -> List[int]:
+        if include_enriching:
+            return self._submit_by_status(models.STATUS_PENDING, models.STATUS_ENRICHING)
+        return self._submit_by_status(models.STATUS_PENDING)
+
+    # failedになった記録をもう一度取得する
+    def retry_failed(self) -> List[int]:
+        return self._submit_by_status(models.STATUS_FAILED)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.counters, dead_letters=len(self.dead_letters), scheduled_retries=len(self._timers))
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            timers, self._timers = self._timers, set()
+            executor, self._executor = self._executor, None
+        for timer in timers:
+            timer.cancel()
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+        # 取得し終わらなかった記録は取得待ちに戻し、次の起動時に取得し直す
+        with self._lock:
+            claimed, self._claimed = self._claimed, set()
+        if claimed:
+            with session_scope() as db:
+                db.query(models.FoodRecord).filter(
+                    models.FoodRecord.id.in_(claimed), models.FoodRecord.status == models.STATUS_ENRICHING
+                ).update({models.FoodRecord.status: models.STATUS_PENDING}, synchronize_session=False)
+                db.commit()
+
+
+enrichment_queue = EnrichmentQueue()
+
+
+# failedになった記録をもう一度取得する（python enrichment.py retry）
+# 取得待ち・取得中のまま残っている記録を再開する（python enrichment.py resume。サーバーを止めてから実行する）
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="食事記録の栄養素を取得し直す")
+    parser.add_argument("command", choices=["retry", "resume"])
+    args = parser.parse_args()
+
+    if args.command == "retry":
+        record_ids = enrichment_queue.retry_failed()
+    else:
+        record_ids = enrichment_queue.resume_pending(include_enriching=True)
+    enrichment_queue.wait()
+    enrichment_queue.shutdown()
+    stats = enrichment_queue.stats()
+    print(f"{len(record_ids)}件の記録のうち、{stats['completed']}件の栄養素を取得しました（failed: {stats['failed']}件）。")
+    for record_id, error in sorted(enrichment_queue.dead_letters.items()):
+        print(f"id={record_id}: {error}")
+    raise SystemExit(1 if stats["failed"] else 0)
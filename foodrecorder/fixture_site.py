@@ -0,0 +1,183 @@
+#fixture_site.py
+import math
+import os
+import random
+import threading
+import time
+from urllib.parse import parse_qs, urljoin, urlsplit
+
+
+# 保存済みのeatsmartのページ（テストとベンチマークで、通信せずにスクレイピングを試す。tests/がなくても使えるようにアプリと同じ場所に置く）
+FIXTURE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "eatsmart")
+
+# 検索語ごとに返すページ（1件だけ見つかる料理は栄養素のページが直接返る。ない検索語は0件のページ）
+FIXTURE_SEARCH_PAGES = {"カレーライス": "search_curry.html", "カレーうどん": "search_curry.html", "親子丼": "detail_oyakodon.html"}
+FIXTURE_DETAIL_PAGES = {
+    "/do/caloriecheck/detail/param/foodCode/1": "detail_curry_rice.html",
+    "/do/caloriecheck/detail/param/foodCode/2": "detail_curry_udon.html",
+    "/do/caloriecheck/detail/param/foodCode/3": "detail_oyakodon.html",
+}
+
+
+# 保存済みのページを、決まった分布の待ち時間で返すサイト（slow_rateの割合でslow_seconds秒遅くなる）
+class FixtureSite:
+    def __init__(self, page_seconds=0.1, slow_rate=0.0, slow_seconds=3.0, seed=0):
+        self.page_seconds = page_seconds
+        self.slow_rate = slow_rate
+        self.slow_seconds = slow_seconds
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._pages = {}
+        for name in os.listdir(FIXTURE_DIRECTORY):
+            with open(os.path.join(FIXTURE_DIRECTORY, name), "rb") as file:
+                self._pages[name] = file.read()
+
+    def latency(self) -> float:
+        with self._lock:
+            seconds = self._rng.lognormvariate(math.log(self.page_seconds), 0.3)
+            return seconds + (self.slow_seconds if self._rng.random() < self.slow_rate else 0)
+
+    def page(self, url) -> bytes:
+        parts = urlsplit(url)
+        if parts.path.endswith("/index"):
+            name = "index.html"
+        elif parts.path.endswith("/search"):
+            name = FIXTURE_SEARCH_PAGES.get(parse_qs(parts.query).get("searchKey", [""])[0], "no_results.html")
+        else:
+            name = FIXTURE_DETAIL_PAGES.get(parts.path, "no_results.html")
+        return self._pages[name]
+
+
+class _FixtureResponse:
+    def __init__(self, url, content):
+        self.url = url
+        self.content = content
+        self.status_code = 200
+
+    def raise_for_status(self):
+        pass
+
+
+# requests.Sessionの代わり（HttpScraperに渡す）
+class FixtureSession:
+    def __init__(self, site: FixtureSite):
+        self.site = site
+
+    def get(self, url, timeout=None, **kwargs):
+        import requests
+
+        latency = self.site.latency()
+        if timeout is not None and latency > timeout:
+            time.sleep(timeout)
+            raise requests.exceptions.ReadTimeout(f"{url}: read timed out")
+        time.sleep(latency)
+        return _FixtureResponse(url, self.site.page(url))
+
+
+# ChromeのWebDriverの代わり（使う操作だけ）。リンクやボタンのクリックでの移動は、本物と同じく待たずに戻る
+class FixtureDriver:
+    def __init__(self, site: FixtureSite):
+        self.site = site
+        self.page_load_timeout = 300
+        self.current_url = None
+        self.generation = 0
+        self.typed = ""
+        self._source = ""
+        self._document = None
+        self._pending = None
+
+    def _load(self, url):
+        import lxml.html
+
+        self.current_url = url
+        self.typed = ""
+        self._source = self.site.page(url).decode("utf-8")
+        self._document = lxml.html.fromstring(self._source)
+        self.generation += 1
+
+    # 移動中のページが表示される時刻になっていれば切り替える
+    def advance(self):
+        if self._pending is not None and time.monotonic() >= self._pending[0]:
+            url, self._pending = self._pending[1], None
+            self._load(url)
+
+    def navigate(self, url):
+        self._pending = (time.monotonic() + self.site.latency(), url)
+
+    def set_page_load_timeout(self, seconds):
+        self.page_load_timeout = seconds
+
+    def get(self, url):
+        from selenium.common.exceptions import TimeoutException
+
+        latency = self.site.latency()
+        if latency > self.page_load_timeout:
+            time.sleep(self.page_load_timeout)
+            raise TimeoutException(f"{url}: page load timed out")
+        time.sleep(latency)
+        self._pending = None
+        self._load(url)
+
+    def execute_script(self, script, *args):
+        self.advance()
+        return "complete"
+
+    def find_elements(self, by, value):
+        self.advance()
+        return [FixtureElement(self, node) for node in self._document.xpath(value)]
+
+    def find_element(self, by, value):
+        from selenium.common.exceptions import NoSuchElementException
+
+        elements = self.find_elements(by, value)
+        if not elements:
+            raise NoSuchElementException(value)
+        return elements[0]
+
+    @property
+    def page_source(self):
+        self.advance()
+        return self._source
+
+    def quit(self):
+        pass
+
+
+class FixtureElement:
+    def __init__(self, driver: FixtureDriver, node):
+        self.driver = driver
+        self.node = node
+        self.generation = driver.generation
+
+    # 別のページに移動した後の要素は使えない
+    def _check(self):
+        from selenium.common.exceptions import StaleElementReferenceException
+
+        self.driver.advance()
+        if self.generation != self.driver.generation:
+            raise StaleElementReferenceException("element is not attached to the page document")
+
+    def is_displayed(self):
+        self._check()
+        return True
+
+    def is_enabled(self):
+        self._check()
+        return True
+
+    @property
+    def text(self):
+        self._check()
+        return self.node.text_content()
+
+    def send_keys(self, text):
+        self._check()
+        self.driver.typed += text
+
+    def click(self):
+        self._check()
+        if self.node.tag == "a":
+            self.driver.navigate(urljoin(self.driver.current_url, self.node.get("href")))
+            return
+        form = next(self.node.iterancestors("form"))
+        self.driver.navigate(f"{urljoin(self.driver.current_url, form.get('action'))}?searchKey={self.driver.typed}")
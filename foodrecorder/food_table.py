@@ -0,0 +1,151 @@
+#food_table.py
+import bisect
+import csv
+import heapq
+import json
+import os
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from itertools import chain
+from typing import Dict, List, NamedTuple, Tuple
+import config
+
+
+# 食品成分表の1行（1人分の栄養素値）
+class FoodEntry(NamedTuple):
+    name: str
+    reading: str
+    energy: float
+    protein: float
+    fat: float
+    carbohydrate: float
+
+
+# 検索用に正規化（全角/半角をそろえ、カタカナはひらがなに、空白や記号は取り除く）
+def normalize_for_search(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    text = "".join(chr(ord(char) - 0x60) if "ァ" <= char <= "ヶ" else char for char in text)
+    return re.sub(r"[\s・･、，,.。()（）「」]+", "", text)
+
+
+# 2文字ずつに区切る（1文字の場合はそのまま）
+def _bigrams(text: str) -> List[str]:
+    if len(text) < 2:
+        return [text] if text else []
+    return [text[i:i + 2] for i in range(len(text) - 1)]
+
+
+# スクレイピング結果と同じ形の辞書に変換
+def to_nutrient_data(entry: FoodEntry) -> Dict[str, str]:
+    return {
+        "エネルギー": f"{entry.energy}kcal",
+        "たんぱく質": f"{entry.protein}g",
+        "脂質": f"{entry.fat}g",
+        "炭水化物": f"{entry.carbohydrate}g",
+    }
+
+
+# メモリ上の食品成分表と検索用のインデックス
+class FoodTable:
+    def __init__(self, entries: List[FoodEntry] = ()):
+        self.entries: List[FoodEntry] = []
+        self._exact = defaultdict(set)
+        self._sorted_keys: List[Tuple[str, int]] = []
+        self._bigram_index = defaultdict(set)
+        self._bigram_counts: Dict[Tuple[int, str], int] = {}
+        self.add_entries(entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    # 料理名と読みがなの両方をインデックスに登録
+    def add_entries(self, entries: List[FoodEntry]):
+        for entry in entries:
+            entry_id = len(self.entries)
+            self.entries.append(entry)
+            for key in {normalize_for_search(entry.name), normalize_for_search(entry.reading)}:
+                if not key:
+                    continue
+                self._exact[key].add(entry_id)
+                self._sorted_keys.append((key, entry_id))
+                grams = _bigrams(key)
+                self._bigram_counts[(entry_id, key)] = len(grams)
+                for gram in grams:
+                    self._bigram_index[gram].add((entry_id, key))
+        self._sorted_keys.sort()
+
+    # 似ている順に候補を返す（完全一致 > 前方一致 > 2文字単位の類似度）
+    # 前方一致の類似度は料理名のうち一致した文字の割合で決める（「パン」と「パンケーキ」は0.36）
+    # min_query_length文字より短い名前は完全一致だけを探す
+    def search(self, query: str, limit: int = 5,
+               min_query_length: int = config.FOOD_TABLE_MIN_QUERY_LENGTH) -> List[Tuple[FoodEntry, float]]:
+        normalized = normalize_for_search(query)
+        if not normalized:
+            return []
+        scores: Dict[int, float] = {}
+
+        for entry_id in self._exact.get(normalized, ()):
+            scores[entry_id] = 1.0
+        # 前方一致・類似度は1.0未満なので、完全一致だけで足りる場合はそれ以上探さない
+        if len(normalized) < min_query_length or len(scores) >= limit:
+            return [(self.entries[entry_id], 1.0) for entry_id in sorted(scores)[:limit]]
+
+        position = bisect.bisect_left(self._sorted_keys, (normalized, -1))
+        while position < len(self._sorted_keys) and self._sorted_keys[position][0].startswith(normalized):
+            key, entry_id = self._sorted_keys[position]
+            score = 0.9 * len(normalized) / len(key)
+            scores[entry_id] = max(scores.get(entry_id, 0), score)
+            position += 1
+
+        # 共通する2文字の数を数える（候補が多くなるので、数えるのはCounterに任せる）
+        query_grams = set(_bigrams(normalized))
+        matches = Counter(chain.from_iterable(self._bigram_index.get(gram, ()) for gram in query_grams))
+        bigram_counts = self._bigram_counts
+        for candidate, common in matches.items():
+            score = 1.8 * common / (len(query_grams) + bigram_counts[candidate])
+            entry_id = candidate[0]
+            if score > scores.get(entry_id, 0):
+                scores[entry_id] = score
+
+        ranked = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        return [(self.entries[entry_id], round(score, 3)) for entry_id, score in ranked]
+
+    # 類似度が下限以上の一番近い食品を返す（なければNone）
+    def best_match(self, query: str, min_score: float = config.FOOD_TABLE_MIN_SCORE):
+        candidates = self.search(query, limit=1)
+        if candidates and candidates[0][1] >= min_score:
+            return candidates[0][0]
+        return None
+
+    # CSV（name, reading, energy, protein, fat, carbohydrate の列）またはJSON（同じキーのリスト）から読み込む
+    @classmethod
+    def load(cls, path: str) -> "FoodTable":
+        with open(path, encoding="utf-8-sig") as file:
+            if path.lower().endswith(".json"):
+                rows = json.load(file)
+            else:
+                rows = list(csv.DictReader(file))
+
+        entries = [
+            FoodEntry(
+                name=row["name"],
+                reading=row.get("reading") or "",
+                energy=float(row["energy"]),
+                protein=float(row["protein"]),
+                fat=float(row["fat"]),
+                carbohydrate=float(row["carbohydrate"]),
+            )
+            for row in rows
+        ]
+        return cls(entries)
+
+
+# 設定されたファイルがあれば読み込む（なければ空の表）
+def load_default_table() -> FoodTable:
+    if config.FOOD_TABLE_PATH and os.path.exists(config.FOOD_TABLE_PATH):
+        return FoodTable.load(config.FOOD_TABLE_PATH)
+    return FoodTable()
+
+
+food_table = load_default_table()
@@ -0,0 +1,149 @@
+#http_scraping.py
+import importlib.util
+import threading
+from typing import Dict
+from urllib.parse import urljoin, urlencode
+import config
+from deadline import Deadline, LookupTimeout
+from metrics import metrics
+
+EATSMART_INDEX_URL = "https://www.eatsmart.jp/do/caloriecheck/index"
+
+# lxmlが入っていれば高速なパーサーを使う（読み込みは実際に解析するときまで遅らせる）
+HTML_PARSER = "lxml" if importlib.util.find_spec("lxml") else "html.parser"
+
+
+def _soup(html):
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(html, HTML_PARSER)
+
+
+# 栄養素のページから「栄養素名: 値」の辞書を作成
+@metrics.timed("scrape_parse")
+def parse_nutrient_page(html) -> Dict[str, str]:
+    soup = _soup(html)
+
+    # エネルギー、タンパク質、脂質、炭水化物の値を取得
+    nutrients = soup.select("td.item > a")
+    values = soup.select("td.capa")
+
+    data = {}
+    for nutrient, value in zip(nutrients, values):
+        data[nutrient.text.strip()] = value.text.strip()
+    return data
+
+
+# 検索結果から料理名を含む一番上のリンクを探す
+def find_top_result_url(html, recipe_name: str, base_url: str):
+    soup = _soup(html)
+    for link in soup.find_all("a", href=True):
+        if recipe_name in link.get_text():
+            return urljoin(base_url, link["href"])
+    return None
+
+
+# 検索フォームの送信先と、一緒に送る値を取り出す
+def parse_search_form(html, base_url: str):
+    soup = _soup(html)
+    search_input = soup.find("input", attrs={"name": "searchKey"})
+    form = search_input.find_parent("form") if search_input else None
+    if form is None:
+        return None
+
+    fields = {}
+    for field in form.find_all("input"):
+        name = field.get("name")
+        if name and field.get("type") not in ("image", "submit") and name != "searchKey":
+            fields[name] = field.get("value", "")
+    return {
+        "action": urljoin(base_url, form.get("action") or base_url),
+        "method": (form.get("method") or "get").lower(),
+        "fields": fields,
+        "encoding": soup.original_encoding or "utf-8",
+    }
+
+
+# ブラウザを使わずにHTTPだけでeatsmartを検索する
+class HttpScraper:
+    def __init__(self, index_url: str = EATSMART_INDEX_URL, session=None,
+                 timeout: float = config.HTTP_TIMEOUT):
+        self.index_url = index_url
+        self.timeout = timeout
+        self._session = session
+        self._search_form = None
+        self._lock = threading.Lock()
+
+    # Keep-Aliveで接続を使い回すセッション
+    @property
+    def session(self):
+        if self._session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=config.HTTP_POOL_SIZE, pool_maxsize=config.HTTP_POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            self._session = session
+        return self._session
+
+    # 1回のリクエストのタイムアウト（検索の残り時間があれば、それより長くしない）
+    def _timeout(self, deadline: Deadline = None) -> float:
+        return self.timeout if deadline is None else deadline.timeout(self.timeout)
+
+    def _get(self, url: str, deadline: Deadline = None, **kwargs):
+        response = self.session.get(url, timeout=self._timeout(deadline), **kwargs)
+        response.raise_for_status()
+        return response
+
+    # 検索フォームは一度だけ読み込んで使い回す
+    def search_form(self, deadline: Deadline = None):
+        with self._lock:
+            if self._search_form is None:
+                response = self._get(self.index_url, deadline)
+                self._search_form = parse_search_form(response.content, response.url)
+            return self._search_form
+
+    @metrics.timed("scrape_http_search")
+    def search(self, recipe_name: str, deadline: Deadline = None):
+        form = self.search_form(deadline)
+        if form is None:
+            return None
+        fields = dict(form["fields"], searchKey=recipe_name)
+        body = urlencode(fields, encoding=form["encoding"])
+        if form["method"] == "post":
+            response = self.session.post(
+                form["action"], data=body, timeout=self._timeout(deadline),
+                headers={"Content-Type": "application/x-www-form-urlencoded"},
+            )
+            response.raise_for_status()
+        else:
+            response = self._get(f"{form['action']}?{body}", deadline)
+        return response
+
+    # 料理名から1人分の栄養素値を取得（見つからなければ空の辞書、時間切れはLookupTimeout）
+    def fetch_nutrient_values(self, recipe_name: str, deadline: Deadline = None) -> Dict[str, str]:
+        import requests
+
+        try:
+            search_response = self.search(recipe_name, deadline)
+            if search_response is None:
+                return {}
+
+            # 検索結果が1件だけの場合は栄養素のページが直接返ってくる
+            data = parse_nutrient_page(search_response.content)
+            if data:
+                return data
+
+            detail_url = find_top_result_url(search_response.content, recipe_name, search_response.url)
+            if detail_url is None:
+                return {}
+
+            with metrics.timer("scrape_http_detail"):
+                response = self._get(detail_url, deadline)
+            return parse_nutrient_page(response.content)
+        except requests.exceptions.Timeout as error:
+            raise LookupTimeout(f"{recipe_name}: ページの取得が時間内に終わりませんでした。") from error
+
+
+http_scraper = HttpScraper()
@@ -1,311 +1,198 @@
 #main.py
-import threading
-from matplotlib import pyplot as plt
-import matplotlib.font_manager as fm
-from sqlalchemy import func
-import streamlit as st
-from fastapi import APIRouter, Depends, FastAPI
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
 from datetime import date
-from typing import List
-import crud, models
-from database import Base, Session, session, engine, SessionLocal
+from typing import List, Literal, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+import async_crud, batch_lookup, charts, config, crud, migrations, models, pagination, record_io, trends
+from async_database import async_engine, get_async_db
+from database import get_db
+from driver_pool import driver_pool
+from metrics import MetricsMiddleware, metrics
+from nutrient_cache import nutrient_cache
+from pool_monitor import pool_monitor
+from responses import FastJSONResponse
+from scraping import nutrient_scraper
+from enrichment import enrichment_queue
+from summary_accumulator import summary_accumulator
 
 
 app = FastAPI()
-
-# データベースセッションの依存関係
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+app.add_middleware(MetricsMiddleware)
 
 # ユーザー関連のルーター
-user_router = APIRouter()
+user_router = APIRouter(default_response_class=FastJSONResponse)
 
+# id順にlimit件ずつ返し、続きがあればLinkヘッダーに次のページのURL（cursor付き）を入れる
 @user_router.get("/", response_model=List[models.UserResponse])
-def get_users(db: Session = Depends(get_db)):
-    db_users = crud.get_all_users(db)
-    return crud.create_user_responses(db_users)
+async def get_users(request: Request,
+                    limit: int = Query(config.PAGE_SIZE_DEFAULT, ge=1, le=config.PAGE_SIZE_MAX),
+                    cursor: Optional[str] = None, db: AsyncSession = Depends(get_async_db)):
+    rows = await async_crud.get_users_page(db, pagination.decode_cursor(cursor), limit)
+    rows, next_cursor = pagination.split_page(rows, limit)
+    # response_modelはドキュメント用で、返す値は検証せずにそのままJSONにする
+    response = FastJSONResponse(crud.create_user_responses_from_rows(rows))
+    pagination.set_next_link(request, response, next_cursor)
+    return response
 
 @user_router.post("/", response_model=models.UserResponse)
-def create_user(user: models.UserCreate, db: Session = Depends(get_db)):
-    crud.check_existing_user(user.username, db)
-    db_user = crud.create_and_save_user(user, db)
+async def create_user(user: models.UserCreate, db: AsyncSession = Depends(get_async_db)):
+    await async_crud.check_existing_user(user.username, db)
+    db_user = await async_crud.create_and_save_user(user, db)
     return crud.create_user_response(db_user)
 
 @user_router.put("/{username}/", response_model=models.UserResponse)
-def update_user(username: str, user: models.UserCreate, db: Session = Depends(get_db)):
-    db_user = crud.get_user_by_username(username, db)
-    db_user = crud.update_user_in_db(db_user, user.username, db)
+async def update_user(username: str, user: models.UserCreate, db: AsyncSession = Depends(get_async_db)):
+    db_user = await async_crud.get_user_by_username(username, db)
+    db_user = await async_crud.update_user_in_db(db_user, user.username, db)
     return models.UserResponse(id=db_user.id, username=db_user.username)
 
-from fastapi import HTTPException
-
 @user_router.delete("/{username}/", response_model=models.UserResponse)
-def delete_user(username: str, db: Session = Depends(get_db)):
-    db_user = crud.get_user_by_username(username, db)
-    crud.delete_user_from_db(db, db_user)
+async def delete_user(username: str, db: AsyncSession = Depends(get_async_db)):
+    db_user = await async_crud.get_user_by_username(username, db)
+    await async_crud.delete_user_from_db(db, db_user)
     return models.UserResponse(id=db_user.id, username=db_user.username)
 
 app.include_router(user_router, tags=["Users"], prefix="/users")
 
 # 食事関連のルーター
-food_router = APIRouter()
+food_router = APIRouter(default_response_class=FastJSONResponse)
 
+# その日の記録を返す（ユーザー一覧と同じくlimit・cursorでページ分けする）
 @food_router.get("/{username}/food_records/", response_model=List[models.FoodRecordResponse])
-def get_food_records(username: str, date: date, db: Session = Depends(get_db)):
-    db_user = crud.get_user_by_username(username, db)
-    db_food_records = crud.get_food_records_from_db(db, db_user, date)
-    food_records = crud.create_food_record_responses(db_food_records)
-    return food_records
+async def get_food_records(username: str, date: date, request: Request,
+                           limit: int = Query(config.PAGE_SIZE_DEFAULT, ge=1, le=config.PAGE_SIZE_MAX),
+                           cursor: Optional[str] = None, db: AsyncSession = Depends(get_async_db)):
+    db_user = await async_crud.get_user_by_username(username, db)
+    rows = await async_crud.get_food_records_page(db, db_user, date, pagination.decode_cursor(cursor), limit)
+    rows, next_cursor = pagination.split_page(rows, limit)
+    response = FastJSONResponse(crud.create_food_record_responses_from_rows(rows))
+    pagination.set_next_link(request, response, next_cursor)
+    return response
 
 @food_router.post("/{username}/food_records/", response_model=models.FoodRecordResponse)
-def create_food_record(username: str, food_record: models.FoodRecordCreate, db: Session = Depends(get_db)):
-    db_user = crud.get_user_by_username(username, db)
-    today = date.today()
-    db_food_record = crud.create_food_record_in_db(db, db_user, food_record, today)
+async def create_food_record(username: str, food_record: models.FoodRecordCreate, db: AsyncSession = Depends(get_async_db)):
+    db_user = await async_crud.get_user_by_username(username, db)
+    today = food_record.date or date.today()
+    db_food_record = await async_crud.create_food_record_in_db(db, db_user, food_record, today)
+    # 栄養素が指定されていなければバックグラウンドで取得する
+    if db_food_record.status == models.STATUS_PENDING:
+        enrichment_queue.submit(db_food_record.id)
     return crud.create_food_record_response(db_food_record)
 
-app.include_router(food_router, tags=["Food Records"], prefix="/users")
-
-
-
-
-
-
-# データベースの初期化
-def init_db():
-    Base.metadata.create_all(bind=engine)
-
-# FastAPIイベントハンドラでデータベースの初期化を実行
-@app.on_event("startup")
-def startup_event():
-    init_db()
-
-
-def get_nutrient_summary(date):
-    nutrient_summary = session.query(
-        func.sum(models.FoodRecord.energy).label("total_energy"),
-        func.sum(models.FoodRecord.protein).label("total_protein"),
-        func.sum(models.FoodRecord.fat).label("total_fat"),
-        func.sum(models.FoodRecord.carbohydrate).label("total_carbohydrate")
-    ).filter(models.FoodRecord.date == date).first()
-
-    nutrient_summary = models.NutrientSummary(
-        total_energy=nutrient_summary.total_energy or 0,
-        total_protein=nutrient_summary.total_protein or 0,
-        total_fat=nutrient_summary.total_fat or 0,
-        total_carbohydrate=nutrient_summary.total_carbohydrate or 0
-    )
-    return nutrient_summary
-
-
-# 円グラフの表示
-def plot_pfc_ratio(nutrient_summary):
-    labels = ["Protein", "Fat", "Carbohydrate"]
-    sizes = [nutrient_summary.total_protein * 4, nutrient_summary.total_fat * 9, nutrient_summary.total_carbohydrate * 4]
-    explode = (0.03, 0.03, 0.03)  # 各要素を少し引き出すために指定
-
-    fig, ax = plt.subplots()
-    ax.pie(sizes, explode=explode, labels=labels, autopct="%1.1f%%", startangle=90)
-    ax.axis("equal")  # アスペクト比を保持して円形に表示
-
-    st.pyplot(fig)
-
-
+# 複数の食事記録をまとめて保存する（ユーザーの確認は1回、挿入はチャンクごとに1トランザクション）
+@food_router.post("/{username}/food_records/bulk", response_model=models.FoodRecordBulkResponse)
+async def create_food_records_bulk(username: str, food_records: List[models.FoodRecordCreate], db: AsyncSession = Depends(get_async_db)):
+    db_user = await async_crud.get_user_by_username(username, db)
+    ids = await async_crud.bulk_create_food_records_in_db(db, db_user, food_records, date.today())
+    # 栄養素が指定されていない記録はバックグラウンドで取得する
+    for record_id, food_record in zip(ids, food_records):
+        if food_record.energy is None:
+            enrichment_queue.submit(record_id)
+    return models.FoodRecordBulkResponse(ids=ids)
+
+# 期間内の食事記録をCSVまたはNDJSONで少しずつ書き出す（書き出しはスレッドプールで行われる）
+@food_router.get("/{username}/food_records/export")
+async def export_food_records(username: str, start: Optional[date] = None, end: Optional[date] = None, format: Literal["csv", "ndjson"] = "csv", db: AsyncSession = Depends(get_async_db)):
+    await async_crud.get_user_by_username(username, db)
+    content, media_type = record_io.export_stream(username, start, end, format)
+    headers = {"Content-Disposition": f'attachment; filename="food_records.{format}"'}
+    return StreamingResponse(content, media_type=media_type, headers=headers)
 
+app.include_router(food_router, tags=["Food Records"], prefix="/users")
 
-# 本日の総カロリー量とPFC比のグラフを表示する関数
-def display_summary(user, date):
-    # 本日の総カロリー量を取得
-    nutrient_summary = get_nutrient_summary(date)
+# 期間ごとの栄養素の推移のルーター
+trend_router = APIRouter()
+
+# 日・週・月ごとの合計とPFC比率、エネルギーの移動平均を返す
+@trend_router.get("/{username}/nutrients/range", response_model=models.NutrientTrendResponse)
+def get_nutrient_range(username: str, start: date, end: date, period: Literal["day", "week", "month"] = "day",
+                       rolling: int = Query(7, ge=0, le=366), db: Session = Depends(get_db)):
+    if end < start:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+    if (end - start).days > 366 * 5:
+        raise HTTPException(status_code=400, detail="Date range is too long")
+    db_user = crud.get_user_by_username(username, db)
+    return trends.get_nutrient_trend(db, db_user, start, end, period, rolling)
 
-    # 食事記録を取得
-    food_records = get_daily_food_records(user, date)
+app.include_router(trend_router, tags=["Nutrients"], prefix="/users")
 
-    # 合計の栄養素量を計算
-    total_energy = sum(record.energy for record in food_records)
-    total_protein = sum(record.protein for record in food_records)
-    total_fat = sum(record.fat for record in food_records)
-    total_carbohydrate = sum(record.carbohydrate for record in food_records)
+# グラフのルーター
+chart_router = APIRouter()
 
-    # PFC比の円グラフを表示
-    nutrient_summary = models.NutrientSummary(
-        total_energy=total_energy,
-        total_protein=total_protein,
-        total_fat=total_fat,
-        total_carbohydrate=total_carbohydrate
-    )
-    st.write("合計の栄養素量:")
-    st.write("総エネルギー:", round(total_energy, 1))
-    st.write("総タンパク質:", round(total_protein, 1))
-    st.write("総脂質:", round(total_fat, 1))
-    st.write("総炭水化物:", round(total_carbohydrate, 1))
-    st.write("-----")
-    st.write(f"{date}のPFC比率:")
-    plot_pfc_ratio(nutrient_summary)
-
-
-# スレッドごとにデータベースセッションを作成する
-def create_session():
-    session = Session()  # データベースセッションの作成
-    return session
-
-# データベースセッションをスレッドごとに保存する辞書
-sessions = threading.local()
-
-# データベースセッションを取得する
-def get_session():
-    if not hasattr(sessions, "session"):
-        sessions.session = create_session()
-    return sessions.session
-
-# 本日の食事記録を取得する関数
-def get_daily_food_records(user, date):
-    date_str = date.strftime("%Y-%m-%d")  # dateオブジェクトを文字列に変換
-    food_records = (
-        get_session()
-        .query(models.FoodRecord)
-        .join(models.User)  # Userモデルとの関連を考慮して結合する
-        .filter(models.User.username == user, models.FoodRecord.date == date_str)
-
-        .all()
+# その日のPFC比率と理想のPFC比率の円グラフ（Streamlitと同じキャッシュを使う）
+@chart_router.get("/{username}/charts/pfc.png", response_class=Response)
+def get_pfc_chart(username: str, date: date, db: Session = Depends(get_db)):
+    db_user = crud.get_user_by_username(username, db)
+    totals = db.get(models.DailyNutrientTotal, (db_user.id, date))
+    png = totals and charts.daily_pfc_png(date, totals.protein, totals.fat, totals.carbohydrate)
+    if not png:
+        raise HTTPException(status_code=404, detail="No nutrients recorded for this date")
+    return Response(content=png, media_type="image/png", headers={"Cache-Control": "private, max-age=60"})
+
+app.include_router(chart_router, tags=["Charts"], prefix="/users")
+
+# 栄養素検索のルーター
+nutrient_router = APIRouter()
+
+# 複数の料理の栄養素をまとめて調べ、終わったものから1行ずつ(NDJSON)返す
+@nutrient_router.post("/batch")
+def lookup_nutrients(request: models.NutrientLookupRequest):
+    # 同時実行数はクライアントが指定しても設定の上限を超えない
+    max_parallel = min(request.max_parallel or config.BATCH_LOOKUP_MAX_PARALLEL, config.BATCH_LOOKUP_MAX_PARALLEL)
+    results = batch_lookup.lookup_many(request.items, max_parallel)
+    return StreamingResponse(
+        (result.model_dump_json() + "\n" for result in results),
+        media_type="application/x-ndjson",
     )
-    return food_records
-
-# フォントファミリを指定（文字化けしたため）
-font_family = 'Yu Gothic'
-
-# フォントパスを取得
-font_path = fm.findfont(fm.FontProperties(family=font_family))
-
-# フォント設定を変更
-plt.rcParams['font.family'] = font_family
-plt.rcParams['font.sans-serif'] = font_family
-plt.rcParams['pdf.fonttype'] = 42  # PDF出力時にフォントを埋め込むための設定
-
-
 
+app.include_router(nutrient_router, tags=["Nutrients"], prefix="/nutrients")
 
+# 接続プールの状態（貸し出し数・返されていない接続）
+@app.get("/health/db", tags=["Health"])
+def get_database_health():
+    return {"pools": pool_monitor.metrics(), "leaks": pool_monitor.leaks()}
 
 
-# 食事記録と合計の栄養素量、PFC比を表示する関数
-def display_daily_summary(user, date):
-    # 選択された日付を表示
-    st.write(f"{date}の食事記録:")
+# /metricsを出力するときに、接続プールやキャッシュの現在の状態を集める
+def collect_runtime_gauges():
+    gauges = []
+    for name, pool in pool_monitor.metrics().items():
+        gauges += [("foodrecorder_db_pool", {"engine": name, "stat": stat}, value)
+                   for stat, value in pool.items() if value is not None]
+    for metric, stats in (
+        ("foodrecorder_browser_pool", driver_pool.metrics()),
+        ("foodrecorder_nutrient_cache", nutrient_cache.stats()),
+        ("foodrecorder_summary_cache", summary_accumulator.stats()),
+        ("foodrecorder_enrichment", enrichment_queue.stats()),
+    ):
+        gauges += [(metric, {"stat": stat}, value) for stat, value in stats.items()]
+    for chart, info in charts.cache_info().items():
+        gauges += [("foodrecorder_chart_cache", {"chart": chart, "stat": stat}, value)
+                   for stat, value in info.items() if value is not None]
+    return gauges
 
-    # 食事記録を取得
-    food_records = get_daily_food_records(user, date)
+metrics.register_collector(collect_runtime_gauges)
 
-    if len(food_records) == 0:
-        st.error("記録がありません")
-        return
+# Prometheus形式のメトリクス（処理ごとの時間のヒストグラム、カウンター、プールやキャッシュの状態）
+@app.get("/metrics", tags=["Health"], response_class=PlainTextResponse)
+def get_metrics():
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
-    # 合計の栄養素量を計算
-    total_energy = sum(record.energy for record in food_records)
-    total_protein = sum(record.protein for record in food_records)
-    total_fat = sum(record.fat for record in food_records)
-    total_carbohydrate = sum(record.carbohydrate for record in food_records)
 
-    st.write("合計の栄養素量:")
-    st.write("総エネルギー:", round(total_energy, 1))
-    st.write("総タンパク質:", round(total_protein, 1))
-    st.write("総脂質:", round(total_fat, 1))
-    st.write("総炭水化物:", round(total_carbohydrate, 1))
-    st.write("-----")
+# データベースの初期化（テーブルの作成と、足りない列やインデックスの追加）
+init_db = migrations.init_db
 
-    # 本日のPFC比率を計算
-    pfc_ratio = calculate_pfc_ratio(total_protein, total_fat, total_carbohydrate)
-
-    # 理想のPFC比率を定義
-    ideal_pfc_ratio = {'タンパク質': 0.15, '脂質': 0.25, '炭水化物': 0.6}
-
-    # グラフのデータとラベルを準備
-    categories = list(pfc_ratio.keys())
-    values = list(pfc_ratio.values())
-    ideal_values = list(ideal_pfc_ratio.values())
-
-    # グラフの描画
-    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(12, 6))
-
-    # ラベルの順序を調整
-    reordered_labels = ['タンパク質', '脂質', '炭水化物']
-
-    # 本日のPFC比の円グラフを描画
-    _, _, text = ax1.pie(
-        values, labels=reordered_labels, autopct='%1.1f%%', startangle=90, labeldistance=1.1,
-        textprops={'fontsize': 15}  # ラベルの文字の大きさを設定
-    )
-    ax1.set_title(f'{date}のPFC比率', fontsize=20)  # タイトルの文字の大きさを設定
-
-    # 理想のPFC比の円グラフを描画
-    _, _, text = ax2.pie(
-        ideal_values, labels=reordered_labels, autopct='%1.1f%%', startangle=90, labeldistance=1.1,
-        textprops={'fontsize': 15}  # ラベルの文字の大きさを設定
-    )
-    ax2.set_title('理想のPFC比率', fontsize=20)  # タイトルの文字の大きさを設定
-
-    # グラフの表示
-    st.pyplot(fig)
-
-    # 食事記録の一覧表を表示
-    for record in food_records:
-        st.write("食べたもの:", record.recipe_name)
-        st.write("食べた量:", record.servings)
-        st.write("エネルギー:", round(record.energy, 1))
-        st.write("タンパク質:", round(record.protein, 1))
-        st.write("脂質:", round(record.fat, 1))
-        st.write("炭水化物:", round(record.carbohydrate, 1))
-        st.write("-----")
-
-
-# PFC比率を計算する関数
-def calculate_pfc_ratio(protein, fat, carbohydrate):
-    protein_energy = protein * 4
-    fat_energy = fat * 9
-    carbohydrate_energy = carbohydrate * 4
-    total = protein_energy + fat_energy + carbohydrate_energy
-    pfc_ratio = {        
-        'タンパク質': protein_energy / total,
-        '脂質': fat_energy / total,
-        '炭水化物': carbohydrate_energy / total
-    }
-    return pfc_ratio
-
-def display_ideal_pfc_ratio():
-    # 理想のPFC比を計算するロジックを追加
-    total_calories = 2000  # 1日の総カロリー摂取量（例として2000カロリーを設定）
-
-    ideal_protein_percentage = 15
-    ideal_fat_percentage = 25
-    ideal_carbohydrate_percentage = 60
-
-    # カロリーに換算した理想のPFC比を計算
-    ideal_protein_calories = total_calories * (ideal_protein_percentage / 100)
-    ideal_fat_calories = total_calories * (ideal_fat_percentage / 100)
-    ideal_carbohydrate_calories = total_calories * (ideal_carbohydrate_percentage / 100)
-
-    # 理想のPFC比の円グラフを表示
-    labels = ["たんぱく質", "脂質", "炭水化物"]
-    sizes = [ideal_protein_calories, ideal_fat_calories, ideal_carbohydrate_calories]
-    explode = (0.03, 0.03, 0.03)
-
-    fig, ax = plt.subplots()
-    ax.pie(sizes, explode=explode, labels=labels, autopct="%1.1f%%", startangle=90)
-    ax.axis("equal")
-
-    st.pyplot(fig)
-
-    # 一日の摂取量の目安の表示
-    st.write("一日の摂取量の目安:")
-    st.write("たんぱく質:")
-    st.write("運動習慣あり：自身の体重 (kg) × 2g")
-    st.write("運動習慣なし：自身の体重 (kg) × 1g")
-    st.write("脂質:")
-    st.write("男性（2650kcal）60~90g")
-    st.write("女性（2000kcal）45~70g")
-    st.write("炭水化物:")
-    st.write("男性（2650kcal）330~430g")
-    st.write("女性（2000kcal）250~325g")
\ No newline at end of file
+# FastAPIイベントハンドラでデータベースの初期化を実行
+@app.on_event("startup")
+def startup_event():
+    init_db()
+    # 前回の終了時に取得中だった記録の栄養素を取得し直す
+    enrichment_queue.resume_pending()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    enrichment_queue.shutdown(wait=False)
+    nutrient_scraper.shutdown(wait=False)
+    await async_engine.dispose()
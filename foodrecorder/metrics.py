@@ -0,0 +1,243 @@
+#metrics.py
+import asyncio
+import bisect
+import functools
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# 処理時間のヒストグラムの区切り（秒）
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# メトリクスの説明（Prometheusの# HELPに出す）
+DESCRIPTIONS = {
+    "foodrecorder_stage_seconds": ("histogram", "Latency of each processing stage (scraping, crud, charts, ...)"),
+    "foodrecorder_http_request_seconds": ("histogram", "Latency of API requests by route"),
+    "foodrecorder_http_requests_total": ("counter", "API requests by route and status code"),
+    "foodrecorder_nutrient_lookups_total": ("counter", "Nutrient lookups by the source that answered them"),
+    "foodrecorder_scrape_failures_total": ("counter", "Scraping attempts that failed, by backend and reason"),
+    "foodrecorder_scrape_hedges_total": ("counter", "Extra scraping attempts started because the first one was slow"),
+    "foodrecorder_chart_renders_total": ("counter", "Charts rendered (cache misses), by chart"),
+    "foodrecorder_db_pool": ("gauge", "Database connection pool state, by engine"),
+    "foodrecorder_browser_pool": ("gauge", "Headless browser pool state"),
+    "foodrecorder_nutrient_cache": ("gauge", "Nutrient cache statistics"),
+    "foodrecorder_summary_cache": ("gauge", "In-memory daily summary statistics"),
+    "foodrecorder_enrichment": ("gauge", "Background nutrient enrichment queue statistics"),
+    "foodrecorder_chart_cache": ("gauge", "Rendered chart cache statistics, by chart"),
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels: Labels, extra: Iterable[Tuple[str, str]] = ()) -> str:
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    # バケットの上限から分位点を概算する（最後のバケットに入った場合はinf）
+    def quantile(self, q: float) -> float:
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+        return float("inf")
+
+
+# contextmanagerより呼び出しが軽いので、処理のたびに使うタイマーはクラスで書く
+class _StageTimer:
+    __slots__ = ("registry", "key", "start")
+
+    def __init__(self, registry: "Metrics", key: Tuple[str, Labels]):
+        self.registry = registry
+        self.key = key
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.registry._observe(self.key, time.perf_counter() - self.start)
+        return False
+
+
+# プロセス内でヒストグラムとカウンターを集計し、Prometheusの形式で出力する
+# 記録は時刻の取得とロック内での加算だけなので、本番でも有効にしたままにできる
+class Metrics:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._histograms: Dict[Tuple[str, Labels], _Histogram] = {}
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        # 出力するときに値を集める関数（接続プールやキャッシュの状態などのゲージ）
+        self._collectors: List[Callable[[], Iterable[Tuple[str, Dict[str, str], float]]]] = []
+
+    def observe(self, name: str, seconds: float, **labels):
+        self._observe((name, _labels(labels)), seconds)
+
+    def _observe(self, key: Tuple[str, Labels], seconds: float):
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    # with metrics.timer("scrape_http"): のように、ブロックの処理時間をstageごとに記録する
+    def timer(self, stage: str) -> "_StageTimer":
+        return _StageTimer(self, ("foodrecorder_stage_seconds", (("stage", stage),)))
+
+    # 関数（async関数も可）の処理時間を記録するデコレーター
+    def timed(self, stage: str):
+        def decorator(function):
+            if asyncio.iscoroutinefunction(function):
+                @functools.wraps(function)
+                async def async_wrapper(*args, **kwargs):
+                    with self.timer(stage):
+                        return await function(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.timer(stage):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def register_collector(self, collector: Callable[[], Iterable[Tuple[str, Dict[str, str], float]]]):
+        self._collectors.append(collector)
+
+    # 処理ごとの件数・平均・p50・p95（ミリ秒）と、カウンターの値（デバッグ表示用）
+    def snapshot(self) -> Dict[str, list]:
+        with self._lock:
+            stages = [
+                {
+                    "name": name, **dict(labels), "count": histogram.count,
+                    "mean_ms": histogram.sum / histogram.count * 1000 if histogram.count else 0.0,
+                    "p50_ms": histogram.quantile(0.5) * 1000, "p95_ms": histogram.quantile(0.95) * 1000,
+                }
+                for (name, labels), histogram in sorted(self._histograms.items())
+            ]
+            counters = [
+                {"name": name, "labels": _format_labels(labels), "value": value}
+                for (name, labels), value in sorted(self._counters.items())
+            ]
+        return {"stages": stages, "counters": counters}
+
+    def _collect_gauges(self):
+        gauges = []
+        for collector in self._collectors:
+            try:
+                gauges.extend(collector())
+            except Exception:
+                # 状態の取得に失敗しても、/metrics全体は返す
+                continue
+        return gauges
+
+    # Prometheusのテキスト形式（version 0.0.4）
+    def render_prometheus(self) -> str:
+        with self._lock:
+            histograms = {key: (list(h.counts), h.sum, h.count) for key, h in self._histograms.items()}
+            counters = dict(self._counters)
+
+        lines = []
+        described = set()
+
+        def describe(name, default_type):
+            if name in described:
+                return
+            described.add(name)
+            metric_type, help_text = DESCRIPTIONS.get(name, (default_type, name))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+
+        for (name, labels), (counts, total, count) in sorted(histograms.items()):
+            describe(name, "histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', le)])} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+
+        for (name, labels), value in sorted(counters.items()):
+            describe(name, "counter")
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+
+        for name, labels, value in sorted(self._collect_gauges(), key=lambda gauge: gauge[0]):
+            describe(name, "gauge")
+            lines.append(f"{name}{_format_labels(_labels(labels))} {value}")
+        return "\n".join(lines) + "\n"
+
+
+# APIのリクエストごとに、ルート（/users/{username}/food_records/ など）別の処理時間と件数を記録するASGIミドルウェア
+class MetricsMiddleware:
+    def __init__(self, app, registry: "Metrics" = None):
+        self.app = app
+        self.registry = registry or metrics
+
+    # ルートのパス（/users/{username}/food_records/ など。値が入ったパスではなく、ルートごとにまとめる）
+    # scope["route"]のパスにinclude_routerのprefixが含まれるかはFastAPIのバージョンによる
+    # （prefixを付けてアプリにコピーしたルートなら含まれ、ルーターに登録したままのルートなら含まれない）
+    # どちらでも同じになるように、実際のパスのうちルートのパスより前の部分（含まれる場合は空）を前に付ける
+    @staticmethod
+    def _route_template(scope) -> str:
+        route_path = getattr(scope.get("route"), "path", None)
+        if route_path is None:
+            return "unmatched"
+        prefix = scope["path"].rsplit("/", route_path.count("/"))[0]
+        return prefix + route_path
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            path = self._route_template(scope)
+            method = scope.get("method", "")
+            self.registry.observe("foodrecorder_http_request_seconds", time.perf_counter() - start,
+                                  method=method, route=path)
+            self.registry.inc("foodrecorder_http_requests_total", method=method, route=path, status=status["code"])
+
+
+metrics = Metrics()
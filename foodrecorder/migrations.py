@@ -0,0 +1,93 @@
+#migrations.py
+from sqlalchemy import inspect, text
+from database import engine as default_engine
+
+# 適用済みのバージョンを記録するテーブル
+VERSION_TABLE = "schema_version"
+
+
+# モデルにあってテーブルにない列を追加する
+def add_missing_columns(connection, table):
+    existing_columns = {column["name"] for column in inspect(connection).get_columns(table.name)}
+    for column in table.columns:
+        if column.name not in existing_columns:
+            column_type = column.type.compile(dialect=connection.dialect)
+            default = ""
+            if column.server_default is not None:
+                default = f" DEFAULT '{column.server_default.arg}'"
+            connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}{default}"))
+
+
+def _add_food_record_status(connection):
+    import models
+    add_missing_columns(connection, models.FoodRecord.__table__)
+
+
+def _add_food_record_indexes(connection):
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_food_records_user_id_date ON food_records (user_id, date)"
+    ))
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_food_records_unfinished_status ON food_records (status) "
+        "WHERE status <> 'complete'"
+    ))
+
+
+def _add_username_index(connection):
+    connection.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ix_users_username ON users (username)"))
+
+
+def _add_daily_nutrient_totals(connection):
+    import models, rollups
+
+    models.DailyNutrientTotal.__table__.create(bind=connection, checkfirst=True)
+    rollups.rebuild_totals(connection)
+
+
+# (バージョン, 説明, 変更内容) の一覧。追加するときは末尾に足していく
+MIGRATIONS = [
+    (1, "food_recordsにstatus列を追加", _add_food_record_status),
+    (2, "food_recordsに(user_id, date)と取得待ちstatusのインデックスを追加", _add_food_record_indexes),
+    (3, "users.usernameにインデックスを追加", _add_username_index),
+    (4, "日ごとの栄養素の合計daily_nutrient_totalsを作成", _add_daily_nutrient_totals),
+]
+
+
+def current_version(connection) -> int:
+    connection.execute(text(f"CREATE TABLE IF NOT EXISTS {VERSION_TABLE} (version INTEGER NOT NULL)"))
+    version = connection.execute(text(f"SELECT MAX(version) FROM {VERSION_TABLE}")).scalar()
+    return version or 0
+
+
+# 未適用の変更を古い順に1つずつ適用し、適用したバージョンの一覧を返す
+def upgrade(engine=default_engine):
+    applied = []
+    with engine.begin() as connection:
+        version = current_version(connection)
+
+    for migration_version, description, migrate in MIGRATIONS:
+        if migration_version <= version:
+            continue
+        with engine.begin() as connection:
+            migrate(connection)
+            connection.execute(text(f"INSERT INTO {VERSION_TABLE} (version) VALUES (:version)"),
+                               {"version": migration_version})
+        applied.append((migration_version, description))
+    return applied
+
+
+# テーブルを作成し、既存のデータベースに足りない列やインデックスを追加する
+def init_db(engine=default_engine):
+    import models
+    from database import Base
+
+    Base.metadata.create_all(bind=engine)
+    return upgrade(engine)
+
+
+# 既存のfood_record.dbをその場で最新の状態にする（python migrations.py）
+if __name__ == "__main__":
+    applied = init_db()
+    for migration_version, description in applied:
+        print(f"{migration_version}: {description}")
+    print("データベースは最新の状態です。")
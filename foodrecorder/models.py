@@ -1,15 +1,18 @@
 #models.py
-from sqlalchemy import Column, ForeignKey, Integer, Float, String, Date
+import weakref
+from sqlalchemy import Column, ForeignKey, Index, Integer, Float, String, Date, event, inspect, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, column_property, object_session
 from datetime import date
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 
 from database import Base
 
 class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True, index=True)
-    username = Column(String, unique=True)
+    username = Column(String, unique=True, index=True)
 
 
 class UserCreate(BaseModel):
@@ -21,22 +24,190 @@ class UserResponse(BaseModel):
     username: str
 
 
+# 食事記録の栄養素の取得状況
+STATUS_COMPLETE = "complete"
+STATUS_PENDING = "pending_nutrients"
+STATUS_FAILED = "failed"
+# バックグラウンドで取得中（取得待ちの記録を1つのプロセスだけが取得中にして取得する）
+STATUS_ENRICHING = "enriching"
+
+
 class FoodRecord(Base):
     __tablename__ = "food_records"
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
-    date = Column(Date)
+    # 日ごとの合計の差分を求めるため、変更前の値が読み込まれていなくても（コミット後など）必ず読み込んでから変更する
+    user_id = column_property(Column(Integer, ForeignKey("users.id")), active_history=True)
+    date = column_property(Column(Date), active_history=True)
     recipe_name = Column(String)
     servings = Column(Float)
-    energy = Column(Float)
-    protein = Column(Float)
-    fat = Column(Float)
-    carbohydrate = Column(Float)
+    energy = column_property(Column(Float), active_history=True)
+    protein = column_property(Column(Float), active_history=True)
+    fat = column_property(Column(Float), active_history=True)
+    carbohydrate = column_property(Column(Float), active_history=True)
+    status = Column(String, default=STATUS_COMPLETE, server_default=STATUS_COMPLETE)
+
+    __table_args__ = (
+        # ユーザーと日付で絞り込む検索用
+        Index("ix_food_records_user_id_date", "user_id", "date"),
+        # 栄養素の取得待ち・失敗の記録だけを対象にした部分インデックス
+        Index(
+            "ix_food_records_unfinished_status", "status",
+            sqlite_where=text("status <> 'complete'"),
+            postgresql_where=text("status <> 'complete'"),
+        ),
+    )
+
+
+# ユーザーごと・日付ごとの栄養素の合計（食事記録の追加・変更・削除のたびに差分で更新する）
+class DailyNutrientTotal(Base):
+    __tablename__ = "daily_nutrient_totals"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    date = Column(Date, primary_key=True)
+    record_count = Column(Integer, nullable=False, default=0)
+    energy = Column(Float, nullable=False, default=0)
+    protein = Column(Float, nullable=False, default=0)
+    fat = Column(Float, nullable=False, default=0)
+    carbohydrate = Column(Float, nullable=False, default=0)
+
+
+NUTRIENT_COLUMNS = ("energy", "protein", "fat", "carbohydrate")
+
+
+# (user_id, date)ごとの差分を日ごとの合計に足し込む
+# sessionを渡すと、そのセッションのコミットが終わった後にメモリ上の合計にも同じ差分を足す
+# （sessionなしで書き込んだ分は、メモリ上の合計が読み直されるまで反映されない）
+def add_to_daily_totals(connection, deltas, session=None):
+    if not deltas:
+        return
+    # 書き込む前に、コミットが終わるまでこのキーの合計を読んでもキャッシュしないように知らせる
+    if session is not None:
+        in_flight = session.info.setdefault(DAILY_TOTALS_IN_FLIGHT, set())
+        new_keys = [key for key in deltas if key not in in_flight]
+        if new_keys:
+            in_flight.update(new_keys)
+            for listener in list(daily_total_listeners):
+                listener.begin(new_keys)
+
+    dialect_insert = postgresql.insert if connection.dialect.name == "postgresql" else sqlite.insert
+    rows = [
+        {"user_id": user_id, "date": day, "record_count": values[0],
+         **dict(zip(NUTRIENT_COLUMNS, values[1:]))}
+        for (user_id, day), values in deltas.items()
+    ]
+    statement = dialect_insert(DailyNutrientTotal.__table__)
+    statement = statement.on_conflict_do_update(
+        index_elements=["user_id", "date"],
+        set_={
+            column: DailyNutrientTotal.__table__.c[column] + statement.excluded[column]
+            for column in ("record_count",) + NUTRIENT_COLUMNS
+        },
+    )
+    connection.execute(statement, rows)
+
+    # コミットされたら、メモリ上の合計にも同じ差分を足せるように、トランザクション（SAVEPOINTを含む）ごとに覚えておく
+    if session is not None:
+        transaction = session.get_nested_transaction() or session.get_transaction()
+        pending = session.info.setdefault(PENDING_DAILY_DELTAS, {}).setdefault(transaction, {})
+        for key, delta in deltas.items():
+            merge_delta(pending, key, delta)
+
+
+# セッションの情報に保存するキー（トランザクションごとのまだコミットされていない差分、書き込み中のキー、
+# 直前に終わったトランザクションがコミットされたかどうか）
+PENDING_DAILY_DELTAS = "pending_daily_deltas"
+DAILY_TOTALS_IN_FLIGHT = "daily_totals_in_flight"
+DAILY_TOTALS_COMMITTED = "daily_totals_committed"
+
+# 日ごとの合計の差分を受け取るオブジェクト（弱参照で持つので、使われなくなったものは自動的に外れる）
+# begin(keys): そのキーへの書き込みが始まった
+# end(keys, deltas): 書き込みが終わった（deltasはコミットされた差分。ロールバックの場合は空）
+daily_total_listeners = weakref.WeakSet()
+
+
+# after_commit・after_rollbackは、どちらもそのトランザクションのafter_transaction_endの直前に呼ばれる
+# （SAVEPOINTのRELEASE・ROLLBACKでも呼ばれるので、ここでは結果だけを覚えておく）
+@event.listens_for(Session, "after_commit")
+def _daily_totals_committed(session):
+    session.info[DAILY_TOTALS_COMMITTED] = True
+
+
+@event.listens_for(Session, "after_rollback")
+def _daily_totals_rolled_back(session):
+    session.info[DAILY_TOTALS_COMMITTED] = False
+
+
+# SAVEPOINTがRELEASEされたら差分を外側のトランザクションに移し、ロールバックされたら捨てる
+# 一番外側のトランザクションがコミットされたら、データベースへのCOMMITが成功した後なので、メモリ上の合計に足す
+# （ロールバックされた場合と、ロールバックせずに閉じた場合は何も足さない）
+@event.listens_for(Session, "after_transaction_end")
+def _daily_totals_transaction_ended(session, transaction):
+    committed = session.info.pop(DAILY_TOTALS_COMMITTED, False)
+    pending = session.info.get(PENDING_DAILY_DELTAS, {})
+    deltas = pending.pop(transaction, None)
+    if transaction.parent is not None:
+        if committed and deltas:
+            parent = pending.setdefault(transaction.parent, {})
+            for key, delta in deltas.items():
+                merge_delta(parent, key, delta)
+        return
+
+    session.info.pop(PENDING_DAILY_DELTAS, None)
+    keys = session.info.pop(DAILY_TOTALS_IN_FLIGHT, None)
+    if keys:
+        for listener in list(daily_total_listeners):
+            listener.end(keys, deltas if committed and deltas else {})
+
+
+# 食事記録の値を (件数, エネルギー, たんぱく質, 脂質, 炭水化物) の差分にする
+def food_record_delta(values, sign=1):
+    return [sign] + [sign * (values.get(column) or 0) for column in NUTRIENT_COLUMNS]
+
+
+def merge_delta(deltas, key, delta):
+    current = deltas.get(key)
+    deltas[key] = delta if current is None else [a + b for a, b in zip(current, delta)]
+
+
+@event.listens_for(FoodRecord, "after_insert")
+def _food_record_inserted(mapper, connection, target):
+    values = {column: getattr(target, column) for column in NUTRIENT_COLUMNS}
+    add_to_daily_totals(connection, {(target.user_id, target.date): food_record_delta(values)}, object_session(target))
+
+
+@event.listens_for(FoodRecord, "after_delete")
+def _food_record_deleted(mapper, connection, target):
+    values = {column: getattr(target, column) for column in NUTRIENT_COLUMNS}
+    add_to_daily_totals(connection, {(target.user_id, target.date): food_record_delta(values, -1)}, object_session(target))
+
+
+@event.listens_for(FoodRecord, "after_update")
+def _food_record_updated(mapper, connection, target):
+    state = inspect(target)
+    tracked = ("user_id", "date") + NUTRIENT_COLUMNS
+    if not any(state.attrs[column].history.has_changes() for column in tracked):
+        return
+
+    # 変更前の値を引いて、変更後の値を足す
+    old, new = {}, {}
+    for column in tracked:
+        history = state.attrs[column].history
+        new[column] = getattr(target, column)
+        old[column] = history.deleted[0] if history.deleted else new[column]
+
+    deltas = {}
+    merge_delta(deltas, (old["user_id"], old["date"]), food_record_delta(old, -1))
+    merge_delta(deltas, (new["user_id"], new["date"]), food_record_delta(new))
+    add_to_daily_totals(connection, deltas, object_session(target))
+
+
+# フィールド名のdateと型のdateが衝突しないように別名を付ける
+OptionalDate = Optional[date]
 
 
 class FoodRecordCreate(BaseModel):
     recipe_name: str
     servings: float
+    date: OptionalDate = None
     energy: Optional[float] = None
     protein: Optional[float] = None
     fat: Optional[float] = None
@@ -52,6 +223,64 @@ class FoodRecordResponse(BaseModel):
     protein: Optional[float] = None
     fat: Optional[float] = None
     carbohydrate: Optional[float] = None
+    status: Optional[str] = None
+
+
+class FoodRecordBulkResponse(BaseModel):
+    ids: List[int]
+
+
+# スクレイピング結果のキャッシュ（1人分の栄養素値）
+class NutrientCacheEntry(Base):
+    __tablename__ = "nutrient_cache"
+    key = Column(String, primary_key=True)
+    recipe_name = Column(String)
+    data = Column(String)
+    created_at = Column(Float)
+    last_accessed = Column(Float, index=True)
+
+
+class NutrientLookupItem(BaseModel):
+    recipe_name: str
+    servings: float = 1.0
+
+
+class NutrientLookupRequest(BaseModel):
+    items: List[NutrientLookupItem]
+    max_parallel: Optional[int] = None
+
+
+class NutrientLookupResult(BaseModel):
+    index: int
+    recipe_name: str
+    servings: float
+    found: bool
+    cached: bool = False
+    energy: Optional[float] = None
+    protein: Optional[float] = None
+    fat: Optional[float] = None
+    carbohydrate: Optional[float] = None
+    error: Optional[str] = None
+
+
+class NutrientTrendPoint(BaseModel):
+    period_start: date
+    record_count: int
+    total_energy: float
+    total_protein: float
+    total_fat: float
+    total_carbohydrate: float
+    protein_ratio: Optional[float] = None
+    fat_ratio: Optional[float] = None
+    carbohydrate_ratio: Optional[float] = None
+    rolling_energy: Optional[float] = None
+
+
+class NutrientTrendResponse(BaseModel):
+    period: str
+    start: date
+    end: date
+    points: List[NutrientTrendPoint]
 
 
 class NutrientSummary(BaseModel):
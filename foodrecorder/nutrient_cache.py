@@ -0,0 +1,213 @@
+#nutrient_cache.py
+import json
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Optional
+from sqlalchemy import func, insert, select
+import config, migrations, models
+from database import session_scope
+
+
+# 料理名をキャッシュのキーに正規化（全角/半角・大文字/小文字・空白の揺れを吸収）
+def normalize_recipe_name(recipe_name: str) -> str:
+    name = unicodedata.normalize("NFKC", recipe_name)
+    name = re.sub(r"\s+", " ", name).strip()
+    return name.lower()
+
+
+# SQLiteに永続化する栄養素キャッシュ（TTL・件数上限つきLRU）
+class NutrientCache:
+    def __init__(self, ttl_seconds: int = config.NUTRIENT_CACHE_TTL_SECONDS,
+                 max_entries: int = config.NUTRIENT_CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # プロセス内のメモリキャッシュ（ヒット時はSQLiteにも触れない）
+        self._memory = OrderedDict()
+        # メモリ上でヒットしたキーの最終アクセス時刻（次の書き込み時にまとめて反映）
+        self._touched = {}
+        # SQLiteのエントリ数（書き込みのたびにCOUNT(*)しないように、最初に1回数えてからは増減を追う）
+        self._row_count = None
+
+    def _is_expired(self, created_at: float, now: float) -> bool:
+        return now - created_at > self.ttl_seconds
+
+    def _remember(self, key: str, data: Dict[str, str], created_at: float):
+        self._memory[key] = (data, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    # キャッシュから1人分の栄養素値を取得（なければNone）
+    def get(self, recipe_name: str) -> Optional[Dict[str, str]]:
+        key = normalize_recipe_name(recipe_name)
+        now = time.time()
+        with self._lock:
+            cached = self._memory.get(key)
+            if cached and not self._is_expired(cached[1], now):
+                self._memory.move_to_end(key)
+                self._touched[key] = now
+                self.hits += 1
+                return dict(cached[0])
+            self._memory.pop(key, None)
+
+        with session_scope() as db:
+            entry = db.get(models.NutrientCacheEntry, key)
+            if entry is None or self._is_expired(entry.created_at, now):
+                if entry is not None:
+                    db.delete(entry)
+                    db.commit()
+                    with self._lock:
+                        if self._row_count is not None:
+                            self._row_count -= 1
+                with self._lock:
+                    self.misses += 1
+                return None
+            entry.last_accessed = now
+            data = json.loads(entry.data)
+            created_at = entry.created_at
+            db.commit()
+
+        with self._lock:
+            self._remember(key, data, created_at)
+            self.hits += 1
+        return dict(data)
+
+    # スクレイピング結果をキャッシュに保存
+    def put(self, recipe_name: str, data: Dict[str, str]):
+        key = normalize_recipe_name(recipe_name)
+        now = time.time()
+        with self._lock:
+            self._remember(key, dict(data), now)
+            touched, self._touched = self._touched, {}
+
+        with session_scope() as db:
+            entry = db.get(models.NutrientCacheEntry, key)
+            inserted = entry is None
+            if entry is None:
+                entry = models.NutrientCacheEntry(key=key)
+                db.add(entry)
+            entry.recipe_name = recipe_name
+            entry.data = json.dumps(data, ensure_ascii=False)
+            entry.created_at = now
+            entry.last_accessed = now
+            for touched_key, accessed in touched.items():
+                if touched_key != key:
+                    db.query(models.NutrientCacheEntry).filter(
+                        models.NutrientCacheEntry.key == touched_key
+                    ).update({models.NutrientCacheEntry.last_accessed: accessed})
+            db.flush()
+            self._evict(db, now, inserted)
+            db.commit()
+
+    # 件数が上限を超えたら、期限切れと古いエントリを削除して上限の9割まで減らす
+    # 件数はメモリ上で数え、COUNT(*)は最初と上限を超えたときだけ実行する
+    # （別のプロセスが追加・削除した分は、次にCOUNT(*)したときに反映される）
+    # 期限切れのエントリは読むときに無視されるので、上限に達するまでは残しておく
+    def _evict(self, db, now: float, added: int):
+        with self._lock:
+            if self._row_count is not None:
+                self._row_count += added
+                if self._row_count <= self.max_entries:
+                    return
+
+        count = db.query(func.count(models.NutrientCacheEntry.key)).scalar()
+        if count > self.max_entries:
+            count -= db.query(models.NutrientCacheEntry).filter(
+                models.NutrientCacheEntry.created_at < now - self.ttl_seconds
+            ).delete(synchronize_session=False)
+            overflow = count - int(self.max_entries * 0.9)
+            if overflow > 0:
+                oldest_keys = [
+                    key for (key,) in db.query(models.NutrientCacheEntry.key)
+                    .order_by(models.NutrientCacheEntry.last_accessed)
+                    .limit(overflow)
+                ]
+                count -= db.query(models.NutrientCacheEntry).filter(
+                    models.NutrientCacheEntry.key.in_(oldest_keys)
+                ).delete(synchronize_session=False)
+        with self._lock:
+            self._row_count = count
+
+    # 保存済みの食事記録からキャッシュを事前に作成
+    # 新しい記録から少しずつ読み、まだキャッシュにない料理を件数上限までまとめて挿入する
+    def warm_from_food_records(self, batch_size: int = 1000) -> int:
+        now = time.time()
+        with session_scope() as db:
+            cached_keys = {key for (key,) in db.query(models.NutrientCacheEntry.key)}
+            room = self.max_entries - len(cached_keys)
+            statement = (
+                select(
+                    models.FoodRecord.recipe_name,
+                    models.FoodRecord.servings,
+                    models.FoodRecord.energy,
+                    models.FoodRecord.protein,
+                    models.FoodRecord.fat,
+                    models.FoodRecord.carbohydrate,
+                )
+                .where(models.FoodRecord.servings > 0, models.FoodRecord.energy > 0)
+                .order_by(models.FoodRecord.id.desc())
+            )
+
+            rows = []
+            for recipe_name, servings, energy, protein, fat, carbohydrate in db.execute(
+                statement.execution_options(yield_per=batch_size)
+            ):
+                if len(rows) >= room:
+                    break
+                key = normalize_recipe_name(recipe_name)
+                if key in cached_keys:
+                    continue
+                cached_keys.add(key)
+                data = {
+                    "エネルギー": f"{round(energy / servings, 1)}kcal",
+                    "たんぱく質": f"{round((protein or 0) / servings, 1)}g",
+                    "脂質": f"{round((fat or 0) / servings, 1)}g",
+                    "炭水化物": f"{round((carbohydrate or 0) / servings, 1)}g",
+                }
+                rows.append({
+                    "key": key, "recipe_name": recipe_name, "data": json.dumps(data, ensure_ascii=False),
+                    "created_at": now, "last_accessed": now,
+                })
+
+            if rows:
+                db.execute(insert(models.NutrientCacheEntry), rows)
+                db.commit()
+        with self._lock:
+            self._row_count = len(cached_keys)
+        return len(rows)
+
+    # ヒット数・ミス数などの統計
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "memory_entries": len(self._memory),
+            }
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._touched.clear()
+        with session_scope() as db:
+            db.query(models.NutrientCacheEntry).delete()
+            db.commit()
+        with self._lock:
+            self._row_count = 0
+
+
+nutrient_cache = NutrientCache()
+
+
+# 保存済みの食事記録からキャッシュを作成する（python nutrient_cache.py）
+# テーブルは読み込み時には作らず、migrations.init_dbで作る
+if __name__ == "__main__":
+    migrations.init_db()
+    warmed = nutrient_cache.warm_from_food_records()
+    print(f"{warmed}件の料理をキャッシュしました。")
@@ -0,0 +1,40 @@
+#pagination.py
+import base64
+import binascii
+import json
+from typing import List, Optional, Sequence, Tuple
+from fastapi import HTTPException, Request, Response
+
+
+# 最後に返したidを、クライアントがそのまま渡し返す文字列にする
+def encode_cursor(last_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"after": last_id}).encode()).decode().rstrip("=")
+
+
+# カーソルから、次のページの検索を始めるid（このidより大きいもの）を取り出す
+def decode_cursor(cursor: Optional[str]) -> int:
+    if not cursor:
+        return 0
+    try:
+        after = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))["after"]
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(after, int):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return after
+
+
+# limit+1件取得した結果を1ページ分と次のカーソルに分ける（件数を数えずに次のページの有無が分かる）
+def split_page(rows: Sequence, limit: int) -> Tuple[List, Optional[str]]:
+    rows = list(rows)
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].id)
+
+
+# 次のページのURLをLinkヘッダーに入れる（最後のページでは付けない）
+def set_next_link(request: Request, response: Response, next_cursor: Optional[str]):
+    if next_cursor is not None:
+        next_url = request.url.include_query_params(cursor=next_cursor)
+        response.headers["Link"] = f'<{next_url}>; rel="next"'
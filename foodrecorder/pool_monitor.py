@@ -0,0 +1,89 @@
+#pool_monitor.py
+import threading
+import time
+import traceback
+from typing import Dict, List
+from sqlalchemy import event
+import config
+
+
+# 接続プールの貸し出し・返却を数え、返されないままの接続を見つける
+class PoolMonitor:
+    def __init__(self, leak_threshold_seconds: float = config.DB_LEAK_THRESHOLD_SECONDS,
+                 track_stacks: bool = config.DB_TRACK_CHECKOUT_STACKS):
+        self.leak_threshold_seconds = leak_threshold_seconds
+        self.track_stacks = track_stacks
+        self._lock = threading.Lock()
+        self._engines = {}
+        self._counters = {}
+        # 貸し出し中の接続ごとの (エンジン名, 貸し出した時刻, 貸し出した場所)
+        self._checked_out = {}
+
+    # エンジンのプールにイベントを登録する（非同期エンジンは内部の同期エンジンに登録する）
+    def attach(self, engine, name: str):
+        sync_engine = getattr(engine, "sync_engine", engine)
+        with self._lock:
+            self._engines[name] = sync_engine
+            self._counters[name] = {"checkouts": 0, "checkins": 0, "invalidated": 0, "max_checked_out": 0}
+
+        @event.listens_for(sync_engine, "checkout")
+        def on_checkout(dbapi_connection, connection_record, connection_proxy):
+            stack = self._caller_stack() if self.track_stacks else None
+            with self._lock:
+                counters = self._counters[name]
+                counters["checkouts"] += 1
+                self._checked_out[id(connection_record)] = (name, time.monotonic(), stack)
+                in_use = sum(1 for engine_name, _, _ in self._checked_out.values() if engine_name == name)
+                counters["max_checked_out"] = max(counters["max_checked_out"], in_use)
+
+        @event.listens_for(sync_engine, "checkin")
+        def on_checkin(dbapi_connection, connection_record):
+            with self._lock:
+                if self._checked_out.pop(id(connection_record), None) is not None:
+                    self._counters[name]["checkins"] += 1
+
+        @event.listens_for(sync_engine, "invalidate")
+        def on_invalidate(dbapi_connection, connection_record, exception):
+            with self._lock:
+                self._counters[name]["invalidated"] += 1
+
+        return engine
+
+    # ライブラリ内部の呼び出しを除いた、接続を借りたアプリ側の場所
+    @staticmethod
+    def _caller_stack() -> str:
+        stack = [frame for frame in traceback.extract_stack()[:-2] if "sqlalchemy" not in frame.filename]
+        return "".join(traceback.format_list(stack[-3:]))
+
+    # 閾値を超えて貸し出されたままの接続（古い順）
+    def leaks(self, threshold_seconds: float = None) -> List[Dict]:
+        threshold = self.leak_threshold_seconds if threshold_seconds is None else threshold_seconds
+        now = time.monotonic()
+        with self._lock:
+            leaked = [
+                {"engine": name, "seconds": now - checked_out_at, "checked_out_at": stack}
+                for name, checked_out_at, stack in self._checked_out.values()
+                if now - checked_out_at >= threshold
+            ]
+        return sorted(leaked, key=lambda leak: -leak["seconds"])
+
+    def metrics(self) -> Dict[str, Dict]:
+        with self._lock:
+            in_use = {name: 0 for name in self._engines}
+            for name, _, _ in self._checked_out.values():
+                in_use[name] += 1
+            result = {}
+            for name, engine in self._engines.items():
+                pool = engine.pool
+                result[name] = {
+                    "size": pool.size() if hasattr(pool, "size") else None,
+                    "checked_out": in_use[name],
+                    **self._counters[name],
+                }
+        leaks = self.leaks()
+        for name in result:
+            result[name]["leaks"] = sum(1 for leak in leaks if leak["engine"] == name)
+        return result
+
+
+pool_monitor = PoolMonitor()
@@ -0,0 +1,149 @@
+#record_io.py
+import argparse
+import csv
+import io
+import json
+from datetime import date
+from typing import Dict, Iterable, Iterator, List, Optional
+from sqlalchemy import select
+import crud, models
+from database import session_scope
+
+# 書き出し・読み込みする列
+EXPORT_COLUMNS = ["username", "date", "recipe_name", "servings", "energy", "protein", "fat", "carbohydrate"]
+
+# 一度にデータベースから読み出す件数・まとめて保存する件数
+EXPORT_BATCH_SIZE = 1000
+IMPORT_BATCH_SIZE = 1000
+
+
+# ユーザーの食事記録を期間で絞り込み、少しずつ読み出す（全件をメモリに載せない）
+def iter_food_record_rows(db, user: models.User, start: Optional[date] = None, end: Optional[date] = None,
+                          batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[tuple]:
+    statement = select(
+        models.FoodRecord.date,
+        models.FoodRecord.recipe_name,
+        models.FoodRecord.servings,
+        models.FoodRecord.energy,
+        models.FoodRecord.protein,
+        models.FoodRecord.fat,
+        models.FoodRecord.carbohydrate,
+    ).where(models.FoodRecord.user_id == user.id)
+    if start is not None:
+        statement = statement.where(models.FoodRecord.date >= start)
+    if end is not None:
+        statement = statement.where(models.FoodRecord.date <= end)
+    statement = statement.order_by(models.FoodRecord.date, models.FoodRecord.id)
+
+    result = db.execute(statement.execution_options(yield_per=batch_size))
+    for row in result:
+        yield tuple(row)
+
+
+# ユーザー名で検索し、期間内の記録を1行ずつ書き出す（セッションは書き出しが終わるまで開いておく）
+def _export_rows(username: str, start: Optional[date], end: Optional[date]) -> Iterator[tuple]:
+    with session_scope() as db:
+        user = crud.get_user_by_username(username, db)
+        for row in iter_food_record_rows(db, user, start, end):
+            yield (user.username,) + row
+
+
+def export_csv(rows: Iterable[tuple]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for row in rows:
+        writer.writerow(row)
+        # ある程度たまったら送り出す
+        if buffer.tell() > 64 * 1024:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def export_ndjson(rows: Iterable[tuple]) -> Iterator[str]:
+    for row in rows:
+        record = dict(zip(EXPORT_COLUMNS, row))
+        record["date"] = record["date"].isoformat()
+        yield json.dumps(record, ensure_ascii=False) + "\n"
+
+
+EXPORT_FORMATS = {
+    "csv": (export_csv, "text/csv; charset=utf-8"),
+    "ndjson": (export_ndjson, "application/x-ndjson"),
+}
+
+
+# 指定した形式で書き出すジェネレーターとContent-Typeを返す（ユーザーの存在は呼び出し元で確認済み）
+def export_stream(username: str, start: Optional[date] = None, end: Optional[date] = None, format: str = "csv"):
+    writer, media_type = EXPORT_FORMATS[format]
+    return writer(_export_rows(username, start, end)), media_type
+
+
+def _empty_to_none(value):
+    return None if value in ("", None) else value
+
+
+# CSVまたはNDJSONを1行ずつ読み込む
+def read_records(file, format: str) -> Iterator[Dict[str, str]]:
+    if format == "csv":
+        yield from csv.DictReader(file)
+    else:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+# 読み込んだ記録をユーザーごとにまとめ、一定の件数ごとにまとめて保存する
+def import_food_records(file, format: str, username: Optional[str] = None,
+                        batch_size: int = IMPORT_BATCH_SIZE) -> int:
+    imported = 0
+    pending: Dict[str, List[models.FoodRecordCreate]] = {}
+    pending_count = 0
+    users: Dict[str, models.User] = {}
+
+    with session_scope() as db:
+        def flush():
+            nonlocal imported, pending_count
+            for name, food_records in pending.items():
+                if name not in users:
+                    user = db.query(models.User).filter(models.User.username == name).first()
+                    users[name] = user or crud.create_and_save_user(models.UserCreate(username=name), db)
+                imported += len(crud.bulk_create_food_records_in_db(db, users[name], food_records, date.today()))
+            pending.clear()
+            pending_count = 0
+
+        for row in read_records(file, format):
+            name = username or row["username"]
+            pending.setdefault(name, []).append(models.FoodRecordCreate(
+                recipe_name=row["recipe_name"],
+                servings=row["servings"],
+                date=row["date"],
+                energy=_empty_to_none(row.get("energy")),
+                protein=_empty_to_none(row.get("protein")),
+                fat=_empty_to_none(row.get("fat")),
+                carbohydrate=_empty_to_none(row.get("carbohydrate")),
+            ))
+            pending_count += 1
+            if pending_count >= batch_size:
+                flush()
+        flush()
+    return imported
+
+
+# python record_io.py history.csv --user iimura のように実行する
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="食事記録をCSV/NDJSONから読み込む")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), default=None,
+                        help="省略した場合は拡張子から判断する")
+    parser.add_argument("--user", default=None, help="省略した場合はファイルのusername列を使う")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    format = args.format or ("ndjson" if args.path.endswith((".ndjson", ".jsonl")) else "csv")
+    with open(args.path, encoding="utf-8-sig", newline="") as file:
+        count = import_food_records(file, format, args.user, args.batch_size)
+    # 栄養素のない記録は、次にアプリかAPIを起動したときにバックグラウンドで取得される
+    print(f"{count}件の食事記録を読み込みました。")
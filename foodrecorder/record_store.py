@@ -0,0 +1,208 @@
+#record_store.py
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import date
+from typing import Dict, List, NamedTuple, Optional
+from sqlalchemy import or_, select
+import config, models
+from cache_generations import cache_generations
+from database import session_scope
+
+# 栄養素の取得状況は番号で持つ（0: complete, 1: pending_nutrients, 2: failed, 3: enriching）
+STATUSES = (models.STATUS_COMPLETE, models.STATUS_PENDING, models.STATUS_FAILED, models.STATUS_ENRICHING)
+
+# 食べた量と栄養素の列（float64で持ち、値がない場合はnan。float32では表示の丸めがデータベースの値とずれることがある）
+NUMBER_COLUMNS = ("servings",) + models.NUTRIENT_COLUMNS
+
+NAN = float("nan")
+
+
+# 画面に表示する1件（表示する日の分だけ作る。属性名はFoodRecordResponseと同じ）
+class RecordRow(NamedTuple):
+    id: int
+    date: date
+    recipe_name: str
+    servings: float
+    energy: Optional[float]
+    protein: Optional[float]
+    fat: Optional[float]
+    carbohydrate: Optional[float]
+    status: str
+
+
+# 1人のユーザーの食事記録を列ごとの配列で持つ（日付、idの順に並べ、日付は二分探索で探す）
+# 料理名はRecordStoreの一覧の番号で持つので、同じ料理名の文字列は1つしか作られない
+class RecordHistory:
+    __slots__ = ("ids", "days", "recipes", "servings", "energy", "protein", "fat", "carbohydrate", "statuses",
+                 "unfinished", "last_id", "generation", "checked_at")
+
+    def __init__(self):
+        self.ids = array("q")
+        self.days = array("i")      # date.toordinal()
+        self.recipes = array("i")
+        self.servings = array("d")
+        self.energy = array("d")
+        self.protein = array("d")
+        self.fat = array("d")
+        self.carbohydrate = array("d")
+        self.statuses = array("b")
+        # 栄養素の取得が終わっていない記録のid（読み直すときに、新しい記録と一緒に読む）
+        self.unfinished = set()
+        self.last_id = 0
+        self.generation = None
+        self.checked_at = 0.0
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def nbytes(self) -> int:
+        columns = (self.ids, self.days, self.recipes, self.statuses) + tuple(getattr(self, column) for column in NUMBER_COLUMNS)
+        return sum(column.itemsize * len(column) for column in columns)
+
+
+def _number(value) -> float:
+    return NAN if value is None else value
+
+
+def _optional(value: float) -> Optional[float]:
+    return None if value != value else value
+
+
+# ユーザーごとの食事記録を一度だけ読み込み、その後は新しく追加された記録と、栄養素の取得中だった記録だけを読み足す
+# （世代番号が進んだとき、またはttl_seconds秒ごと。別のプロセスで追加された記録もttl_seconds秒以内に反映される）
+# ORMのオブジェクトを作らずに列の値だけを持つので、1件あたりのメモリが小さい
+class RecordStore:
+    def __init__(self, ttl_seconds: int = config.UI_CACHE_TTL_SECONDS,
+                 max_users: int = config.RECORD_STORE_MAX_USERS, session_factory=session_scope,
+                 generations=cache_generations):
+        self.ttl_seconds = ttl_seconds
+        self.max_users = max_users
+        self.session_factory = session_factory
+        self.generations = generations
+        self.hits = 0
+        self.loads = 0
+        self.refreshes = 0
+        self._lock = threading.Lock()
+        self._histories: "OrderedDict[int, RecordHistory]" = OrderedDict()
+        # 料理名の一覧と、料理名から番号への対応
+        self._names: List[str] = []
+        self._name_index: Dict[str, int] = {}
+
+    def _intern(self, name: str) -> int:
+        index = self._name_index.get(name)
+        if index is None:
+            index = self._name_index[name] = len(self._names)
+            self._names.append(name)
+        return index
+
+    # last_idより後の記録と、unfinishedの記録を、日付、idの順に読む
+    def _fetch(self, user_id: int, last_id: int, unfinished) -> list:
+        record = models.FoodRecord
+        statement = select(
+            record.id, record.date, record.recipe_name,
+            *(getattr(record, column) for column in NUMBER_COLUMNS), record.status,
+        ).where(record.user_id == user_id)
+        if last_id:
+            condition = record.id > last_id
+            if unfinished:
+                condition = or_(condition, record.id.in_(unfinished))
+            statement = statement.where(condition)
+        with self.session_factory() as db:
+            return db.execute(statement.order_by(record.date, record.id)).all()
+
+    def _apply(self, history: RecordHistory, rows):
+        last_id = history.last_id
+        for record_id, day, recipe_name, *numbers, status in rows:
+            status_code = STATUSES.index(status) if status in STATUSES else 0
+            values = [_number(value) for value in numbers]
+            if record_id <= history.last_id:
+                # 読み込み済みの記録は、栄養素と取得状況だけを置き換える（別のスレッドが先に読み足した記録は何もしない）
+                if record_id not in history.unfinished:
+                    continue
+                index = history.ids.index(record_id)
+                for column, value in zip(NUMBER_COLUMNS, values):
+                    getattr(history, column)[index] = value
+                history.statuses[index] = status_code
+            else:
+                # 同じ日の記録の後ろに入れる（新しい記録ほどidが大きいので、日付、idの順が保たれる）
+                ordinal = day.toordinal()
+                index = bisect_right(history.days, ordinal)
+                history.ids.insert(index, record_id)
+                history.days.insert(index, ordinal)
+                history.recipes.insert(index, self._intern(recipe_name))
+                for column, value in zip(NUMBER_COLUMNS, values):
+                    getattr(history, column).insert(index, value)
+                history.statuses.insert(index, status_code)
+                last_id = max(last_id, record_id)
+            if status_code == 0:
+                history.unfinished.discard(record_id)
+            else:
+                history.unfinished.add(record_id)
+        history.last_id = last_id
+
+    # ユーザーの記録を返す（初めてなら読み込み、世代番号が進んだか古くなっていれば読み足す）
+    def history(self, user_id: int) -> RecordHistory:
+        generation = self.generations.get(user_id)
+        now = time.monotonic()
+        with self._lock:
+            history = self._histories.get(user_id)
+            if history is None:
+                history = self._histories[user_id] = RecordHistory()
+                while len(self._histories) > self.max_users:
+                    self._histories.popitem(last=False)
+            else:
+                self._histories.move_to_end(user_id)
+                if history.generation == generation and now - history.checked_at <= self.ttl_seconds:
+                    self.hits += 1
+                    return history
+            last_id, unfinished = history.last_id, tuple(history.unfinished)
+
+        rows = self._fetch(user_id, last_id, unfinished)
+        with self._lock:
+            self._apply(history, rows)
+            history.generation = generation
+            history.checked_at = now
+            if last_id:
+                self.refreshes += 1
+            else:
+                self.loads += 1
+        return history
+
+    # その日の食事記録（id順）
+    def records(self, user_id: int, day: date) -> List[RecordRow]:
+        history = self.history(user_id)
+        ordinal = day.toordinal()
+        with self._lock:
+            start, end = bisect_left(history.days, ordinal), bisect_right(history.days, ordinal)
+            return [
+                RecordRow(
+                    history.ids[index], day, self._names[history.recipes[index]], history.servings[index],
+                    _optional(history.energy[index]), _optional(history.protein[index]),
+                    _optional(history.fat[index]), _optional(history.carbohydrate[index]),
+                    STATUSES[history.statuses[index]],
+                )
+                for index in range(start, end)
+            ]
+
+    # 保持しているユーザー数・記録数・配列の大きさ（料理名の文字列は除く）など
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "users": len(self._histories),
+                "records": sum(len(history) for history in self._histories.values()),
+                "array_bytes": sum(history.nbytes() for history in self._histories.values()),
+                "recipe_names": len(self._names),
+                "hits": self.hits,
+                "loads": self.loads,
+                "refreshes": self.refreshes,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._histories.clear()
+
+
+record_store = RecordStore()
@@ -0,0 +1,26 @@
+#responses.py
+import json
+from datetime import date
+from fastapi.responses import JSONResponse
+
+# orjsonが入っていれば、日付も含めてそのままJSONのバイト列にする
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+# 辞書やリストを検証せずにJSONにするレスポンス（response_modelの検証と変換を通らない）
+class FastJSONResponse(JSONResponse):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content)
+        return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
@@ -0,0 +1,75 @@
+#rollups.py
+import argparse
+from typing import List
+from sqlalchemy import delete, func, insert, select
+import models
+from database import session_scope
+
+
+# 食事記録から日ごとの合計を集計するSELECT文
+def _aggregate_food_records():
+    return select(
+        models.FoodRecord.user_id,
+        models.FoodRecord.date,
+        func.count(models.FoodRecord.id),
+        func.coalesce(func.sum(models.FoodRecord.energy), 0),
+        func.coalesce(func.sum(models.FoodRecord.protein), 0),
+        func.coalesce(func.sum(models.FoodRecord.fat), 0),
+        func.coalesce(func.sum(models.FoodRecord.carbohydrate), 0),
+    ).group_by(models.FoodRecord.user_id, models.FoodRecord.date)
+
+
+# 日ごとの合計を食事記録から作り直す（コミットは呼び出し元で行う）
+def rebuild_totals(connection) -> int:
+    connection.execute(delete(models.DailyNutrientTotal))
+    columns = ["user_id", "date", "record_count", *models.NUTRIENT_COLUMNS]
+    connection.execute(insert(models.DailyNutrientTotal).from_select(columns, _aggregate_food_records()))
+    return connection.execute(select(func.count()).select_from(models.DailyNutrientTotal)).scalar()
+
+
+def rebuild(db) -> int:
+    from summary_accumulator import summary_accumulator
+
+    count = rebuild_totals(db.connection())
+    db.commit()
+    # 作り直した合計はメモリ上の合計と一致しないかもしれないので、読み直させる
+    summary_accumulator.clear()
+    return count
+
+
+# 日ごとの合計が食事記録と一致しているかを確認し、ずれている(user_id, date)を返す
+def verify(db, tolerance: float = 1e-6) -> List[tuple]:
+    expected = {
+        (user_id, day): values
+        for user_id, day, *values in db.execute(_aggregate_food_records())
+    }
+    actual = {
+        (row.user_id, row.date): [row.record_count] + [getattr(row, column) for column in models.NUTRIENT_COLUMNS]
+        for row in db.query(models.DailyNutrientTotal)
+        if row.record_count != 0
+    }
+
+    mismatches = []
+    for key in expected.keys() | actual.keys():
+        expected_values = expected.get(key, [0] * 5)
+        actual_values = actual.get(key, [0] * 5)
+        if any(abs(a - b) > tolerance for a, b in zip(expected_values, actual_values)):
+            mismatches.append(key)
+    return sorted(mismatches, key=lambda key: (key[0] or 0, key[1]))
+
+
+# python rollups.py rebuild / python rollups.py verify
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="日ごとの栄養素の合計を作り直す・確認する")
+    parser.add_argument("command", choices=["rebuild", "verify"])
+    args = parser.parse_args()
+
+    with session_scope() as db:
+        if args.command == "rebuild":
+            print(f"{rebuild(db)}日分の合計を作り直しました。")
+        else:
+            mismatches = verify(db)
+            for user_id, day in mismatches:
+                print(f"user_id={user_id} date={day} の合計が一致しません。")
+            print("すべて一致しています。" if not mismatches else f"{len(mismatches)}件が一致しません。")
+            raise SystemExit(1 if mismatches else 0)
@@ -1,94 +1,272 @@
 #scraping.py
-import streamlit as st
-from database import session
-from time import sleep
-from bs4 import BeautifulSoup
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-import selenium.common.exceptions
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, List, NamedTuple, Optional
+import config
+from deadline import Deadline, LookupTimeout
+from metrics import metrics
+from nutrient_cache import nutrient_cache
+from food_table import food_table, to_nutrient_data
+from driver_pool import PoolExhausted, driver_pool
+from http_scraping import EATSMART_INDEX_URL, http_scraper, parse_nutrient_page
+
+# キャッシュに保存するのに必要な栄養素
+NUTRIENT_KEYS = ("エネルギー", "たんぱく質", "脂質", "炭水化物")
+
+# 栄養素名とFoodRecordの列名の対応
+NUTRIENT_FIELDS = dict(zip(NUTRIENT_KEYS, ("energy", "protein", "fat", "carbohydrate")))
+
+# 調べた結果の失敗の理由
+LOOKUP_NOT_FOUND = "not_found"      # 検索しても料理が見つからなかった
+LOOKUP_INCOMPLETE = "incomplete"    # ページはあったが、栄養素の値がそろわなかった
+LOOKUP_TIMEOUT = "timeout"          # 時間内に終わらなかった
+LOOKUP_ERROR = "error"              # 通信エラーなど
+
+# 同じ方法でやり直せば成功するかもしれない失敗
+RETRYABLE_ERRORS = (LOOKUP_TIMEOUT, LOOKUP_ERROR)
+
+# ブラウザでページの表示を判定する要素
+SEARCH_INPUT_XPATH = "//input[@name='searchKey']"
+SEARCH_BUTTON_XPATH = "//input[@type='image']"
+NUTRIENT_VALUE_XPATH = "//td[contains(@class, 'capa')]"
+
+
+# 栄養素を調べた結果（見つからなかった場合も例外にせず、errorとmessageに理由を入れて返す）
+class NutrientLookup(NamedTuple):
+    recipe_name: str
+    data: Dict[str, str]                   # 「栄養素名: 値」の辞書（見つからなければ空）
+    amounts: Optional[Dict[str, float]]    # 1人分の数値（値がそろわなければNone）
+    source: str                            # cache・food_table・http・selenium
+    error: Optional[str] = None
+    message: str = ""
+    seconds: float = 0.0
+
+    @property
+    def found(self) -> bool:
+        return self.amounts is not None
+
+    @property
+    def retryable(self) -> bool:
+        return self.error in RETRYABLE_ERRORS
 
-#スクレイピング
-def get_nutrient_values(recipe_name, servings):
-    # Chromeドライバーのパスを設定
-    chromedriver_path = "chromedriver.exe"
 
-    # ChromeドライバーのServiceオブジェクトを作成
-    service = Service(chromedriver_path)
+# 「760kcal」「20.1g」のような文字列から1人分の数値を取り出す
+def parse_nutrient_amounts(data):
+    amounts = {}
+    for key, field in NUTRIENT_FIELDS.items():
+        match = re.search(r"\d+(?:\.\d+)?", data.get(key, "").replace(",", ""))
+        if match is None:
+            raise ValueError(f"{key}の値が取得できませんでした。")
+        amounts[field] = float(match.group())
+    return amounts
 
-    # Chromeドライバーを起動
-    driver = webdriver.Chrome(service=service)
 
-    # Webページにアクセス
-    driver.get("https://www.eatsmart.jp/do/caloriecheck/index")
+# 取得したページの値から結果を作る（値がそろっていなければ失敗の結果）
+def _lookup_result(recipe_name, data, source, start) -> NutrientLookup:
+    seconds = time.perf_counter() - start
+    if not data:
+        return NutrientLookup(recipe_name, {}, None, source, LOOKUP_NOT_FOUND,
+                              f"{recipe_name}が見つかりませんでした。", seconds)
+    try:
+        amounts = parse_nutrient_amounts(data)
+    except ValueError as error:
+        return NutrientLookup(recipe_name, data, None, source, LOOKUP_INCOMPLETE, str(error), seconds)
+    return NutrientLookup(recipe_name, data, amounts, source, seconds=seconds)
+
+
+def _failed_result(recipe_name, source, error, message, start) -> NutrientLookup:
+    return NutrientLookup(recipe_name, {}, None, source, error, message, time.perf_counter() - start)
+
+
+# XPathの文字列リテラル（料理名に引用符が含まれていても壊れないようにする）
+def _xpath_literal(text: str) -> str:
+    if "'" not in text:
+        return f"'{text}'"
+    if '"' not in text:
+        return f'"{text}"'
+    return "concat(" + ", \"'\", ".join(f"'{part}'" for part in text.split("'")) + ")"
 
-    # レシピ名の入力
-    recipe_name_input = driver.find_element(By.XPATH, "//input[@name='searchKey']")
-    recipe_name_input.send_keys(recipe_name)
 
-    # 検索
-    search_button = driver.find_element(By.XPATH, "//input[@type='image']")
-    search_button.click()
+#スクレイピング
+# ブラウザで検索する（決まった時間待つのではなく、次のページが表示されたことを確認してから進む）
+def _scrape_with_driver(driver, recipe_name, deadline: Deadline, index_url: str = EATSMART_INDEX_URL):
+    # seleniumはChromeを使うときだけ読み込む
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.common.exceptions import TimeoutException
+
+    def wait_until(condition):
+        return WebDriverWait(driver, deadline.timeout(), poll_frequency=config.SCRAPING_POLL_SECONDS).until(condition)
+
+    def document_ready(driver):
+        return driver.execute_script("return document.readyState") == "complete"
 
-    # 検索結果から一番上のリンクをクリック
     try:
-        wait = WebDriverWait(driver, 1)
-        top_result_link = wait.until(EC.element_to_be_clickable((By.XPATH, f"//a[contains(text(),'{recipe_name}')]")))
-        top_result_link.click()
-    except selenium.common.exceptions.TimeoutException:
-        st.write("要素が見つかりませんでした。")
-
-    sleep(1)
-
-    # BeautifulSoupオブジェクトを作成
-    soup = BeautifulSoup(driver.page_source, "html.parser")
-
-    # エネルギー、タンパク質、脂質、炭水化物の値を取得
-    nutrients = soup.select("td.item > a")
-    values = soup.select("td.capa")
-
-    data = {}
-    for nutrient, value in zip(nutrients, values):
-        nutrient_name = nutrient.text.strip()
-        nutrient_value = value.text.strip()
-        data[nutrient_name] = nutrient_value
-
-    # エネルギー、タンパク質、脂質、炭水化物の値を取り出す
-    energy = data.get("エネルギー", "")
-    energy = energy.replace("kcal", "")
-    protein = data.get("たんぱく質", "")
-    fat = data.get("脂質", "")
-    carbohydrate = data.get("炭水化物", "")
-    
-    # 1人分の栄養素値を計算
-    energy_per_serving = float(energy)
-    protein_per_serving = float(protein.replace("g", ""))
-    fat_per_serving = float(fat.replace("g", ""))
-    carbohydrate_per_serving = float(carbohydrate.replace("g", ""))
-
-    # 合計の栄養素値を計算
-    total_energy = energy_per_serving * servings
-    total_protein = protein_per_serving * servings
-    total_fat = fat_per_serving * servings
-    total_carbohydrate = carbohydrate_per_serving * servings
-
-    session.rollback()
-
-    # Streamlitで値を表示
-    st.write("1人分の栄養素量:")
-    st.write("エネルギー:", energy)
-    st.write("タンパク質:", protein)
-    st.write("脂質:", fat)
-    st.write("炭水化物:", carbohydrate)
-    st.write("-----")
-    st.write("食べた分の栄養素量:")
-    st.write("総エネルギー:", round(total_energy, 1))
-    st.write("総タンパク質:", round(total_protein, 1))
-    st.write("総脂質:", round(total_fat, 1))
-    st.write("総炭水化物:", round(total_carbohydrate, 1))
-
-    session.remove()
-    driver.quit()
-    return data
\ No newline at end of file
+        # Webページにアクセス（読み込みも残り時間以内）
+        driver.set_page_load_timeout(deadline.timeout())
+        with metrics.timer("scrape_browser_page_load"):
+            driver.get(index_url)
+
+        # レシピ名の入力
+        recipe_name_input = wait_until(EC.presence_of_element_located((By.XPATH, SEARCH_INPUT_XPATH)))
+        recipe_name_input.send_keys(recipe_name)
+
+        # 検索して、検索結果のページに切り替わるまで待つ
+        driver.find_element(By.XPATH, SEARCH_BUTTON_XPATH).click()
+        wait_until(EC.staleness_of(recipe_name_input))
+        wait_until(document_ready)
+
+        # 検索結果が1件だけの場合は栄養素のページが直接表示される
+        if not driver.find_elements(By.XPATH, NUTRIENT_VALUE_XPATH):
+            # 検索結果から一番上のリンクをクリック（なければ見つからなかった）
+            links = driver.find_elements(By.XPATH, f"//a[contains(text(), {_xpath_literal(recipe_name)})]")
+            if not links:
+                return {}
+            links[0].click()
+            wait_until(EC.staleness_of(links[0]))
+            wait_until(EC.presence_of_element_located((By.XPATH, NUTRIENT_VALUE_XPATH)))
+    except TimeoutException as error:
+        raise LookupTimeout(f"{recipe_name}: 時間内にページが表示されませんでした。") from error
+
+    # ページのHTMLから栄養素の値を取得
+    return parse_nutrient_page(driver.page_source)
+
+
+# HTTP・ブラウザでの検索を、残り時間の中で順番に（遅いときは並行して）試す
+class NutrientScraper:
+    def __init__(self, http=http_scraper, drivers=driver_pool, backend: str = config.SCRAPING_BACKEND,
+                 max_attempts: int = config.SCRAPING_MAX_ATTEMPTS,
+                 hedge_after_seconds: float = config.SCRAPING_HEDGE_AFTER_SECONDS,
+                 max_parallel: int = config.SCRAPING_MAX_PARALLEL):
+        self.http = http
+        self.drivers = drivers
+        self.backend = backend
+        self.max_attempts = max_attempts
+        self.hedge_after_seconds = hedge_after_seconds
+        self.max_parallel = max_parallel
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_parallel, thread_name_prefix="scrape")
+            return self._executor
+
+    # 試す方法の順番（"auto"はHTTPで取れなければブラウザ）。再試行とヘッジでは最後の方法を繰り返す
+    # max_attemptsが0以下の場合は何も試さない
+    def attempt_plan(self) -> List[str]:
+        if self.max_attempts < 1:
+            return []
+        backends = {"http": ["http"], "selenium": ["selenium"]}.get(self.backend, ["http", "selenium"])
+        return backends + backends[-1:] * max(0, self.max_attempts - 1)
+
+    # 1回分の検索（例外は失敗の結果にする）
+    def attempt(self, backend: str, recipe_name: str, deadline: Deadline) -> NutrientLookup:
+        start = time.perf_counter()
+        try:
+            if backend == "http":
+                with metrics.timer("scrape_http"):
+                    data = self.http.fetch_nutrient_values(recipe_name, deadline)
+            else:
+                # 起動済みのブラウザをプールから借りる（プールの空き待ちも含めて計る）
+                checkout_timeout = deadline.timeout(self.drivers.checkout_timeout)
+                with metrics.timer("scrape_browser"), self.drivers.driver(checkout_timeout) as driver:
+                    data = _scrape_with_driver(driver, recipe_name, deadline, self.http.index_url)
+        except (LookupTimeout, PoolExhausted) as error:
+            result = _failed_result(recipe_name, backend, LOOKUP_TIMEOUT, str(error), start)
+        except Exception as error:
+            result = _failed_result(recipe_name, backend, LOOKUP_ERROR, f"{type(error).__name__}: {error}", start)
+        else:
+            result = _lookup_result(recipe_name, data, backend, start)
+        if not result.found:
+            metrics.inc("foodrecorder_scrape_failures_total", backend=backend, reason=result.error)
+        return result
+
+    # 最初に成功した結果を返す。試している検索がhedge_after_seconds秒で終わらなければ、次の方法を並行して始める
+    # 失敗した場合はすぐ次を試し、すべて失敗したか時間切れなら、失敗の結果を返す
+    def scrape(self, recipe_name: str, deadline: Deadline) -> NutrientLookup:
+        start = time.perf_counter()
+        plan = self.attempt_plan()
+        # 試す方法がない・始める前に時間切れの場合は、何もせずに時間切れ（再試行できる失敗）として返す
+        if not plan or deadline.expired():
+            return _failed_result(recipe_name, self.backend, LOOKUP_TIMEOUT,
+                                  f"{recipe_name}: 栄養素を取得する時間・試行回数が残っていません。", start)
+        executor = self._get_executor()
+        running = {}
+        failures = []
+
+        def launch():
+            backend = plan.pop(0)
+            running[executor.submit(self.attempt, backend, recipe_name, deadline)] = backend
+
+        launch()
+        while running:
+            timeout = deadline.remaining()
+            if plan and self.hedge_after_seconds > 0:
+                timeout = min(timeout, self.hedge_after_seconds)
+            done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                if deadline.expired():
+                    break
+                metrics.inc("foodrecorder_scrape_hedges_total")
+                launch()
+                continue
+
+            for future in done:
+                backend = running.pop(future)
+                result = future.result()
+                if result.found:
+                    return result._replace(seconds=time.perf_counter() - start)
+                failures.append(result)
+                # 見つからなかった場合などは、同じ方法でやり直しても結果は変わらない
+                if not result.retryable:
+                    plan[:] = [planned for planned in plan if planned != backend]
+            if plan and not running:
+                launch()
+
+        if running or not failures:
+            return _failed_result(recipe_name, self.backend, LOOKUP_TIMEOUT,
+                                  f"{recipe_name}: {deadline.seconds}秒以内に栄養素が取得できませんでした。", start)
+        # 値が一部でも取れた結果、見つからなかった結果、時間切れ・エラーの順に、理由として返す
+        order = (LOOKUP_INCOMPLETE, LOOKUP_NOT_FOUND, LOOKUP_TIMEOUT, LOOKUP_ERROR)
+        failure = min(failures, key=lambda failure: order.index(failure.error))
+        return failure._replace(seconds=time.perf_counter() - start)
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+
+nutrient_scraper = NutrientScraper()
+
+
+# 1人分の栄養素値を調べる（キャッシュ、手元の食品成分表の順に探し、なければbudget_seconds秒以内でスクレイピング）
+def lookup_nutrients(recipe_name, budget_seconds: float = config.SCRAPING_BUDGET_SECONDS) -> NutrientLookup:
+    start = time.perf_counter()
+    data = nutrient_cache.get(recipe_name)
+    if data is not None:
+        metrics.inc("foodrecorder_nutrient_lookups_total", source="cache")
+        return _lookup_result(recipe_name, data, "cache", start)
+    return lookup_uncached_nutrients(recipe_name, budget_seconds, start)
+
+
+# キャッシュを見ずに、手元の食品成分表、スクレイピングの順に調べる（キャッシュを確認済みの呼び出し元用）
+def lookup_uncached_nutrients(recipe_name, budget_seconds: float = config.SCRAPING_BUDGET_SECONDS,
+                              start: float = None) -> NutrientLookup:
+    start = time.perf_counter() if start is None else start
+    entry = food_table.best_match(recipe_name)
+    if entry is not None:
+        metrics.inc("foodrecorder_nutrient_lookups_total", source="food_table")
+        return _lookup_result(recipe_name, to_nutrient_data(entry), "food_table", start)
+
+    metrics.inc("foodrecorder_nutrient_lookups_total", source="scrape")
+    result = nutrient_scraper.scrape(recipe_name, Deadline(budget_seconds))
+    if result.found:
+        nutrient_cache.put(recipe_name, result.data)
+    return result
@@ -0,0 +1,50 @@
+#sqlite_profile.py
+from sqlalchemy import event
+import config
+
+
+# プロファイルごとに、接続するたびに実行するPRAGMA
+def profile_pragmas(profile: str = config.SQLITE_PROFILE):
+    if profile == "default":
+        return {}
+    if profile != "tuned":
+        raise ValueError(f"Unknown SQLite profile: {profile}")
+    return {
+        # 書き込み中でも読み込みをブロックしない
+        "journal_mode": "WAL",
+        # WALではNORMALでもデータベースが壊れることはない（電源断で直前のコミットが失われることはある）
+        "synchronous": "NORMAL",
+        # 負の値はKiB単位
+        "cache_size": -config.SQLITE_CACHE_SIZE_KB,
+        "mmap_size": config.SQLITE_MMAP_SIZE,
+        # 別のプロセスが書き込み中ならすぐに失敗せず待つ
+        "busy_timeout": config.SQLITE_BUSY_TIMEOUT_MS,
+        "temp_store": "MEMORY",
+    }
+
+
+# エンジンが新しい接続を作るたびにPRAGMAを設定する（SQLite以外のエンジンには何もしない）
+def apply_sqlite_profile(engine, profile: str = config.SQLITE_PROFILE):
+    # 非同期エンジンの場合は、内部の同期エンジンにイベントを登録する
+    sync_engine = getattr(engine, "sync_engine", engine)
+    if sync_engine.dialect.name != "sqlite":
+        return engine
+    pragmas = profile_pragmas(profile)
+    if not pragmas:
+        return engine
+
+    @event.listens_for(sync_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+    return engine
+
+
+# 接続に実際に設定されている値を返す（確認用）
+def current_pragmas(connection):
+    return {name: connection.exec_driver_sql(f"PRAGMA {name}").scalar() for name in profile_pragmas("tuned")}
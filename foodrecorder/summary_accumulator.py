@@ -0,0 +1,124 @@
+#summary_accumulator.py
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import Dict, Tuple
+import config, models
+from database import session_scope
+
+
+# ユーザーごと・日付ごとの栄養素の合計をメモリ上に持ち、コミットされた差分だけを足していく
+# 合計の表示はこの辞書を1回引くだけで済み、食事を追加した直後もその1件分を足した値がすぐに読める
+class DailySummaryAccumulator:
+    def __init__(self, ttl_seconds: int = config.SUMMARY_CACHE_TTL_SECONDS,
+                 max_entries: int = config.SUMMARY_CACHE_MAX_ENTRIES, session_factory=session_scope):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # 読み込みに使うセッション（with文で使えるもの。ベンチマークでは一時ファイルのデータベースを使う）
+        self.session_factory = session_factory
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # (user_id, date) -> ([件数, エネルギー, たんぱく質, 脂質, 炭水化物], 読み込んだ時刻)
+        self._totals = OrderedDict()
+        # 書き込み中（コミットもロールバックもまだ）のキーと、そのキーに書き込んでいるセッションの数
+        self._in_flight: Dict[Tuple[int, date], int] = {}
+        # 書き込みが終わるたびに進む番号と、読み込み中に書き込みが終わったキーの番号
+        # （読み込みを始めた後に書き込みが終わったキーは、読んだ値にその差分が含まれているか分からないので保存しない）
+        self._sequence = 0
+        self._ended: Dict[Tuple[int, date], int] = {}
+        self._cleared = 0
+        self._loading = 0
+        models.daily_total_listeners.add(self)
+
+    # このキーへの書き込みが始まった（コミットが終わるまで、読んだ値は保存しない）
+    def begin(self, keys):
+        with self._lock:
+            for key in keys:
+                self._in_flight[key] = self._in_flight.get(key, 0) + 1
+
+    # 書き込みが終わった（コミットされた差分を足す。読み込んでいないキーは、次に読むときにデータベースの値に含まれている）
+    def end(self, keys, deltas: Dict[Tuple[int, date], list]):
+        with self._lock:
+            self._sequence += 1
+            for key, delta in deltas.items():
+                cached = self._totals.get(key)
+                if cached is not None:
+                    cached[0][:] = [total + change for total, change in zip(cached[0], delta)]
+            for key in keys:
+                count = self._in_flight.get(key, 0) - 1
+                if count > 0:
+                    self._in_flight[key] = count
+                else:
+                    self._in_flight.pop(key, None)
+                if self._loading:
+                    self._ended[key] = self._sequence
+
+    # 差分を受け取るのをやめる
+    def close(self):
+        models.daily_total_listeners.discard(self)
+
+    def _load(self, key: Tuple[int, date]) -> list:
+        user_id, day = key
+        with self.session_factory() as db:
+            row = db.get(models.DailyNutrientTotal, (user_id, day))
+            if row is None:
+                return [0] * (1 + len(models.NUTRIENT_COLUMNS))
+            return [row.record_count] + [getattr(row, column) for column in models.NUTRIENT_COLUMNS]
+
+    def _finish_load(self):
+        self._loading -= 1
+        if not self._loading:
+            self._ended.clear()
+
+    # (件数, エネルギー, たんぱく質, 脂質, 炭水化物) を返す
+    def get(self, user_id: int, day: date) -> list:
+        key = (user_id, day)
+        now = time.monotonic()
+        with self._lock:
+            cached = self._totals.get(key)
+            if cached is not None and now - cached[1] <= self.ttl_seconds:
+                self._totals.move_to_end(key)
+                self.hits += 1
+                return list(cached[0])
+            self._totals.pop(key, None)
+            self.misses += 1
+            started = self._sequence
+            self._loading += 1
+
+        try:
+            totals = self._load(key)
+        except Exception:
+            with self._lock:
+                self._finish_load()
+            raise
+        with self._lock:
+            # 書き込み中のキーと、読み込み中に書き込みが終わったキーは、次に読むときに読み直す
+            # （コミットがデータベースに見えてから差分が足されるまでの間に読んだ値を保存すると、同じ差分を2回足してしまう）
+            if (key not in self._in_flight and self._ended.get(key, 0) <= started
+                    and self._cleared <= started and key not in self._totals):
+                self._totals[key] = (list(totals), now)
+                while len(self._totals) > self.max_entries:
+                    self._totals.popitem(last=False)
+            self._finish_load()
+        return totals
+
+    def summary(self, user_id: int, day: date) -> models.NutrientSummary:
+        _, energy, protein, fat, carbohydrate = self.get(user_id, day)
+        return models.NutrientSummary(
+            total_energy=energy, total_protein=protein, total_fat=fat, total_carbohydrate=carbohydrate
+        )
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._totals), "hits": self.hits, "misses": self.misses}
+
+    def clear(self):
+        with self._lock:
+            self._totals.clear()
+            self._sequence += 1
+            self._cleared = self._sequence
+
+
+summary_accumulator = DailySummaryAccumulator()
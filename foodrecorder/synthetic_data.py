@@ -0,0 +1,146 @@
+#synthetic_data.py
+import argparse
+import random
+from datetime import date, timedelta
+from typing import Dict, Iterator, List
+from sqlalchemy import func, select
+import models
+from food_table import FoodEntry
+
+# 食事の区分ごとのよく食べられる料理と1人分の栄養素値（日本食品標準成分表などを参考にしたおおよその値）
+# 先頭ほどよく食べられる（人気の順）
+MENU = {
+    "breakfast": [
+        FoodEntry("トースト", "とーすと", 248, 8.9, 4.4, 46.7),
+        FoodEntry("納豆ご飯", "なっとうごはん", 352, 12.0, 5.4, 62.3),
+        FoodEntry("目玉焼き", "めだまやき", 106, 7.4, 7.9, 0.2),
+        FoodEntry("ヨーグルト", "よーぐると", 62, 3.6, 3.0, 4.9),
+        FoodEntry("味噌汁", "みそしる", 40, 2.6, 1.2, 4.5),
+        FoodEntry("バナナ", "ばなな", 86, 1.1, 0.2, 22.5),
+        FoodEntry("シリアル", "しりある", 190, 3.9, 1.1, 42.0),
+    ],
+    "lunch": [
+        FoodEntry("カレーライス", "かれーらいす", 760, 20.1, 22.4, 112.3),
+        FoodEntry("ラーメン", "らーめん", 480, 20.5, 12.0, 70.0),
+        FoodEntry("親子丼", "おやこどん", 640, 27.0, 14.6, 95.5),
+        FoodEntry("ざるそば", "ざるそば", 330, 14.2, 2.5, 63.0),
+        FoodEntry("サンドイッチ", "さんどいっち", 370, 13.5, 18.0, 37.8),
+        FoodEntry("オムライス", "おむらいす", 700, 22.4, 26.0, 90.1),
+        FoodEntry("牛丼", "ぎゅうどん", 730, 22.8, 24.6, 101.2),
+        FoodEntry("スパゲッティミートソース", "すぱげってぃみーとそーす", 600, 22.0, 18.0, 85.0),
+    ],
+    "dinner": [
+        FoodEntry("ご飯", "ごはん", 252, 3.8, 0.5, 55.7),
+        FoodEntry("鶏の唐揚げ", "とりのからあげ", 350, 21.5, 22.0, 14.5),
+        FoodEntry("焼き鮭", "やきさけ", 150, 22.0, 6.0, 0.1),
+        FoodEntry("肉じゃが", "にくじゃが", 290, 11.0, 11.5, 35.0),
+        FoodEntry("ハンバーグ", "はんばーぐ", 420, 21.0, 28.0, 18.5),
+        FoodEntry("麻婆豆腐", "まーぼーどうふ", 280, 16.0, 18.5, 10.5),
+        FoodEntry("豚の生姜焼き", "ぶたのしょうがやき", 330, 19.5, 22.0, 10.0),
+        FoodEntry("野菜サラダ", "やさいさらだ", 60, 1.5, 3.5, 6.0),
+        FoodEntry("餃子", "ぎょうざ", 270, 10.5, 14.0, 25.0),
+    ],
+    "snack": [
+        FoodEntry("おにぎり", "おにぎり", 180, 3.0, 0.5, 39.5),
+        FoodEntry("チョコレート", "ちょこれーと", 280, 3.5, 17.0, 28.0),
+        FoodEntry("ポテトチップス", "ぽてとちっぷす", 336, 3.1, 21.2, 32.7),
+        FoodEntry("プロテインバー", "ぷろていんばー", 200, 15.0, 8.0, 18.0),
+        FoodEntry("りんご", "りんご", 110, 0.2, 0.4, 29.0),
+    ],
+}
+
+# 1日の食事の区分（食事の回数が多いほど後ろの区分まで記録する）
+MEALS = ("breakfast", "lunch", "dinner", "snack")
+
+# 食べた量（人前）とその割合
+SERVINGS = (0.5, 1.0, 1.5, 2.0)
+SERVING_WEIGHTS = (0.1, 0.7, 0.12, 0.08)
+
+
+# 人気の順に選ばれやすくする（順位の逆数の重み、Zipf分布）
+def _popularity_weights(entries: List[FoodEntry]) -> List[float]:
+    return [1 / rank for rank in range(1, len(entries) + 1)]
+
+
+MENU_WEIGHTS = {meal: _popularity_weights(entries) for meal, entries in MENU.items()}
+
+
+# ユーザーごと・日ごとに食事記録の行を作る
+# ユーザーごとに記録をつける熱心さ（記録する日の割合）が違い、1日の食事の回数はmeals_per_dayの前後でばらつく
+def iter_food_record_rows(user_ids: List[int], days: int, meals_per_day: int, start_date: date,
+                          rng: random.Random) -> Iterator[Dict]:
+    for user_id in user_ids:
+        diligence = rng.betavariate(5, 1.5)
+        appetite = rng.lognormvariate(0, 0.15)
+        for offset in range(days):
+            if rng.random() > diligence:
+                continue
+            day = start_date + timedelta(days=offset)
+            meal_count = max(1, round(rng.gauss(meals_per_day, 0.8)))
+            for index in range(meal_count):
+                meal = MEALS[min(index, len(MEALS) - 1)]
+                entry = rng.choices(MENU[meal], weights=MENU_WEIGHTS[meal])[0]
+                servings = rng.choices(SERVINGS, weights=SERVING_WEIGHTS)[0]
+                # 同じ料理でも量や作り方で栄養素値は少しずつ違う
+                scale = servings * appetite * rng.lognormvariate(0, 0.1)
+                yield {
+                    "user_id": user_id, "date": day, "recipe_name": entry.name, "servings": servings,
+                    "energy": round(entry.energy * scale, 1), "protein": round(entry.protein * scale, 1),
+                    "fat": round(entry.fat * scale, 1), "carbohydrate": round(entry.carbohydrate * scale, 1),
+                    "status": models.STATUS_COMPLETE,
+                }
+
+
+# users人のユーザーと、days日分（最後の日が今日）の食事記録と日ごとの合計を挿入し、件数を返す（コミットは呼び出し側）
+def populate(connection, users: int, days: int, meals_per_day: int = 3, seed: int = 0,
+             username_prefix: str = "user", start_date: date = None, chunk_size: int = 50_000) -> Dict[str, int]:
+    rng = random.Random(seed)
+    start_date = start_date or date.today() - timedelta(days=days - 1)
+    first_id = (connection.execute(select(func.max(models.User.id))).scalar() or 0) + 1
+    user_ids = list(range(first_id, first_id + users))
+    connection.execute(
+        models.User.__table__.insert(),
+        [{"id": user_id, "username": f"{username_prefix}{user_id}"} for user_id in user_ids],
+    )
+
+    food_records = 0
+    chunk = []
+
+    def flush():
+        connection.execute(models.FoodRecord.__table__.insert(), chunk)
+        # まとめて挿入した分はORMのイベントが呼ばれないので、日ごとの合計をここで更新する
+        deltas = {}
+        for row in chunk:
+            models.merge_delta(deltas, (row["user_id"], row["date"]), models.food_record_delta(row))
+        models.add_to_daily_totals(connection, deltas)
+        chunk.clear()
+
+    for row in iter_food_record_rows(user_ids, days, meals_per_day, start_date, rng):
+        chunk.append(row)
+        food_records += 1
+        if len(chunk) >= chunk_size:
+            flush()
+    if chunk:
+        flush()
+    return {"users": users, "days": days, "meals_per_day": meals_per_day, "food_records": food_records,
+            "first_user_id": first_id, "start_date": start_date.isoformat()}
+
+
+# python synthetic_data.py --users 100 --days 90 --meals 3 のように実行し、food_record.dbにテスト用のデータを追加する
+if __name__ == "__main__":
+    import json
+    import migrations
+    from database import engine
+
+    parser = argparse.ArgumentParser(description="FoodRecorderのテスト用データの作成")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--meals", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--prefix", default="user", help="ユーザー名の先頭（ユーザー名は<prefix><id>）")
+    args = parser.parse_args()
+
+    migrations.init_db(engine)
+    with engine.begin() as connection:
+        result = populate(connection, args.users, args.days, args.meals, args.seed, args.prefix)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
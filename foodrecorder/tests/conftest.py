@@ -0,0 +1,30 @@
+#tests/conftest.py
+import os
+import sys
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+# アプリのモジュールは foodrecorder フォルダから import crud のように読み込む
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+# 一時ファイルのSQLiteにテーブルを作り、そのデータベースのセッションを作る関数を返す
+# （SAVEPOINTを使えるように、BEGINはSQLAlchemyから発行する）
+@pytest.fixture
+def session_factory(tmp_path):
+    from database import Base
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+
+    @event.listens_for(engine, "connect")
+    def _connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def _begin(connection):
+        connection.exec_driver_sql("BEGIN")
+
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    engine.dispose()
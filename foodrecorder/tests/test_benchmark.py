@@ -0,0 +1,27 @@
+#tests/test_benchmark.py
+from benchmark import _median_result, compare_results
+
+
+def test_median_result():
+    runs = [
+        {"rows": 100, "read": {"p50_milliseconds": 2.0}, "within_budget": True, "backend": "sqlite"},
+        {"rows": 100, "read": {"p50_milliseconds": 9.0}, "within_budget": False, "backend": "sqlite"},
+        {"rows": 100, "read": {"p50_milliseconds": 3.0}, "within_budget": True, "backend": "sqlite"},
+    ]
+    assert _median_result(runs) == {"rows": 100, "read": {"p50_milliseconds": 3.0}, "within_budget": True, "backend": "sqlite"}
+
+
+def test_compare_results_gates_medians():
+    baseline = {"read": {"p50_milliseconds": 10.0, "p99_milliseconds": 20.0, "rows_per_second": 1000}}
+    result = {"read": {"p50_milliseconds": 15.0, "p99_milliseconds": 60.0, "rows_per_second": 500}}
+    comparison = compare_results(baseline, result)
+    assert comparison["regressions"] == ["read.p50_milliseconds", "read.rows_per_second"]
+    assert comparison["changes"]["read.p99_milliseconds"]["gated"] is False
+
+
+# 割合が大きくても、差が1ミリ秒未満なら回帰としない
+def test_compare_results_floor():
+    baseline = {"lookup": {"p50_milliseconds": 0.02, "microseconds_per_call": 5.0}, "aggregate_seconds": 0.0004}
+    result = {"lookup": {"p50_milliseconds": 0.09, "microseconds_per_call": 40.0}, "aggregate_seconds": 0.0009}
+    assert compare_results(baseline, result)["regressions"] == []
+    assert compare_results({"aggregate_seconds": 1.0}, {"aggregate_seconds": 1.5})["regressions"] == ["aggregate_seconds"]
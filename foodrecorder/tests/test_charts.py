@@ -0,0 +1,41 @@
+#tests/test_charts.py
+import threading
+from datetime import date
+import charts
+
+
+# 同じグラフを同時に求められても、描画は1回だけ
+def test_concurrent_misses_render_once():
+    charts._daily_pfc_png.cache_clear()
+    barrier = threading.Barrier(8)
+    results = []
+
+    def render():
+        barrier.wait()
+        results.append(charts.daily_pfc_png(date(2023, 1, 1), 60, 50, 250))
+
+    threads = [threading.Thread(target=render) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    info = charts._daily_pfc_png.cache_info()
+    assert info.misses == 1
+    assert info.hits == 7
+    assert len(set(results)) == 1
+
+
+# 古いものから捨てる
+def test_cache_keeps_recent_charts():
+    rendered = []
+
+    @charts._render_cache(maxsize=2)
+    def render(key):
+        rendered.append(key)
+        return b"png"
+
+    for key in (1, 2, 1, 3, 1, 2):
+        render(key)
+    assert rendered == [1, 2, 3, 2]
+    assert render.cache_info() == charts.CacheInfo(hits=2, misses=4, maxsize=2, currsize=2)
@@ -0,0 +1,207 @@
+#tests/test_daily_totals.py
+import gc
+import threading
+from datetime import date
+import pytest
+import models
+from summary_accumulator import DailySummaryAccumulator
+
+DAY = date(2024, 1, 1)
+
+
+@pytest.fixture
+def user_id(session_factory):
+    with session_factory() as db:
+        user = models.User(username="taro")
+        db.add(user)
+        db.commit()
+        return user.id
+
+
+@pytest.fixture
+def accumulator(session_factory):
+    accumulator = DailySummaryAccumulator(session_factory=session_factory)
+    yield accumulator
+    accumulator.close()
+
+
+def _record(user_id, day=DAY, energy=500.0):
+    return models.FoodRecord(user_id=user_id, date=day, recipe_name="カレーライス", servings=1, energy=energy,
+                             protein=20.0, fat=10.0, carbohydrate=80.0, status=models.STATUS_COMPLETE)
+
+
+# 日ごとの合計の行（なければ0）
+def _table_totals(session_factory, user_id, day=DAY):
+    with session_factory() as db:
+        row = db.get(models.DailyNutrientTotal, (user_id, day))
+        if row is None:
+            return [0] * 5
+        return [row.record_count] + [getattr(row, column) for column in models.NUTRIENT_COLUMNS]
+
+
+# 食事記録を合計し直した値
+def _summed_records(session_factory, user_id, day=DAY):
+    with session_factory() as db:
+        records = db.query(models.FoodRecord).filter_by(user_id=user_id, date=day).all()
+        return [len(records)] + [sum(getattr(record, column) for record in records) for column in models.NUTRIENT_COLUMNS]
+
+
+def _assert_consistent(session_factory, accumulator, user_id, day=DAY):
+    expected = _summed_records(session_factory, user_id, day)
+    assert _table_totals(session_factory, user_id, day) == expected
+    assert accumulator.get(user_id, day) == expected
+
+
+def test_insert_update_delete_apply_signed_deltas(session_factory, accumulator, user_id):
+    assert accumulator.get(user_id, DAY) == [0] * 5
+    with session_factory() as db:
+        record = _record(user_id)
+        db.add_all([record, _record(user_id, energy=300.0)])
+        db.commit()
+        _assert_consistent(session_factory, accumulator, user_id)
+
+        # 変更は変更前の値を引いて変更後の値を足す
+        record.energy = 650.0
+        db.commit()
+        _assert_consistent(session_factory, accumulator, user_id)
+        assert accumulator.get(user_id, DAY)[:2] == [2, 950.0]
+
+        # 日付の変更は、元の日から引いて新しい日に足す
+        accumulator.get(user_id, date(2024, 1, 2))
+        record.date = date(2024, 1, 2)
+        db.commit()
+        _assert_consistent(session_factory, accumulator, user_id)
+        _assert_consistent(session_factory, accumulator, user_id, date(2024, 1, 2))
+
+        db.delete(record)
+        db.commit()
+    _assert_consistent(session_factory, accumulator, user_id)
+    _assert_consistent(session_factory, accumulator, user_id, date(2024, 1, 2))
+    assert accumulator.get(user_id, date(2024, 1, 2)) == [0] * 5
+    assert accumulator.stats()["hits"] > 0
+
+
+def test_rollback_leaves_totals_unchanged(session_factory, accumulator, user_id):
+    with session_factory() as db:
+        db.add(_record(user_id))
+        db.commit()
+    before = accumulator.get(user_id, DAY)
+
+    with session_factory() as db:
+        db.add(_record(user_id))
+        db.flush()
+        db.rollback()
+    assert _table_totals(session_factory, user_id) == before
+    assert accumulator.get(user_id, DAY) == before
+
+    # ロールバックせずに閉じた場合も同じ
+    with session_factory() as db:
+        db.add(_record(user_id))
+        db.flush()
+    assert _table_totals(session_factory, user_id) == before
+    assert accumulator.get(user_id, DAY) == before
+    # 書き込みが終わったので、また読んだ値を保存できる
+    hits = accumulator.stats()["hits"]
+    accumulator.get(user_id, DAY)
+    assert accumulator.stats()["hits"] == hits + 1
+
+
+def test_savepoint_rollback_keeps_outer_deltas(session_factory, accumulator, user_id):
+    accumulator.get(user_id, DAY)
+    with session_factory() as db:
+        db.add(_record(user_id, energy=100.0))
+        savepoint = db.begin_nested()
+        db.add(_record(user_id, energy=200.0))
+        db.flush()
+        savepoint.rollback()
+
+        savepoint = db.begin_nested()
+        db.add(_record(user_id, energy=400.0))
+        db.flush()
+        savepoint.commit()
+        # SAVEPOINTのRELEASEだけでは、まだメモリ上の合計には足さない
+        assert accumulator.get(user_id, DAY) == [0] * 5
+        db.commit()
+
+    _assert_consistent(session_factory, accumulator, user_id)
+    assert accumulator.get(user_id, DAY)[:2] == [2, 500.0]
+
+
+# 差分を足すのを遅らせる（コミットがデータベースに見えてから、差分が足されるまでの間を作る）
+class DelayedAccumulator(DailySummaryAccumulator):
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.committed = threading.Event()
+        self.resume = threading.Event()
+
+    def end(self, keys, deltas):
+        if deltas:
+            self.committed.set()
+            assert self.resume.wait(10)
+        super().end(keys, deltas)
+
+
+def test_read_between_commit_and_apply_is_not_counted_twice(session_factory, user_id):
+    accumulator = DelayedAccumulator(session_factory=session_factory)
+    try:
+        def insert():
+            with session_factory() as db:
+                db.add(_record(user_id))
+                db.commit()
+
+        writer = threading.Thread(target=insert)
+        writer.start()
+        assert accumulator.committed.wait(10)
+        # コミットは見えているが、差分はまだ足されていない
+        assert accumulator.get(user_id, DAY)[:2] == [1, 500.0]
+        accumulator.resume.set()
+        writer.join()
+
+        _assert_consistent(session_factory, accumulator, user_id)
+        assert accumulator.get(user_id, DAY)[:2] == [1, 500.0]
+    finally:
+        accumulator.resume.set()
+        accumulator.close()
+
+
+# 読み込み中に別のスレッドのコミットが終わった場合は、読んだ値を保存しない
+def test_commit_during_load_is_not_cached(session_factory, user_id):
+    loading, loaded = threading.Event(), threading.Event()
+
+    class SlowLoadAccumulator(DailySummaryAccumulator):
+        def _load(self, key):
+            totals = super()._load(key)
+            loading.set()
+            assert loaded.wait(10)
+            return totals
+
+    accumulator = SlowLoadAccumulator(session_factory=session_factory)
+    try:
+        reader = threading.Thread(target=accumulator.get, args=(user_id, DAY))
+        reader.start()
+        assert loading.wait(10)
+        with session_factory() as db:
+            db.add(_record(user_id))
+            db.commit()
+        loaded.set()
+        reader.join()
+        assert accumulator.stats()["entries"] == 0
+    finally:
+        accumulator.close()
+    accumulator = DailySummaryAccumulator(session_factory=session_factory)
+    try:
+        _assert_consistent(session_factory, accumulator, user_id)
+    finally:
+        accumulator.close()
+
+
+def test_closed_or_unused_accumulators_stop_listening(session_factory):
+    accumulator = DailySummaryAccumulator(session_factory=session_factory)
+    assert accumulator in models.daily_total_listeners
+    accumulator.close()
+    assert accumulator not in models.daily_total_listeners
+
+    count = len(models.daily_total_listeners)
+    DailySummaryAccumulator(session_factory=session_factory)
+    gc.collect()
+    assert len(models.daily_total_listeners) == count
@@ -0,0 +1,141 @@
+#tests/test_driver_pool.py
+import threading
+import time
+import pytest
+from driver_pool import DriverPool, PoolExhausted
+
+
+# 応答するかどうかを切り替えられるブラウザの代わり
+class FakeDriver:
+    def __init__(self):
+        self.broken = False
+        self.quit_called = False
+
+    def execute_script(self, script, *args):
+        if self.broken:
+            raise RuntimeError("browser is not responding")
+        return 1
+
+    def quit(self):
+        self.quit_called = True
+
+
+def _pool(**options):
+    created = []
+
+    def factory():
+        created.append(FakeDriver())
+        return created[-1]
+
+    return DriverPool(factory=factory, **options), created
+
+
+def test_reuses_idle_driver():
+    pool, created = _pool(max_size=2, max_uses=10)
+    with pool.driver() as first:
+        pass
+    with pool.driver() as second:
+        pass
+    assert first is second
+    assert len(created) == 1
+    metrics = pool.metrics()
+    assert metrics["created"] == 1
+    assert metrics["checkouts"] == 2
+    assert metrics["size"] == 1
+    assert metrics["idle"] == 1
+    assert metrics["in_use"] == 0
+
+
+# max_uses回使ったブラウザは終了して作り直す
+def test_recycles_after_max_uses():
+    pool, created = _pool(max_size=1, max_uses=2)
+    for _ in range(3):
+        with pool.driver():
+            pass
+    assert len(created) == 2
+    assert created[0].quit_called
+    assert not created[1].quit_called
+    metrics = pool.metrics()
+    assert metrics["recycled"] == 1
+    assert metrics["created"] == 2
+    assert metrics["size"] == 1
+
+
+# 借りるときに応答しないブラウザは捨てて、新しく起動する
+def test_drops_unhealthy_idle_driver():
+    pool, created = _pool(max_size=1, max_uses=10)
+    with pool.driver() as driver:
+        pass
+    driver.broken = True
+    with pool.driver() as replacement:
+        pass
+    assert replacement is not driver
+    assert driver.quit_called
+    metrics = pool.metrics()
+    assert metrics["unhealthy"] == 1
+    assert metrics["size"] == 1
+
+
+# 使っている間に例外が起きて、ブラウザも応答しなくなった場合はプールに戻さない
+def test_drops_driver_broken_during_use():
+    pool, created = _pool(max_size=1, max_uses=10)
+    with pytest.raises(ValueError):
+        with pool.driver() as driver:
+            driver.broken = True
+            raise ValueError("page error")
+    assert driver.quit_called
+    assert pool.metrics()["unhealthy"] == 1
+    assert pool.metrics()["size"] == 0
+
+    # 例外が起きてもブラウザが応答すれば使い回す
+    with pytest.raises(ValueError):
+        with pool.driver() as driver:
+            raise ValueError("page error")
+    assert not driver.quit_called
+    assert pool.metrics()["idle"] == 1
+
+
+def test_checkout_timeout_raises_pool_exhausted():
+    pool, _ = _pool(max_size=1, max_uses=10)
+    worker = pool.checkout()
+    with pytest.raises(PoolExhausted):
+        pool.checkout(timeout=0.05)
+    metrics = pool.metrics()
+    assert metrics["timeouts"] == 1
+    assert metrics["max_waiting"] == 1
+    assert metrics["waiting"] == 0
+    pool.checkin(worker)
+
+
+# 上限まで使われているときは、返されるまで待ってから借りる
+def test_waiting_checkout_gets_returned_driver():
+    pool, created = _pool(max_size=1, max_uses=10)
+    worker = pool.checkout()
+    borrowed = []
+    waiter = threading.Thread(target=lambda: borrowed.append(pool.checkout(timeout=5)))
+    waiter.start()
+    while pool.metrics()["waiting"] == 0:
+        time.sleep(0.001)
+    pool.checkin(worker)
+    waiter.join()
+    assert borrowed == [worker]
+    assert len(created) == 1
+
+
+def test_factory_failure_frees_slot():
+    def factory():
+        raise RuntimeError("chrome did not start")
+
+    pool = DriverPool(factory=factory, max_size=1)
+    with pytest.raises(RuntimeError):
+        pool.checkout()
+    assert pool.metrics()["size"] == 0
+
+
+def test_close_quits_idle_drivers():
+    pool, created = _pool(max_size=2, max_uses=10)
+    with pool.driver():
+        pass
+    pool.close()
+    assert created[0].quit_called
+    assert pool.metrics()["size"] == 0
@@ -0,0 +1,171 @@
+#tests/test_enrichment.py
+import contextlib
+import threading
+import time
+from datetime import date
+import pytest
+import enrichment, models
+from enrichment import EnrichmentQueue
+from scraping import LOOKUP_NOT_FOUND, LOOKUP_TIMEOUT, NutrientLookup
+
+AMOUNTS = {"energy": 500.0, "protein": 20.0, "fat": 10.0, "carbohydrate": 80.0}
+
+
+@pytest.fixture(autouse=True)
+def database(session_factory, monkeypatch):
+    @contextlib.contextmanager
+    def session_scope():
+        with session_factory() as db:
+            yield db
+
+    monkeypatch.setattr(enrichment, "session_scope", session_scope)
+
+
+@pytest.fixture
+def record_id(session_factory):
+    with session_factory() as db:
+        user = models.User(username="taro")
+        db.add(user)
+        db.flush()
+        record = models.FoodRecord(user_id=user.id, date=date(2024, 1, 1), recipe_name="カレーライス", servings=2,
+                                   status=models.STATUS_PENDING)
+        db.add(record)
+        db.commit()
+        return record.id
+
+
+def _record(session_factory, record_id):
+    with session_factory() as db:
+        return db.get(models.FoodRecord, record_id)
+
+
+def _found(recipe_name):
+    return NutrientLookup(recipe_name, {}, AMOUNTS, "http")
+
+
+# 取得し始めたら、呼び出し元が続けてよいと言うまで止まる
+class BlockingLookup:
+    def __init__(self, result=_found):
+        self.result = result
+        self.calls = 0
+        self.started = threading.Event()
+        self.resume = threading.Event()
+
+    def __call__(self, recipe_name):
+        self.calls += 1
+        self.started.set()
+        assert self.resume.wait(10)
+        return self.result(recipe_name)
+
+
+# APIと画面のプロセスがどちらも起動時にresume_pendingを呼んでも、取得するのは1回だけ
+def test_resume_pending_claims_each_record_once(session_factory, record_id):
+    lookup = BlockingLookup()
+    first, second = EnrichmentQueue(lookup=lookup), EnrichmentQueue(lookup=lookup)
+    try:
+        assert first.resume_pending() == [record_id]
+        assert lookup.started.wait(10)
+        assert _record(session_factory, record_id).status == models.STATUS_ENRICHING
+
+        assert second.resume_pending() == []
+        second.submit(record_id)
+        assert second.wait(10)
+        lookup.resume.set()
+        assert first.wait(10)
+    finally:
+        lookup.resume.set()
+        first.shutdown()
+        second.shutdown()
+
+    assert lookup.calls == 1
+    record = _record(session_factory, record_id)
+    assert record.status == models.STATUS_COMPLETE
+    assert (record.energy, record.carbohydrate) == (1000.0, 160.0)
+    assert first.stats()["completed"] == 1
+    assert second.stats()["completed"] == 0
+
+
+# 取得している間に別のプロセスが保存した記録は、後から失敗しても上書きしない
+def test_late_failure_keeps_completed_record(session_factory, record_id):
+    lookup = BlockingLookup(lambda recipe_name: NutrientLookup(recipe_name, {}, None, "http", LOOKUP_NOT_FOUND))
+    queue = EnrichmentQueue(lookup=lookup)
+    try:
+        queue.submit(record_id)
+        assert lookup.started.wait(10)
+        with session_factory() as db:
+            record = db.get(models.FoodRecord, record_id)
+            record.energy = 700.0
+            record.status = models.STATUS_COMPLETE
+            db.commit()
+        lookup.resume.set()
+        assert queue.wait(10)
+    finally:
+        lookup.resume.set()
+        queue.shutdown()
+
+    record = _record(session_factory, record_id)
+    assert (record.status, record.energy) == (models.STATUS_COMPLETE, 700.0)
+    assert queue.stats()["failed"] == 0
+    assert queue.dead_letters == {}
+
+
+# 取得している間に状態が変わった記録には、取得した値を書き込まない
+def test_late_completion_does_not_overwrite(session_factory, record_id):
+    lookup = BlockingLookup()
+    queue = EnrichmentQueue(lookup=lookup)
+    try:
+        queue.submit(record_id)
+        assert lookup.started.wait(10)
+        with session_factory() as db:
+            db.get(models.FoodRecord, record_id).status = models.STATUS_FAILED
+            db.commit()
+        lookup.resume.set()
+        assert queue.wait(10)
+    finally:
+        lookup.resume.set()
+        queue.shutdown()
+
+    record = _record(session_factory, record_id)
+    assert (record.status, record.energy) == (models.STATUS_FAILED, None)
+    assert queue.stats()["completed"] == 0
+
+
+def test_failure_marks_claimed_record_failed(session_factory, record_id):
+    queue = EnrichmentQueue(lookup=lambda recipe_name: NutrientLookup(recipe_name, {}, None, "http", LOOKUP_NOT_FOUND))
+    try:
+        queue.submit(record_id)
+        assert queue.wait(10)
+    finally:
+        queue.shutdown()
+    assert _record(session_factory, record_id).status == models.STATUS_FAILED
+    assert list(queue.dead_letters) == [record_id]
+
+
+# 終了時に取得し終わっていない記録は取得待ちに戻り、次の起動時に取得し直す
+def test_shutdown_releases_unfinished_claims(session_factory, record_id):
+    lookup = BlockingLookup()
+    queue = EnrichmentQueue(lookup=lookup, backoff_seconds=60)
+    lookup.result = lambda recipe_name: NutrientLookup(recipe_name, {}, None, "http", LOOKUP_TIMEOUT)
+    try:
+        queue.submit(record_id)
+        assert lookup.started.wait(10)
+        lookup.resume.set()
+        while not queue.stats()["scheduled_retries"]:
+            time.sleep(0.01)
+        assert _record(session_factory, record_id).status == models.STATUS_ENRICHING
+    finally:
+        queue.shutdown()
+    assert _record(session_factory, record_id).status == models.STATUS_PENDING
+
+    # 取得中のまま止まった記録は、include_enrichingを付けて再開する
+    with session_factory() as db:
+        db.get(models.FoodRecord, record_id).status = models.STATUS_ENRICHING
+        db.commit()
+    queue = EnrichmentQueue(lookup=_found)
+    try:
+        assert queue.resume_pending() == []
+        assert queue.resume_pending(include_enriching=True) == [record_id]
+        assert queue.wait(10)
+    finally:
+        queue.shutdown()
+    assert _record(session_factory, record_id).status == models.STATUS_COMPLETE
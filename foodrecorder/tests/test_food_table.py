@@ -0,0 +1,72 @@
+#tests/test_food_table.py
+import pytest
+from food_table import FoodEntry, FoodTable, normalize_for_search
+
+
+def _entry(name, reading=""):
+    return FoodEntry(name=name, reading=reading, energy=100.0, protein=5.0, fat=3.0, carbohydrate=15.0)
+
+
+@pytest.fixture
+def table():
+    return FoodTable([
+        _entry("パンケーキ", "ぱんけーき"),
+        _entry("カレーうどん", "かれーうどん"),
+        _entry("食パン", "しょくぱん"),
+        _entry("カ"),
+    ])
+
+
+def _names(results):
+    return [(entry.name, score) for entry, score in results]
+
+
+# カタカナはひらがなに、全角・半角や空白・記号はそろえる
+def test_normalize_for_search():
+    assert normalize_for_search("パンケーキ") == "ぱんけーき"
+    assert normalize_for_search("ﾊﾟﾝｹｰｷ") == "ぱんけーき"
+    assert normalize_for_search(" カレー・ライス（大） ") == "かれーらいす大"
+    assert normalize_for_search(None) == ""
+
+
+def test_exact_match_by_name_or_reading(table):
+    assert _names(table.search("パンケーキ", limit=1)) == [("パンケーキ", 1.0)]
+    # 読みがなで登録した漢字の料理名も見つかる
+    assert table.best_match("しょくぱん").name == "食パン"
+    # ひらがなで入力してもカタカナの料理名と一致する
+    assert table.best_match("かれーうどん").name == "カレーうどん"
+
+
+# 前方一致は料理名のうち一致した文字の割合で類似度が決まる
+def test_prefix_match_scored_by_coverage(table):
+    assert _names(table.search("カレーうど")) == [("カレーうどん", 0.8)]
+    assert _names(table.search("カレー")) == [("カレーうどん", 0.514)]
+    assert table.best_match("カレーうど").name == "カレーうどん"
+    assert table.best_match("カレー") is None
+
+
+def test_fuzzy_match(table):
+    assert _names(table.search("パンケキ", limit=1)) == [("パンケーキ", 0.514)]
+    assert _names(table.search("食パン1枚", limit=1)) == [("食パン", 0.6)]
+    assert table.best_match("食パン1枚").name == "食パン"
+    assert table.best_match("食パン1枚", min_score=0.7) is None
+
+
+def test_miss(table):
+    assert table.search("ラーメン") == []
+    assert table.best_match("ラーメン") is None
+    assert table.search("") == []
+
+
+# 短い名前は完全一致だけを探し、前方一致・類似度では探さない
+def test_short_names_only_match_exactly(table):
+    assert table.search("パン") == []
+    assert table.best_match("パン") is None
+    assert _names(table.search("カ")) == [("カ", 1.0)]
+    assert _names(table.search("パン", min_query_length=2)) == [("食パン", 0.6), ("パンケーキ", 0.36)]
+
+
+# 完全一致は前方一致・類似度より必ず上位になる
+def test_exact_match_ranks_first(table):
+    assert _names(table.search("パンケーキ")) == [("パンケーキ", 1.0), ("食パン", 0.3)]
+    assert _names(table.search("しょくぱん")) == [("食パン", 1.0), ("パンケーキ", 0.225)]
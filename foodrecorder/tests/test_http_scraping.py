@@ -0,0 +1,96 @@
+#tests/test_http_scraping.py
+import os
+import pytest
+from deadline import LookupTimeout
+from http_scraping import HttpScraper, find_top_result_url, parse_nutrient_page
+from fixture_site import FIXTURE_DIRECTORY, FixtureSession, FixtureSite
+
+BASE_URL = "https://www.eatsmart.jp/do/caloriecheck/search?searchKey=x"
+INDEX_URL = "https://www.eatsmart.jp/do/caloriecheck/index"
+
+
+def _page(name) -> bytes:
+    with open(os.path.join(FIXTURE_DIRECTORY, name), "rb") as file:
+        return file.read()
+
+
+# 取得したURLを記録するセッション
+class RecordingSession(FixtureSession):
+    def __init__(self, site):
+        super().__init__(site)
+        self.urls = []
+
+    def get(self, url, timeout=None, **kwargs):
+        self.urls.append(url)
+        return super().get(url, timeout=timeout, **kwargs)
+
+
+def _scraper(slow_rate=0.0, timeout=5.0):
+    site = FixtureSite(page_seconds=0.001, slow_rate=slow_rate, slow_seconds=1.0)
+    session = RecordingSession(site)
+    return HttpScraper(index_url=INDEX_URL, session=session, timeout=timeout), session
+
+
+def test_parse_nutrient_page():
+    assert parse_nutrient_page(_page("detail_curry_rice.html")) == {
+        "エネルギー": "760kcal",
+        "たんぱく質": "20.1g",
+        "脂質": "22.4g",
+        "炭水化物": "112.3g",
+        "食塩相当量": "3.3g",
+    }
+
+
+def test_parse_nutrient_page_without_nutrients():
+    assert parse_nutrient_page(_page("search_curry.html")) == {}
+    assert parse_nutrient_page(_page("no_results.html")) == {}
+
+
+def test_find_top_result_url():
+    html = _page("search_curry.html")
+    assert find_top_result_url(html, "カレーうどん", BASE_URL) == "https://www.eatsmart.jp/do/caloriecheck/detail/param/foodCode/2"
+    # 料理名を含む一番上のリンク
+    assert find_top_result_url(html, "カレー", BASE_URL) == "https://www.eatsmart.jp/do/caloriecheck/detail/param/foodCode/1"
+
+
+def test_find_top_result_url_not_found():
+    assert find_top_result_url(_page("search_curry.html"), "親子丼", BASE_URL) is None
+    assert find_top_result_url(_page("no_results.html"), "存在しない料理", BASE_URL) is None
+
+
+def test_fetch_nutrient_values_found():
+    scraper, session = _scraper()
+    data = scraper.fetch_nutrient_values("カレーうどん")
+    assert data["エネルギー"] == "540kcal"
+    assert data["炭水化物"] == "80.6g"
+    assert session.urls[-1] == "https://www.eatsmart.jp/do/caloriecheck/detail/param/foodCode/2"
+
+
+# 検索結果が1件だけなら、検索のページが栄養素のページなので、詳細のページは読まない
+def test_fetch_nutrient_values_single_hit():
+    scraper, session = _scraper()
+    data = scraper.fetch_nutrient_values("親子丼")
+    assert data["エネルギー"] == "640kcal"
+    assert data["たんぱく質"] == "27.0g"
+    assert len(session.urls) == 2
+    assert "/search?" in session.urls[-1]
+
+
+def test_fetch_nutrient_values_not_found():
+    scraper, session = _scraper()
+    assert scraper.fetch_nutrient_values("存在しない料理") == {}
+    assert not any("/detail/" in url for url in session.urls)
+
+
+# 検索フォームは一度だけ読み込む
+def test_search_form_is_reused():
+    scraper, session = _scraper()
+    scraper.fetch_nutrient_values("親子丼")
+    scraper.fetch_nutrient_values("カレーライス")
+    assert sum(url == INDEX_URL for url in session.urls) == 1
+
+
+def test_fetch_nutrient_values_timeout():
+    scraper, _ = _scraper(slow_rate=1.0, timeout=0.05)
+    with pytest.raises(LookupTimeout):
+        scraper.fetch_nutrient_values("カレーライス")
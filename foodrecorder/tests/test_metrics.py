@@ -0,0 +1,28 @@
+#tests/test_metrics.py
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+from metrics import Metrics, MetricsMiddleware
+
+
+# ルーターのprefixを含むルートのパスごとにまとめ、どのルートにも一致しないリクエストはunmatchedにする
+def test_requests_are_labelled_by_route_template():
+    registry = Metrics()
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware, registry=registry)
+    router = APIRouter()
+
+    @router.get("/{username}/food_records/")
+    def get_food_records(username: str):
+        return []
+
+    app.include_router(router, prefix="/users")
+    with TestClient(app) as client:
+        client.get("/users/taro/food_records/")
+        client.get("/users/hanako/food_records/")
+        client.get("/missing")
+
+    counters = {counter["labels"]: counter["value"] for counter in registry.snapshot()["counters"]}
+    assert counters == {
+        '{method="GET",route="/users/{username}/food_records/",status="200"}': 2,
+        '{method="GET",route="unmatched",status="404"}': 1,
+    }
@@ -0,0 +1,90 @@
+#tests/test_nutrient_cache.py
+import contextlib
+from datetime import date
+import pytest
+from sqlalchemy import event
+import models, nutrient_cache
+from nutrient_cache import NutrientCache
+
+DATA = {"エネルギー": "500kcal", "たんぱく質": "20g", "脂質": "10g", "炭水化物": "80g"}
+
+
+# キャッシュがテスト用のデータベースを使うようにして、実行されたSQLを記録する
+@pytest.fixture
+def statements(session_factory, monkeypatch):
+    @contextlib.contextmanager
+    def session_scope():
+        with session_factory() as db:
+            yield db
+
+    monkeypatch.setattr(nutrient_cache, "session_scope", session_scope)
+    executed = []
+
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        executed.append((statement, executemany))
+
+    engine = session_factory.kw["bind"]
+    event.listen(engine, "before_cursor_execute", _record)
+    yield executed
+    event.remove(engine, "before_cursor_execute", _record)
+
+
+def _row_count(session_factory):
+    with session_factory() as db:
+        return db.query(models.NutrientCacheEntry).count()
+
+
+# キャッシュが実行したCOUNTの回数
+def _counts(executed):
+    return sum(statement.startswith("SELECT count(nutrient_cache") for statement, _ in executed)
+
+
+def test_put_counts_rows_only_when_over_limit(session_factory, statements):
+    cache = NutrientCache(max_entries=10)
+    for index in range(10):
+        cache.put(f"料理{index}", DATA)
+    # 最初の1回だけ数え、その後はメモリ上で数える
+    assert _counts(statements) == 1
+    assert _row_count(session_factory) == 10
+
+    # 上限を超えたら古いものから上限の9割まで削除する
+    cache.put("料理10", DATA)
+    assert _counts(statements) == 2
+    assert _row_count(session_factory) == 9
+    assert cache.get("料理0") is None
+    assert cache.get("料理10") == DATA
+
+    # 同じ料理の上書きは件数を増やさない
+    cache.put("料理10", DATA)
+    cache.put("料理11", DATA)
+    assert _counts(statements) == 2
+    assert _row_count(session_factory) == 10
+
+
+def test_warm_inserts_new_dishes_in_one_statement(session_factory, statements):
+    with session_factory() as db:
+        user = models.User(username="taro")
+        db.add(user)
+        db.flush()
+        for index, name in enumerate(["カレーライス", "ｶﾚｰﾗｲｽ", "うどん", "そば", "ラーメン"]):
+            db.add(models.FoodRecord(user_id=user.id, date=date(2024, 1, 1), recipe_name=name, servings=2,
+                                     energy=1000.0 + index, protein=40.0, fat=20.0, carbohydrate=160.0))
+        db.commit()
+
+    cache = NutrientCache(max_entries=3)
+    cache.put("うどん", DATA)
+    statements.clear()
+    # 新しい記録から、キャッシュにない料理を上限まで（ラーメン・そば）
+    assert cache.warm_from_food_records() == 2
+    inserts = [executemany for statement, executemany in statements if statement.startswith("INSERT")]
+    assert inserts == [True]
+    assert cache.get("ラーメン")["エネルギー"] == "502.0kcal"
+    assert cache.get("そば") is not None
+    assert cache.get("カレーライス") is None
+    assert cache.get("うどん") == DATA
+
+    # 件数は数え直さずに、上限を超えたら古いものを削除する
+    statements.clear()
+    cache.put("カレーライス", DATA)
+    assert _counts(statements) == 1
+    assert _row_count(session_factory) == 2
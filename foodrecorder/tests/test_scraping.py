@@ -0,0 +1,45 @@
+#tests/test_scraping.py
+from deadline import Deadline
+from fixture_site import FixtureSession, FixtureSite
+from http_scraping import HttpScraper
+from scraping import LOOKUP_NOT_FOUND, LOOKUP_TIMEOUT, NutrientScraper
+
+
+def _scraper(**options):
+    site = FixtureSite(page_seconds=0.001)
+    return NutrientScraper(HttpScraper(session=FixtureSession(site)), drivers=None, backend="http", **options)
+
+
+def test_scrape_found():
+    scraper = _scraper()
+    result = scraper.scrape("親子丼", Deadline(5))
+    scraper.shutdown()
+    assert result.found
+    assert result.amounts["energy"] == 640
+
+
+def test_scrape_not_found_is_not_retryable():
+    scraper = _scraper(max_attempts=3)
+    result = scraper.scrape("存在しない料理", Deadline(5))
+    scraper.shutdown()
+    assert result.error == LOOKUP_NOT_FOUND
+    assert not result.retryable
+
+
+# 試す回数が0の場合は何もせず、再試行できる時間切れとして返す
+def test_scrape_without_attempts():
+    scraper = _scraper(max_attempts=0)
+    assert scraper.attempt_plan() == []
+    result = scraper.scrape("親子丼", Deadline(5))
+    assert not result.found
+    assert result.error == LOOKUP_TIMEOUT
+    assert result.retryable
+
+
+def test_scrape_with_expired_deadline():
+    scraper = _scraper()
+    result = scraper.scrape("親子丼", Deadline(0))
+    scraper.shutdown()
+    assert not result.found
+    assert result.error == LOOKUP_TIMEOUT
+    assert result.retryable
@@ -0,0 +1,131 @@
+#trends.py
+from datetime import date, timedelta
+from functools import lru_cache
+from typing import List, Optional
+from sqlalchemy import func, select
+import models
+
+PERIODS = ("day", "week", "month")
+
+
+# NumPyが入っていれば移動平均をまとめて計算する（APIの起動を遅くしないよう、初めて使うときに読み込む）
+@lru_cache(maxsize=1)
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+# 期間の始まりの日付（週は月曜日、月は1日）を求めるSQL式
+def period_start_expression(column, period: str, dialect_name: str):
+    if period == "day":
+        return column
+    if dialect_name == "postgresql":
+        return func.date_trunc(period, column).cast(models.DailyNutrientTotal.date.type)
+    if period == "week":
+        return func.date(column, "weekday 0", "-6 days")
+    return func.date(column, "start of month")
+
+
+# Pythonの日付を期間の始まりにそろえる
+def period_start(day: date, period: str) -> date:
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    if period == "month":
+        return day.replace(day=1)
+    return day
+
+
+def next_period_start(day: date, period: str) -> date:
+    if period == "week":
+        return day + timedelta(days=7)
+    if period == "month":
+        return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+    return day + timedelta(days=1)
+
+
+# 期間ごとの合計をSQLのGROUP BYで集計する
+def query_period_totals(db, user_id: int, start: date, end: date, period: str):
+    totals = models.DailyNutrientTotal
+    period_column = period_start_expression(totals.date, period, db.get_bind().dialect.name).label("period_start")
+    statement = (
+        select(
+            period_column,
+            func.sum(totals.record_count),
+            func.sum(totals.energy),
+            func.sum(totals.protein),
+            func.sum(totals.fat),
+            func.sum(totals.carbohydrate),
+        )
+        .where(totals.user_id == user_id, totals.date >= start, totals.date <= end)
+        .group_by(period_column)
+        .order_by(period_column)
+    )
+    return {
+        (date.fromisoformat(key) if isinstance(key, str) else key): values
+        for key, *values in db.execute(statement)
+    }
+
+
+# PFC比率（エネルギーが0のときはNone）
+def pfc_ratios(protein: float, fat: float, carbohydrate: float):
+    protein_energy, fat_energy, carbohydrate_energy = protein * 4, fat * 9, carbohydrate * 4
+    total = protein_energy + fat_energy + carbohydrate_energy
+    if total == 0:
+        return None, None, None
+    return protein_energy / total, fat_energy / total, carbohydrate_energy / total
+
+
+# 直近window期間の移動平均（期間の数がwindowに満たない間は、それまでの平均）
+def rolling_mean(values: List[float], window: int) -> List[float]:
+    if not values:
+        return []
+    np = _numpy()
+    if np is not None:
+        array = np.asarray(values, dtype=float)
+        cumulative = np.concatenate(([0.0], np.cumsum(array)))
+        ends = np.arange(1, len(array) + 1)
+        starts = np.maximum(ends - window, 0)
+        return ((cumulative[ends] - cumulative[starts]) / (ends - starts)).tolist()
+
+    means, running = [], 0.0
+    for index, value in enumerate(values):
+        running += value
+        if index >= window:
+            running -= values[index - window]
+        means.append(running / min(index + 1, window))
+    return means
+
+
+# 期間内のすべての日・週・月について合計とPFC比率を返す（記録のない期間は0）
+def get_nutrient_trend(db, user: models.User, start: date, end: date, period: str = "day",
+                       rolling_window: Optional[int] = 7) -> models.NutrientTrendResponse:
+    totals = query_period_totals(db, user.id, start, end, period)
+
+    period_starts = []
+    current = period_start(start, period)
+    while current <= end:
+        period_starts.append(current)
+        current = next_period_start(current, period)
+
+    rows = [totals.get(day, (0, 0, 0, 0, 0)) for day in period_starts]
+    rolling = rolling_mean([row[1] or 0 for row in rows], rolling_window) if rolling_window else None
+
+    points = []
+    for index, (day, (record_count, energy, protein, fat, carbohydrate)) in enumerate(zip(period_starts, rows)):
+        protein_ratio, fat_ratio, carbohydrate_ratio = pfc_ratios(protein or 0, fat or 0, carbohydrate or 0)
+        points.append(models.NutrientTrendPoint(
+            period_start=day,
+            record_count=record_count or 0,
+            total_energy=energy or 0,
+            total_protein=protein or 0,
+            total_fat=fat or 0,
+            total_carbohydrate=carbohydrate or 0,
+            protein_ratio=protein_ratio,
+            fat_ratio=fat_ratio,
+            carbohydrate_ratio=carbohydrate_ratio,
+            rolling_energy=rolling[index] if rolling else None,
+        ))
+    return models.NutrientTrendResponse(period=period, start=start, end=end, points=points)
@@ -0,0 +1,172 @@
+#ui.py
+from datetime import date
+import streamlit as st
+import charts, config, models
+from cache_generations import USERS, cache_generations
+from database import session_scope
+from metrics import metrics
+from record_store import record_store
+from summary_accumulator import summary_accumulator
+
+
+# "2023-06-08"のような文字列も日付として扱う
+def to_date(value):
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+# 画面の再実行のたびにデータベースを読まないよう、読み込んだ結果をキャッシュする
+# generationはキャッシュのキーに含めるだけの引数で、データが変更されると進み、次の再実行で読み直される
+
+# ユーザー名からuser_idへの対応
+@st.cache_data(ttl=config.UI_CACHE_TTL_SECONDS, show_spinner=False)
+def _load_user_ids(generation):
+    with session_scope() as db:
+        return {username: user_id for user_id, username in db.query(models.User.id, models.User.username).order_by(models.User.id)}
+
+
+def get_user_ids():
+    return _load_user_ids(cache_generations.get(USERS))
+
+
+def get_usernames():
+    return list(get_user_ids())
+
+
+# ユーザーのその日の栄養素の合計を取得する
+# 合計はコミットのたびに差分だけ足されているので、食事を追加した直後でもデータベースを読み直さない
+def get_daily_nutrient_summary(user, date):
+    user_id = get_user_ids().get(user)
+    if user_id is None:
+        return models.NutrientSummary(total_energy=0, total_protein=0, total_fat=0, total_carbohydrate=0)
+    return summary_accumulator.summary(user_id, to_date(date))
+
+
+# 円グラフの表示
+def plot_pfc_ratio(nutrient_summary):
+    sizes = [nutrient_summary.total_protein * 4, nutrient_summary.total_fat * 9, nutrient_summary.total_carbohydrate * 4]
+
+    # 栄養素が取得できていない場合はグラフを描けない
+    if sum(sizes) == 0:
+        st.info("栄養素を取得すると、PFC比率が表示されます。")
+        return
+
+    # 同じPFC比率のグラフは描画済みのPNGを使い回す
+    st.image(charts.summary_pie_png(
+        nutrient_summary.total_protein, nutrient_summary.total_fat, nutrient_summary.total_carbohydrate
+    ))
+
+
+
+
+# 本日の総カロリー量とPFC比のグラフを表示する関数
+def display_summary(user, date):
+    # 本日の栄養素の合計を取得（記録を1件ずつ足し合わせず、日ごとの合計の1行を読む）
+    nutrient_summary = get_daily_nutrient_summary(user, date)
+    total_energy = nutrient_summary.total_energy
+    total_protein = nutrient_summary.total_protein
+    total_fat = nutrient_summary.total_fat
+    total_carbohydrate = nutrient_summary.total_carbohydrate
+
+    st.write("合計の栄養素量:")
+    st.write("総エネルギー:", round(total_energy, 1))
+    st.write("総タンパク質:", round(total_protein, 1))
+    st.write("総脂質:", round(total_fat, 1))
+    st.write("総炭水化物:", round(total_carbohydrate, 1))
+    st.write("-----")
+    st.write(f"{date}のPFC比率:")
+    plot_pfc_ratio(nutrient_summary)
+
+
+# 本日の食事記録を取得する関数
+# ユーザーの記録は一度だけ読み込んで列ごとの配列で持ち、変更があれば新しい記録と取得中だった記録だけを読み足す
+def get_daily_food_records(user, date):
+    user_id = get_user_ids().get(user)
+    if user_id is None:
+        return []
+    return record_store.records(user_id, to_date(date))
+
+
+# 食事記録と合計の栄養素量、PFC比を表示する関数
+def display_daily_summary(user, date):
+    # 選択された日付を表示
+    st.write(f"{date}の食事記録:")
+
+    # 食事記録を取得
+    food_records = get_daily_food_records(user, date)
+
+    if len(food_records) == 0:
+        st.error("記録がありません")
+        return
+
+    # 合計の栄養素量を取得
+    nutrient_summary = get_daily_nutrient_summary(user, date)
+    total_energy = nutrient_summary.total_energy
+    total_protein = nutrient_summary.total_protein
+    total_fat = nutrient_summary.total_fat
+    total_carbohydrate = nutrient_summary.total_carbohydrate
+
+    st.write("合計の栄養素量:")
+    st.write("総エネルギー:", round(total_energy, 1))
+    st.write("総タンパク質:", round(total_protein, 1))
+    st.write("総脂質:", round(total_fat, 1))
+    st.write("総炭水化物:", round(total_carbohydrate, 1))
+    st.write("-----")
+
+    # PFC比率の円グラフを表示（栄養素が取得できていない場合は表示しない）
+    if total_protein + total_fat + total_carbohydrate > 0:
+        plot_daily_pfc_ratio(date, total_protein, total_fat, total_carbohydrate)
+    else:
+        st.info("栄養素を取得すると、PFC比率が表示されます。")
+
+    # 食事記録の一覧表を表示
+    for record in food_records:
+        st.write("食べたもの:", record.recipe_name)
+        st.write("食べた量:", record.servings)
+        if record.status in (models.STATUS_PENDING, models.STATUS_ENRICHING):
+            st.info("栄養素を取得中です。")
+            st.write("-----")
+            continue
+        if record.status == models.STATUS_FAILED:
+            st.warning("栄養素を取得できませんでした。")
+            st.write("-----")
+            continue
+        st.write("エネルギー:", round(record.energy, 1))
+        st.write("タンパク質:", round(record.protein, 1))
+        st.write("脂質:", round(record.fat, 1))
+        st.write("炭水化物:", round(record.carbohydrate, 1))
+        st.write("-----")
+
+
+# 選択された日のPFC比率と理想のPFC比率を並べて表示する関数（描画済みのPNGを使い回す）
+def plot_daily_pfc_ratio(date, total_protein, total_fat, total_carbohydrate):
+    st.image(charts.daily_pfc_png(date, total_protein, total_fat, total_carbohydrate))
+
+
+def display_ideal_pfc_ratio():
+    # 理想のPFC比の円グラフを表示（変わらないので、起動時に1回だけ描画したものを使う）
+    st.image(charts.ideal_pfc_png())
+
+    # 一日の摂取量の目安の表示
+    st.write("一日の摂取量の目安:")
+    st.write("たんぱく質:")
+    st.write("運動習慣あり：自身の体重 (kg) × 2g")
+    st.write("運動習慣なし：自身の体重 (kg) × 1g")
+    st.write("脂質:")
+    st.write("男性（2650kcal）60~90g")
+    st.write("女性（2000kcal）45~70g")
+    st.write("炭水化物:")
+    st.write("男性（2650kcal）330~430g")
+    st.write("女性（2000kcal）250~325g")
+
+
+# 処理ごとの時間とキャッシュの状態を表示するデバッグ用の欄（FOODRECORDER_DEBUG_PANEL=1のときだけ表示）
+def display_debug_panel():
+    with st.sidebar.expander("デバッグ情報"):
+        snapshot = metrics.snapshot()
+        st.write("処理時間（ミリ秒、p50・p95はヒストグラムからの概算）")
+        st.dataframe(snapshot["stages"], hide_index=True)
+        st.write("カウンター")
+        st.dataframe(snapshot["counters"], hide_index=True)
+        st.write("日ごとの合計のキャッシュ:", summary_accumulator.stats())
+        st.write("食事記録のキャッシュ:", record_store.stats())
+        st.write("グラフのキャッシュ:", charts.cache_info())